@@ -43,112 +43,159 @@
 #    safely pass under current rainfall conditions and 2050 projections.
 #
 # 6. Final Model ouptut: A CSV file that summarizes the above model outputs in one table
-
-print('Cornell Culvert Evaluation Model')
-print('--------------------------------\n')
+#
+# Outputs 1-4 are only saved if write_intermediate_files (below) is True; otherwise the results
+# of each step are passed straight to the next in memory (see pipeline.py).
+#
+# 7. Run reports: JSON files with the time, rows and memory of every step, one per county
+#    (next to its model output) and run_report.json for the whole run (see instrumentation.py).
+#    Set the environment variable CULVERT_PROFILE_STAGE to a step name (e.g. calculate_capacity)
+#    to also save a cProfile profile of that step for each county.
 
 #Importing required packages and modules and the function loader which was written
 # in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
-import numpy, os, re, csv, runoff, capacity_prep, capacity, return_periods, time, sys, sorter, loader
+import numpy, os, re, csv, runoff, capacity_prep, capacity, return_periods, time, sys, sorter, loader, pipeline, instrumentation
+import multiprocessing
 
 #add note about making sure that the same culverts are in both sheets?
 
-# 0. LOAD LIST OF COUNTY FILES
-
-# Propmts user to input county file name, and corrects to proper '.csv' format
-data_path = raw_input('Enter path to your data folder, for example: C:\Users\Public\Documents\ALB_TestRun\CulvertStartKit\CulvertEvaluation\ALB\: ')
-check = raw_input('Master file called county_list.csv? Enter Y if correct, else enter correct file name')  # simplifies running a bit
-if (check == "Y" or check == "y"):
-    counties_filename = "county_list.csv"
-else: counties_filename = check
-# counties_filename = raw_input('Enter name of counties csv file in the Data folder: ')  # Removed Oct 2018
-
-counties_filename = data_path + counties_filename
-if counties_filename[len(counties_filename) - 4:] != '.csv':
-    counties_filename = counties_filename + '.csv'  
-
-# Signature for the county list csv file.
-# This creates a list of dictionaries that stores the relevant headers of
-# the input file and the type of data in the column under that header
-counties_signature = [
-    {'name': 'county_abbreviation', 'type': str},
-    #eg: The first element of the list 'counties_signature' is a dictionary for 
-    #county abbreviation. 'county_abbreviation' is the header of a column of data
-    #we want to extract from the input file, containing data of type string
-    {'name': 'watershed_data_filename', 'type': str},
-    {'name': 'watershed_precipitation_filename', 'type': str},
-    {'name': 'field_data_filename', 'type': str}
-];
-
-# Load and validate county file data.
-# county_data will now store the relevant data from the counties csv input file
-# in the format described in loader.py using the signature defined above.
-# valid_rows will store all value for the key 'valid_rows' in the dictionary geometry_data
-county_data = loader.load(counties_filename, counties_signature, 1, -1)
-counties = county_data["valid_rows"]
-invalid_counties = county_data["invalid_rows"]
-
-# Notify of any invalid counties and exit if present.
-if len(invalid_counties) > 0:
-    print "\nERROR: Bailing out due to invalid county rows in '" + counties_filename + "':"
-    for invalid in invalid_counties :
-        print "* Row number " \
-        + str(invalid["row_number"]) \
-        + " was invalid because " \
-        + invalid["reason_invalid"]
-    sys.exit(0)
-
-# For each county listed in the counties csv, perform all the computations:
-for county in counties:
-    # Grab the abbreviation and filenames from the county row.
-    county_abbreviation = county["county_abbreviation"]
-    #stores the values for key 'county_abbreviation' from dictionary 'county'
-    watershed_data_input_filename = data_path + county["watershed_data_filename"]
-    watershed_precip_input_filename = data_path + county["watershed_precipitation_filename"]
-    field_data_input_filename = data_path + county["field_data_filename"]
-
-    # Create filenames for all of the output files.
-    output_prefix = data_path + county_abbreviation + "_"
-    current_runoff_filename     = output_prefix + "current_runoff.csv"
-    future_runoff_filename      = output_prefix + "future_runoff.csv"
-    sorted_filename             = output_prefix + "sorted_ws.csv"
-    culvert_geometry_filename   = output_prefix + "culv_geom.csv"
-    capacity_filename           = output_prefix + "capacity_output.csv"
-    return_period_filename      = output_prefix + 'return_periods.csv'
-    final_output_filename       = output_prefix + 'model_output.csv'
-
-    #Notifies user about runnign calculations
-    print "\nRunning calculations for culverts in county " + county_abbreviation + ":"
-
-    # 1. WATERSHED PEAK DISCHARGE
-    
-    # Sort watersheds so they match original numbering (GIS changes numbering)
-    print " * Sorting watersheds by BarrierID and saving it to " + sorted_filename + "." 
-    sorter.sort(watershed_data_input_filename, county_abbreviation, sorted_filename)
-
-    # Culvert Peak Discharge function calculates the peak discharge for each culvert for current and future precip
-    print " * Calculating current runoff and saving it to " + current_runoff_filename + "."
-    runoff.calculate(sorted_filename, watershed_precip_input_filename, 1.0, current_runoff_filename)
-    print " * Calculating future runoff and saving it to " + future_runoff_filename + "."
-    runoff.calculate(sorted_filename, watershed_precip_input_filename, 1.15, future_runoff_filename) # 1.15 times the rain in the future.
-
-
-    # 2. CULVERT GEOMETRY
-    print " * Calculating culvert geometry and saving it to " + culvert_geometry_filename + "."
-    # Culvert Capacity Prep function calculates the cross sectional area and assigns c and Y coeffs to each culvert
-    capacity_prep.geometry(field_data_input_filename, culvert_geometry_filename)
-
-    # 3. CULVERT CAPACITY
-    print " * Calculating culvert capacity and saving it to " + capacity_filename + "."
-    # Culvert_Capacities function calculates the capacity of each culvert (m^3/s) based on inlet control
-    capacity.inlet_control(culvert_geometry_filename, capacity_filename)
-
-    # 4. RETURN PERIODS AND FINAL OUTPUT
-    print " * Calculating return periods and saving them to " + return_period_filename + "."
-    print " * Calculating final output and saving it to " + final_output_filename + "."
-    # Run return period script
-    return_periods.return_periods(capacity_filename, current_runoff_filename, future_runoff_filename, return_period_filename, final_output_filename)
+# Rainfall scenarios: a name and a multiplier on the NRCC precipitation for each.
+# 'current' and 'future' are needed for the final output. Any others (e.g. a climate
+# sensitivity sweep such as {'name': 'plus 5%', 'adjustment': 1.05}) are calculated in
+# the same pass and their max return periods saved to a separate scenario file.
+rainfall_scenarios = [
+    {'name': 'current', 'adjustment': 1.0},
+    {'name': 'future', 'adjustment': 1.15} # 1.15 times the rain in the future.
+]
+
+# Set to True to also save the files in between the steps of the model (sorted_ws, runoff,
+# culv_geom and capacity_output), e.g. for debugging. They are not needed for the final output.
+write_intermediate_files = False
+
+# The format of the files in between the steps, if they are saved: 'csv', or 'cols' for binary
+# columnar tables (see columnar.py), which are much faster to read back in on large counties.
+# (python columnar.py FILE.cols exports a columnar table as csv.)
+intermediate_format = 'csv'
+
+# Skip the steps of a county whose inputs (files, model code and coefficient table) haven't changed
+# since the last run (see build_manifest.py). Set to False to always recalculate everything.
+skip_unchanged_steps = True
+
+# Set to True so that, when only the field data has changed since the last run (e.g. a few
+# culverts corrected), just the crossings whose culverts were changed, added or removed are
+# recalculated and patched into the existing output files (see row_delta.py), instead of
+# recalculating every culvert. Needs skip_unchanged_steps.
+update_changed_culverts_only = False
+
+# Culverts without a Survey_ID (e.g. field data from before extract.py wrote it) are grouped into
+# crossings by their Flags and row order. Set this to a distance in meters (e.g. 2) to group
+# the culverts within that distance of each other instead, whatever their order (see spatial_index.py).
+crossing_distance_m = None
+
+# Watersheds smaller than this many sq km can get their peak discharge by another method than
+# TR-55: 'rational' uses the rational method, with the rainfall intensity of the storm lasting
+# each watershed's time of concentration (from the durations of the NRCC export; see idf.py).
+# None uses TR-55 for every watershed.
+small_watershed_method = None
+small_watershed_max_area_sqkm = 0.8
+
+# Parsed input files are kept in memory (up to this many MB per process), so files shared by
+# several counties, such as a precipitation file, are only parsed once. 0 turns this off.
+loader_cache_mb = 256
+
+# How many processes parse each big csv file (32 MB or more, e.g. a statewide export) at once:
+# 1 parses them in one process, 0 uses every CPU core (see parallel_parse.py). This only applies
+# when number_of_processes is 1; counties run side by side each parse their files in one process.
+csv_parse_processes = 1
+
+# How many counties to run at once, each in its own process. 1 runs them one after another
+# in this process; 0 uses every CPU core.
+number_of_processes = 1
+
+def main():
+    # The settings above that belong to the model's modules. They go to every county's job too,
+    # so worker processes that don't fork from this one still get them.
+    settings = {
+        'loader.cache_max_mb': loader_cache_mb,
+        'loader.parallel_processes': csv_parse_processes,
+        'capacity.crossing_distance_m': crossing_distance_m,
+        'runoff.small_watershed_method': small_watershed_method,
+        'runoff.small_watershed_max_area_sqkm': small_watershed_max_area_sqkm
+    }
+    pipeline.apply_settings(settings)
+
+    print('Cornell Culvert Evaluation Model')
+    print('--------------------------------\n')
+
+    # 0. LOAD LIST OF COUNTY FILES
+
+    # Propmts user to input county file name, and corrects to proper '.csv' format
+    data_path = raw_input('Enter path to your data folder, for example: C:\Users\Public\Documents\ALB_TestRun\CulvertStartKit\CulvertEvaluation\ALB\: ')
+    check = raw_input('Master file called county_list.csv? Enter Y if correct, else enter correct file name')  # simplifies running a bit
+    if (check == "Y" or check == "y"):
+        counties_filename = "county_list.csv"
+    else: counties_filename = check
+    # counties_filename = raw_input('Enter name of counties csv file in the Data folder: ')  # Removed Oct 2018
+
+    counties_filename = data_path + counties_filename
+    if counties_filename[len(counties_filename) - 4:] != '.csv':
+        counties_filename = counties_filename + '.csv'  
+
+    # Signature for the county list csv file.
+    # This creates a list of dictionaries that stores the relevant headers of
+    # the input file and the type of data in the column under that header
+    counties_signature = [
+        {'name': 'county_abbreviation', 'type': str},
+        #eg: The first element of the list 'counties_signature' is a dictionary for 
+        #county abbreviation. 'county_abbreviation' is the header of a column of data
+        #we want to extract from the input file, containing data of type string
+        {'name': 'watershed_data_filename', 'type': str},
+        {'name': 'watershed_precipitation_filename', 'type': str},
+        {'name': 'field_data_filename', 'type': str}
+    ];
+
+    # Load and validate county file data.
+    # county_data will now store the relevant data from the counties csv input file
+    # in the format described in loader.py using the signature defined above.
+    # valid_rows will store all value for the key 'valid_rows' in the dictionary geometry_data
+    county_data = loader.load(counties_filename, counties_signature, 1, -1)
+    counties = county_data["valid_rows"]
+    invalid_counties = county_data["invalid_rows"]
+
+    # Notify of any invalid counties and exit if present.
+    if len(invalid_counties) > 0:
+        print "\nERROR: Bailing out due to invalid county rows in '" + counties_filename + "':"
+        for invalid in invalid_counties :
+            print "* Row number " \
+            + str(invalid["row_number"]) \
+            + " was invalid because " \
+            + invalid["reason_invalid"]
+        sys.exit(0)
+
+    # For each county listed in the counties csv, perform all the computations (see pipeline.py),
+    # passing the results of each step straight to the next:
+    # 1. Sort watersheds and calculate their peak discharge for every rainfall scenario.
+    # 2. Calculate the cross sectional area and assign c and Y coeffs to each culvert.
+    # 3. Calculate the capacity of each culvert (m^3/s) based on inlet control.
+    # 4. Calculate return periods and the final output.
+    # Counties share nothing, so with more than one process they are run side by side.
+    # Each county's messages are then printed together once it is finished.
+    run_start = time.time()
+    county_jobs = []
+    for county in counties:
+        county_jobs.append((county, data_path, rainfall_scenarios, write_intermediate_files, number_of_processes != 1, intermediate_format, skip_unchanged_steps, update_changed_culverts_only, settings))
+
+    if number_of_processes == 1:
+        county_results = []
+        for job in county_jobs:
+            county_results.append(pipeline.run_county_job(job))
+    else:
+        processes = number_of_processes
+        if processes == 0:
+            processes = multiprocessing.cpu_count()
+        print "\nRunning " + str(len(county_jobs)) + " counties with " + str(processes) + " processes."
+        county_results = pipeline.run_county_jobs(county_jobs, processes)
 
     ## TN, 2017: This step is no longer necessary since the final output is compiled in the return_periods.py script
     # 5. FINAL OUTPUT
@@ -156,5 +203,34 @@ for county in counties:
     #Run final output script to aggregate all model outputs
     #final_output.combine(return_period_filename, capacity_filename, field_data_input_filename, watershed_data_input_filename, culvert_geometry_filename, final_output_filename)
 
-print "\nDone! All output files can be found within the folder " + os.getcwd()
-
+    # Save the run report of every county together.
+    run_report_filename = data_path + "run_report.json"
+    county_reports = []
+    for county_result in county_results:
+        county_reports.append({
+            'county_abbreviation': county_result['county_abbreviation'],
+            'succeeded': county_result['succeeded'],
+            'exit_code': county_result.get('exit_code'),
+            'report': county_result['report']
+        })
+    instrumentation.save_report(run_report_filename, {
+        'seconds': time.time() - run_start,
+        'number_of_processes': number_of_processes,
+        'counties': county_reports
+    })
+    print "\nRun report saved to " + run_report_filename
+
+    print "\nDone! All output files can be found within the folder " + os.getcwd()
+
+    # Report any counties that failed, and exit with an error status so batch jobs can tell.
+    failed_counties = []
+    for county_result in county_results:
+        if not county_result['succeeded']:
+            failed_counties.append(county_result['county_abbreviation'])
+    if len(failed_counties) > 0:
+        print "\nERROR: " + str(len(failed_counties)) + " of " + str(len(county_results)) + " counties failed: " + ", ".join(failed_counties)
+        sys.exit(1)
+
+# Run main only when this file is run, not when the worker processes import it.
+if __name__ == '__main__':
+    main()
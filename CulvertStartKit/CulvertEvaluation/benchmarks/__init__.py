@@ -0,0 +1,20 @@
+# Benchmarks for the Cornell Culvert Evaluation model
+# October 2026
+#
+# synthetic.py makes up county data sets of any size (NAACC field exports, field data,
+# watershed tables and NRCC precipitation files), run.py times each step of the model
+# on them and saves the results to a JSON file, and compare.py compares two of those
+# files and flags any step that got slower or bigger.
+#
+# Run them from the CulvertEvaluation folder, e.g.:
+#   python -m benchmarks.run --sizes 1000,100000 --output baseline.json
+#   python -m benchmarks.run --sizes 1000,100000 --output latest.json
+#   python -m benchmarks.compare baseline.json latest.json
+
+import os, sys
+
+# The model scripts import each other by name (e.g. 'import loader'), so make sure
+# the CulvertEvaluation folder is on the path, wherever the benchmarks are run from.
+model_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if model_path not in sys.path:
+    sys.path.insert(0, model_path)
@@ -0,0 +1,96 @@
+# Compare two benchmark results files
+# October 2026
+#
+# Compares the results of benchmarks/run.py against a baseline and flags every step
+# (at every county size in both files) that got slower or used more memory than the
+# tolerance allows. Exits with status 1 if there were any regressions, so it can be
+# used as a check.
+#
+# Usage (from the CulvertEvaluation folder):
+#   python -m benchmarks.compare baseline.json latest.json --time-tolerance 0.25
+
+import argparse, json, sys
+
+# Load a results file written by run.py.
+def load_results(filename):
+    try:
+        with open(filename, 'r') as results_file:
+            return json.load(results_file)
+    except IOError:
+        print "ERROR: Could not find file '" + filename + "'. Bailing out."
+        sys.exit(1)
+
+# Compare the results of every step at every size in both files.
+# Parameters:
+#   baseline, latest: results loaded with load_results.
+#   time_tolerance, memory_tolerance: how much slower / bigger a step may get, e.g. 0.25 for 25%.
+#   min_seconds: steps faster than this in the baseline are too noisy to time, so only their memory is checked.
+# Returns a list of dictionaries, one per step and size, with size, stage, the baseline
+# and latest values, their ratios and a list of regressions (empty if there were none).
+def compare(baseline, latest, time_tolerance, memory_tolerance, min_seconds):
+    comparisons = []
+    for size in sorted(baseline['sizes'], key = int):
+        if size not in latest['sizes']:
+            continue
+        # In the order the steps ran, if the file says.
+        stage_names = baseline.get('stages', sorted(baseline['sizes'][size]))
+        for stage in stage_names:
+            if stage not in baseline['sizes'][size]:
+                continue
+            before = baseline['sizes'][size][stage]
+            after = latest['sizes'][size].get(stage)
+            if after == None or 'error' in before:
+                continue
+            comparison = {'size': size, 'stage': stage, 'before': before, 'after': after, 'regressions': []}
+            if 'error' in after:
+                comparison['regressions'].append('failed')
+            else:
+                comparison['time_ratio'] = after['seconds'] / before['seconds'] if before['seconds'] > 0 else None
+                comparison['memory_ratio'] = after['peak_rss_mb'] / before['peak_rss_mb'] if before['peak_rss_mb'] > 0 else None
+                if before['seconds'] >= min_seconds and comparison['time_ratio'] != None and comparison['time_ratio'] > 1 + time_tolerance:
+                    comparison['regressions'].append('time')
+                if comparison['memory_ratio'] != None and comparison['memory_ratio'] > 1 + memory_tolerance:
+                    comparison['regressions'].append('memory')
+            comparisons.append(comparison)
+    return comparisons
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Compare benchmark results against a baseline.')
+    parser.add_argument('baseline', help = 'results file to compare against')
+    parser.add_argument('latest', help = 'results file to check')
+    parser.add_argument('--time-tolerance', type = float, default = 0.25, help = 'allowed slow down, as a fraction (default 0.25)')
+    parser.add_argument('--memory-tolerance', type = float, default = 0.25, help = 'allowed increase in peak memory, as a fraction (default 0.25)')
+    parser.add_argument('--min-seconds', type = float, default = 0.05, help = 'only check the time of steps that took at least this long in the baseline')
+    args = parser.parse_args(argv)
+
+    comparisons = compare(load_results(args.baseline), load_results(args.latest), args.time_tolerance, args.memory_tolerance, args.min_seconds)
+
+    num_regressions = 0
+    print "%10s  %-32s %10s %10s %7s %10s %10s %7s" % ('size', 'step', 'before s', 'after s', 'ratio', 'before MB', 'after MB', 'ratio')
+    for comparison in comparisons:
+        before = comparison['before']
+        after = comparison['after']
+        if 'error' in after:
+            line = "%10s  %-32s FAILED" % (comparison['size'], comparison['stage'])
+        else:
+            line = "%10s  %-32s %10.3f %10.3f %7s %10.1f %10.1f %7s" % (
+                comparison['size'], comparison['stage'],
+                before['seconds'], after['seconds'], ratio_string(comparison['time_ratio']),
+                before['peak_rss_mb'], after['peak_rss_mb'], ratio_string(comparison['memory_ratio']))
+        if len(comparison['regressions']) > 0:
+            num_regressions += 1
+            line += "  <-- REGRESSION (" + ", ".join(comparison['regressions']) + ")"
+        print line
+
+    if num_regressions > 0:
+        print "\n" + str(num_regressions) + " regression(s) found."
+        sys.exit(1)
+    print "\nNo regressions found."
+
+def ratio_string(ratio):
+    if ratio == None:
+        return '-'
+    return "%.2fx" % ratio
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,199 @@
+# Time each step of the model on synthetic counties
+# October 2026
+#
+# For each county size, makes up a county (see synthetic.py), then runs each step of the
+# model on it, in order, each step reading the files the steps before it wrote.
+# Each step runs in its own process, so its peak memory is its own.
+# For every step and size, records:
+#   seconds: wall clock time.
+#   cpu_seconds: user + system CPU time.
+#   rows: number of culverts in the county.
+#   rows_per_second: rows / seconds.
+#   peak_rss_mb: peak resident memory of the process running the step, in MB.
+# and saves them all to a JSON file that compare.py can compare against later.
+#
+# Usage (from the CulvertEvaluation folder):
+#   python -m benchmarks.run --sizes 1000,100000,1000000 --output baseline.json
+
+import argparse, json, multiprocessing, os, platform, Queue, shutil, sys, tempfile, time, traceback
+import numpy
+from benchmarks import synthetic
+import loader, sorter, runoff, capacity_prep, capacity, return_periods, pipeline, instrumentation
+
+county_abbreviation = 'SYN'
+
+# The rainfall scenarios used by the runoff and pipeline steps (as in Cornell_Culvert_Evaluation.py).
+rainfall_scenarios = [
+    {'name': 'current', 'adjustment': 1.0},
+    {'name': 'future', 'adjustment': 1.15}
+]
+
+# The files every step reads and writes, for a county's data folder.
+def county_files(data_path):
+    prefix = data_path + county_abbreviation
+    return {
+        'field_data': prefix + '_field_data.csv',
+        'watershed_data': prefix + '_ws.csv',
+        'precip': prefix + '_precip.csv',
+        'sorted': prefix + '_sorted_ws.csv',
+        'current_runoff': prefix + '_current_runoff.csv',
+        'future_runoff': prefix + '_future_runoff.csv',
+        'culvert_geometry': prefix + '_culv_geom.csv',
+        'capacity': prefix + '_capacity_output.csv',
+        'return_periods': prefix + '_return_periods.csv',
+        'final_output': prefix + '_model_output.csv',
+        'output_prefix': prefix + '_pipeline_'
+    }
+
+# The steps of the model, each a function of the county files. (Functions of this module rather
+# than lambdas, so they can be handed to a new process where processes aren't forked, as on Windows.)
+def load_field_data(files):
+    loader.load(files['field_data'], capacity_prep.field_data_signature, 1, -1)
+
+def sort_watersheds(files):
+    sorter.sort(files['watershed_data'], county_abbreviation, files['sorted'])
+
+def calculate_runoff(files):
+    runoff.calculate(files['sorted'], files['precip'], [1.0, 1.15], [files['current_runoff'], files['future_runoff']])
+
+def calculate_geometry(files):
+    capacity_prep.geometry(files['field_data'], files['culvert_geometry'])
+
+def calculate_capacity(files):
+    capacity.inlet_control(files['culvert_geometry'], files['capacity'])
+
+def calculate_return_periods(files):
+    return_periods.return_periods(files['capacity'], files['current_runoff'], files['future_runoff'], files['return_periods'], files['final_output'])
+
+def run_pipeline(files):
+    pipeline.CountyPipeline(county_abbreviation, files['watershed_data'], files['precip'], files['field_data'], files['output_prefix'], rainfall_scenarios).run()
+
+# The steps of the model, in the order they run: each is a name and a function of the county files.
+stages = [
+    ('loader.load', load_field_data),
+    ('sorter.sort', sort_watersheds),
+    ('runoff.calculate', calculate_runoff),
+    ('capacity_prep.geometry', calculate_geometry),
+    ('capacity.inlet_control', calculate_capacity),
+    ('return_periods.return_periods', calculate_return_periods),
+    ('pipeline.CountyPipeline.run', run_pipeline)
+]
+
+# How often (in seconds) to check whether the process measuring a step is still running.
+poll_seconds = 1.0
+
+# Run a function in a new process, with its messages thrown away, and measure it.
+# Returns a dictionary of seconds, cpu_seconds and peak_rss_mb, or of error if it failed
+# (including its process dying without a result, e.g. killed for running out of memory).
+def measure(function, *args):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target = measure_in_process, args = (results, function) + args)
+    process.start()
+    result = None
+    while result == None:
+        try:
+            result = results.get(timeout = poll_seconds)
+        except Queue.Empty:
+            if process.exitcode != None:
+                # It may have put its result just before it ended.
+                try:
+                    result = results.get(timeout = poll_seconds)
+                except Queue.Empty:
+                    result = {'error': 'the process running the step died without a result (exit code ' + str(process.exitcode) + ')'}
+    process.join()
+    return result
+
+def measure_in_process(results, function, *args):
+    devnull = open(os.devnull, 'w')
+    sys.stdout = devnull
+    try:
+        start_cpu = instrumentation.cpu_seconds()
+        start = time.time()
+        function(*args)
+        seconds = time.time() - start
+        results.put({
+            'seconds': seconds,
+            'cpu_seconds': instrumentation.cpu_seconds() - start_cpu,
+            'peak_rss_mb': instrumentation.peak_rss_mb()
+        })
+    except SystemExit:
+        results.put({'error': 'the step bailed out'})
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+
+# Run every step for one county size.
+# Returns a dictionary mapping each step name to its measurements.
+def run_size(num_culverts, data_path, seed, repeat):
+    print "Making up a county of " + str(num_culverts) + " culverts in " + data_path
+    measure(synthetic.county, county_abbreviation, num_culverts, data_path, seed)
+    files = county_files(data_path)
+
+    results = {}
+    for name, function in stages:
+        # Keep the fastest of the repeats (and the largest memory, which should hardly vary).
+        best = None
+        peak = 0
+        for i in range(repeat):
+            result = measure(function, files)
+            if 'error' in result:
+                best = result
+                break
+            peak = max(peak, result['peak_rss_mb'])
+            if best == None or result['seconds'] < best['seconds']:
+                best = result
+        if 'error' in best:
+            print "  " + name + ": FAILED"
+            print best['error']
+        else:
+            best['peak_rss_mb'] = peak
+            best['rows'] = num_culverts
+            best['rows_per_second'] = num_culverts / best['seconds'] if best['seconds'] > 0 else None
+            print "  %-32s %9.3f s %12.0f rows/s %9.1f MB" % (name, best['seconds'], best['rows_per_second'] or 0, best['peak_rss_mb'])
+        results[name] = best
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Time each step of the culvert model on synthetic counties.')
+    parser.add_argument('--sizes', default = '1000,100000', help = 'comma separated numbers of culverts, e.g. 1000,100000,1000000')
+    parser.add_argument('--output', default = 'benchmark_results.json', help = 'JSON file to save the results to')
+    parser.add_argument('--data-dir', default = None, help = 'folder to make the synthetic counties in (by default a temporary folder, deleted afterwards)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'random seed for the synthetic counties')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'run each step this many times and keep the fastest')
+    args = parser.parse_args(argv)
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(',')]
+    except ValueError:
+        print "ERROR: --sizes must be a comma separated list of numbers, not '" + args.sizes + "'. Bailing out."
+        sys.exit(1)
+
+    base_path = args.data_dir
+    if base_path == None:
+        base_path = tempfile.mkdtemp(prefix = 'culvert_benchmarks_')
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'stages': [name for name, function in stages],
+        'sizes': {}
+    }
+    try:
+        for num_culverts in sizes:
+            data_path = os.path.join(base_path, str(num_culverts)) + os.sep
+            if not os.path.isdir(data_path):
+                os.makedirs(data_path)
+            report['sizes'][str(num_culverts)] = run_size(num_culverts, data_path, args.seed, args.repeat)
+    finally:
+        if args.data_dir == None:
+            shutil.rmtree(base_path, ignore_errors = True)
+
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent = 2, sort_keys = True)
+    print "\nResults saved to " + args.output
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,245 @@
+# Synthetic county data for the benchmarks
+# October 2026
+#
+# Makes up a county of any number of culverts, with all the input files the model needs:
+#   - a NAACC field export (the input of extract.py),
+#   - the field data extract.py would make from it,
+#   - the watershed table exported from GIS, one watershed per culvert (a few are missing,
+#     like in real data), in a shuffled order and with GIS's own county code,
+#   - an NRCC precipitation export.
+# The values are random but in realistic ranges, and the same seed always gives the same files.
+#
+# Usage:
+#   files = synthetic.county('SYN', 100000, 'bench_data/')
+#   files['field_data'] -> 'bench_data/SYN_field_data.csv', etc.
+
+import csv
+import numpy
+
+# Culvert shapes, as NAACC calls them and as extract.py renames them, and how common each is.
+shapes = [
+    ('Round Culvert', 'Round', 0.6),
+    ('Pipe Arch/Elliptical Culvert', 'Elliptical', 0.15),
+    ('Box Culvert', 'Box', 0.15),
+    ('Open Bottom Arch Bridge/Culvert', 'Arch', 0.1)
+]
+
+# Inlet types, as NAACC calls them and as extract.py renames them, and how common each is.
+inlet_types = [
+    ('Headwall', 'Headwall', 0.4),
+    ('Projecting', 'Projecting', 0.2),
+    ('Wingwalls', 'Wingwall', 0.15),
+    ('Headwall and Wingwalls', 'Wingwall and Headwall', 0.1),
+    ('Mitered to Slope', 'Mitered to Slope', 0.1),
+    ('None', 'Projecting', 0.05)
+]
+
+# Culvert materials (extract.py leaves these alone) and how common each is.
+materials = [
+    ('Concrete', 0.25),
+    ('Plastic', 0.3),
+    ('Metal', 0.35),
+    ('Stone', 0.05),
+    ('Combination', 0.05)
+]
+
+# The NRCC export columns and the mean precipitation estimates (inches) of the sample
+# file AAA_precip_sample.csv, which each synthetic county scales a little.
+precip_durations = ['5-min','10-min','15-min','30-min','60-min','120-min','3-hr','6-hr','12-hr','24-hr','2-day','4-day','7-day','10-day']
+precip_years = [1, 2, 5, 10, 25, 50, 100, 200, 500]
+precip_estimates = [
+    [0.28,0.44,0.54,0.71,0.89,1.1,1.26,1.55,1.89,2.3,2.57,2.9,3.48,4],
+    [0.34,0.53,0.66,0.87,1.09,1.35,1.54,1.87,2.24,2.68,3.02,3.38,4.02,4.59],
+    [0.41,0.63,0.79,1.06,1.36,1.7,1.94,2.34,2.79,3.3,3.73,4.17,4.83,5.49],
+    [0.46,0.72,0.91,1.23,1.61,2.01,2.3,2.78,3.3,3.87,4.38,4.9,5.55,6.3],
+    [0.54,0.86,1.1,1.51,2.01,2.53,2.89,3.48,4.1,4.77,5.41,6.06,6.68,7.55],
+    [0.61,0.98,1.26,1.76,2.37,3.02,3.45,4.14,4.85,5.6,6.35,7.13,7.68,8.66],
+    [0.7,1.13,1.46,2.07,2.81,3.58,4.1,4.9,5.72,6.57,7.47,8.38,8.85,9.95],
+    [0.8,1.3,1.69,2.42,3.34,4.27,4.89,5.82,6.76,7.71,8.79,9.87,10.19,11.43],
+    [0.96,1.58,2.06,2.99,4.19,5.37,6.15,7.3,8.43,9.55,10.9,12.25,12.3,13.75]
+]
+
+# Column of each value in a NAACC field export (the same positions extract.py reads).
+naacc_columns = {
+    'Survey_Id': 0,
+    'Crossing_Type': 11,
+    'GPS_X_Coordinate': 19,
+    'GPS_Y_Coordinate': 20,
+    'Inlet_Type': 22,
+    'Number_Of_Culverts': 24,
+    'Road_Fill_Height': 27,
+    'Naacc_Culvert_Id': 35,
+    'Crossing_Structure_Length': 39,
+    'Inlet_Height': 43,
+    'Inlet_Structure_Type': 44,
+    'Inlet_Width': 47,
+    'Material': 49,
+    'Slope_Percent': 61
+}
+naacc_width = 62
+
+# Make up all the input files of a county.
+# Parameters:
+#   county_abbreviation: our abbreviation for the county, e.g. 'SYN'.
+#   num_culverts: how many culverts (rows of field data) to make.
+#   data_path: folder to save the files in (ending in a slash).
+#   seed: random seed.
+# Returns a dictionary of the filenames: naacc_export, field_data, watershed_data and precip.
+def county(county_abbreviation, num_culverts, data_path, seed = 0):
+    random = numpy.random.RandomState(seed)
+    culvert_data = culverts(num_culverts, random)
+
+    files = {
+        'naacc_export': data_path + county_abbreviation + '.csv',
+        'field_data': data_path + county_abbreviation + '_field_data.csv',
+        'watershed_data': data_path + county_abbreviation + '_ws.csv',
+        'precip': data_path + county_abbreviation + '_precip.csv'
+    }
+    save_naacc_export(files['naacc_export'], culvert_data)
+    save_field_data(files['field_data'], culvert_data, county_abbreviation)
+    save_watershed_data(files['watershed_data'], watersheds(num_culverts, county_abbreviation.lower() + 'ws', random))
+    save_precip(files['precip'], random)
+    return files
+
+# Make up the culverts.
+# Most crossings have a single culvert; some have 2 to 4, which are in adjacent rows and
+# share a Survey_ID and location, as in NAACC exports.
+# Returns a dictionary of columns, with the NAACC name and extract.py name of each
+# shape and inlet type.
+def culverts(num_culverts, random):
+    # Number of culverts at each crossing, then the crossing of each culvert.
+    barrels = random.choice([1, 2, 3, 4], size = num_culverts, p = [0.93, 0.05, 0.015, 0.005])
+    crossing = numpy.repeat(numpy.arange(num_culverts), barrels)[:num_culverts]
+    num_crossings = crossing[-1] + 1 if num_culverts > 0 else 0
+    barrels = numpy.bincount(crossing, minlength = num_crossings)
+
+    shape = random.choice(len(shapes), size = num_culverts, p = [s[2] for s in shapes])
+    inlet_type = random.choice(len(inlet_types), size = num_culverts, p = [t[2] for t in inlet_types])
+    material = random.choice(len(materials), size = num_culverts, p = [m[1] for m in materials])
+
+    return {
+        'Survey_ID': 10000 + crossing,
+        'NAACC_ID': 20000 + random.permutation(num_culverts),
+        'Lat': numpy.round(random.uniform(40.5, 45.0, num_crossings), 6)[crossing],
+        'Long': numpy.round(random.uniform(-79.8, -71.9, num_crossings), 6)[crossing],
+        'Number_Of_Culverts': barrels[crossing],
+        'Shape': shape,
+        'Inlet_Type': inlet_type,
+        'Material': material,
+        'In_A': numpy.round(random.uniform(1, 15, num_culverts), 1), # width, ft
+        'In_B': numpy.round(random.uniform(1, 10, num_culverts), 1), # height, ft
+        'HW': numpy.round(random.uniform(0, 12, num_culverts), 1), # road fill height, ft
+        'Slope': numpy.round(random.uniform(0, 8, num_culverts), 1), # percent
+        'Length': numpy.round(random.uniform(10, 120, num_culverts), 0)
+    }
+
+# Make up one watershed per culvert, numbered 1 to num_culverts like the culverts.
+# About 1 in 100 is left out, and the rest are shuffled.
+# Returns a dictionary of columns.
+def watersheds(num_culverts, their_county_code, random):
+    numbers = numpy.arange(1, num_culverts + 1)
+    numbers = numbers[random.uniform(size = num_culverts) >= 0.01]
+    numbers = random.permutation(numbers)
+    num_watersheds = len(numbers)
+    return {
+        'BarrierID': [str(number) + their_county_code for number in numbers.tolist()],
+        'Area_sqkm': numpy.round(random.lognormal(-1.0, 1.5, num_watersheds), 4),
+        'Tc_hr': numpy.round(random.uniform(0.05, 3.0, num_watersheds), 3),
+        'CN': numpy.round(random.uniform(40, 95, num_watersheds), 2)
+    }
+
+# Save the culverts as a NAACC field export (see extract.py).
+def save_naacc_export(filename, culvert_data):
+    header = [''] * naacc_width
+    for name, column in naacc_columns.items():
+        header[column] = name
+
+    columns = [
+        ('Survey_Id', culvert_data['Survey_ID'].tolist()),
+        ('Crossing_Type', ['Multiple Culvert' if n > 1 else 'Single Culvert' for n in culvert_data['Number_Of_Culverts'].tolist()]),
+        ('GPS_X_Coordinate', culvert_data['Long'].tolist()),
+        ('GPS_Y_Coordinate', culvert_data['Lat'].tolist()),
+        ('Inlet_Type', [inlet_types[t][0] for t in culvert_data['Inlet_Type'].tolist()]),
+        ('Number_Of_Culverts', culvert_data['Number_Of_Culverts'].tolist()),
+        ('Road_Fill_Height', culvert_data['HW'].tolist()),
+        ('Naacc_Culvert_Id', culvert_data['NAACC_ID'].tolist()),
+        ('Crossing_Structure_Length', culvert_data['Length'].tolist()),
+        ('Inlet_Height', culvert_data['In_B'].tolist()),
+        ('Inlet_Structure_Type', [shapes[s][0] for s in culvert_data['Shape'].tolist()]),
+        ('Inlet_Width', culvert_data['In_A'].tolist()),
+        ('Material', [materials[m][0] for m in culvert_data['Material'].tolist()]),
+        ('Slope_Percent', culvert_data['Slope'].tolist())
+    ]
+
+    with open(filename, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(header)
+        row = [''] * naacc_width
+        for values in zip(*[values for name, values in columns]):
+            for i in range(len(columns)):
+                row[naacc_columns[columns[i][0]]] = values[i]
+            writer.writerow(row)
+
+# Save the culverts as the field data extract.py would write.
+def save_field_data(filename, culvert_data, county_abbreviation):
+    num_culverts = len(culvert_data['NAACC_ID'])
+    flags = numpy.where(culvert_data['Number_Of_Culverts'] > 1, culvert_data['Number_Of_Culverts'], 0)
+    blanks = [-1] * num_culverts
+    float_blanks = [-1.0] * num_culverts
+    columns = [
+        [str(k) + county_abbreviation for k in range(1, num_culverts + 1)],
+        culvert_data['NAACC_ID'].tolist(),
+        culvert_data['Lat'].tolist(),
+        culvert_data['Long'].tolist(),
+        blanks, # Rd_Name
+        [materials[m][0] for m in culvert_data['Material'].tolist()],
+        [inlet_types[t][1] for t in culvert_data['Inlet_Type'].tolist()],
+        [shapes[s][1] for s in culvert_data['Shape'].tolist()],
+        culvert_data['In_A'].tolist(),
+        culvert_data['In_B'].tolist(),
+        culvert_data['HW'].tolist(),
+        culvert_data['Slope'].tolist(),
+        culvert_data['Length'].tolist(),
+        blanks, # Out_Shape
+        float_blanks, # Out_A
+        float_blanks, # Out_B
+        blanks, # Comments
+        flags.tolist(),
+        culvert_data['Survey_ID'].tolist()
+    ]
+
+    with open(filename, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['BarrierID','NAACC_ID','Lat','Long','Rd_Name','Culv_Mat','In_Type','In_Shape','In_A','In_B','HW','Slope','Length','Out_Shape','Out_A','Out_B','Comments','Flags','Survey_ID'])
+        writer.writerows(zip(*columns))
+
+# Save the watersheds in the format exported from GIS.
+def save_watershed_data(filename, watershed_data):
+    num_watersheds = len(watershed_data['BarrierID'])
+    with open(filename, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['FID','BarrierID','Area_sqkm','Tc_hr','CN'])
+        writer.writerows(zip(range(num_watersheds), watershed_data['BarrierID'], watershed_data['Area_sqkm'].tolist(), watershed_data['Tc_hr'].tolist(), watershed_data['CN'].tolist()))
+
+# Save an NRCC precipitation export: the sample county's estimates, all scaled by up to 10%.
+def save_precip(filename, random):
+    scale = random.uniform(0.9, 1.1)
+    width = len(precip_durations) + 1
+    with open(filename, 'wb') as output_file:
+        writer = csv.writer(output_file)
+        for line in [
+            'Northeast Regional Climate Center Extreme Precipitation estimates (inches)',
+            'Point Estimates, Smoothed',
+            'Data series, Partial duration series',
+            'State, New York',
+            'Location, Synthetic',
+            'Lon (dd),-75.000',
+            'Lat (dd),43.000',
+            'Elev (feet),0',
+            'MEAN PRECIPITATION FREQUENCY ESTIMATES'
+        ]:
+            cells = line.split(',')
+            writer.writerow(cells + [''] * (width - len(cells)))
+        writer.writerow(['Freq (yr)'] + precip_durations)
+        for i in range(len(precip_years)):
+            writer.writerow([precip_years[i]] + [round(value * scale, 2) for value in precip_estimates[i]])
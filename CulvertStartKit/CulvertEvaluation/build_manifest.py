@@ -0,0 +1,138 @@
+# Build manifest for incremental county runs
+# October 2026
+#
+# Remembers what each step of a county run was calculated from, so that running the
+# county again only recalculates the steps whose inputs have changed.
+#
+# Each step gets a key: a hash of the contents of its input files, the model code and
+# tables it uses, its settings and the keys of the steps it depends on. So a step's
+# key changes whenever anything that could change its output changes.
+# After a step runs, its key and a hash of each of its output files are saved in the
+# county's manifest (e.g. ALB/ALB_build_manifest.json). Next time, a step whose key is
+# the same and whose output files are still there, unchanged, is up to date.
+#
+# Usage:
+#   manifest = build_manifest.BuildManifest('ALB/ALB_build_manifest.json')
+#   key = build_manifest.hash_values('calculate_geometry', build_manifest.hash_file('ALB/ALB_field_data.csv'), ...)
+#   if not manifest.is_up_to_date('calculate_geometry', key):
+#       ... run the step ...
+#       manifest.record('calculate_geometry', key, ['ALB/ALB_culv_geom.csv'])
+#   manifest.save()
+
+import hashlib, json, os, platform
+import numpy
+import shapefile_reader
+
+manifest_version = 1
+
+# Hashes of files already hashed in this process, by absolute path, size and modification
+# time, so files shared by many counties (the model code, a precipitation file) are only read once.
+file_hashes = {}
+
+# Hash of the contents of a file, or of every file in a folder (e.g. a columnar table),
+# or of the .shp, .shx and .dbf files of a shapefile.
+# Returns None if there is no such file.
+def hash_file(filename):
+    if shapefile_reader.is_shapefile(filename) and os.path.isfile(filename):
+        components = shapefile_reader.component_filenames(filename)
+        return hash_values(*[[os.path.splitext(name)[1].lower(), hash_file_contents(name)] for name in components])
+    return hash_file_contents(filename)
+
+# The work of hash_file for a file or folder.
+def hash_file_contents(filename):
+    if os.path.isdir(filename):
+        parts = []
+        for name in sorted(os.listdir(filename)):
+            parts.append(name)
+            parts.append(hash_file_contents(os.path.join(filename, name)))
+        return hash_values(*parts)
+
+    try:
+        file_status = os.stat(filename)
+    except OSError:
+        return None
+    cache_key = (os.path.abspath(filename), file_status.st_size, file_status.st_mtime)
+    if cache_key not in file_hashes:
+        file_hash = hashlib.sha1()
+        with open(filename, 'rb') as hash_input:
+            while True:
+                block = hash_input.read(1024 * 1024)
+                if not block:
+                    break
+                file_hash.update(block)
+        file_hashes[cache_key] = file_hash.hexdigest()
+    return file_hashes[cache_key]
+
+# Hash of a list of values (strings, numbers, None, or lists and dictionaries of them).
+def hash_values(*values):
+    return hashlib.sha1(json.dumps(values, sort_keys = True)).hexdigest()
+
+# Hash of the model's own code files (named relative to this folder), plus the versions
+# of python and numpy, which could change results too.
+def hash_code(*filenames):
+    model_path = os.path.dirname(os.path.abspath(__file__))
+    parts = [platform.python_version(), numpy.__version__]
+    for filename in filenames:
+        parts.append(filename)
+        parts.append(hash_file(os.path.join(model_path, filename)))
+    return hash_values(*parts)
+
+# The manifest of one county: for each step, its key and the hashes of its output files.
+class BuildManifest(object):
+
+    # Parameters:
+    #   filename: where the manifest is saved. A missing or unreadable manifest is treated as
+    #       empty (so everything is out of date).
+    def __init__(self, filename):
+        self.filename = filename
+        self.stages = {}
+        try:
+            with open(filename, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get('version') == manifest_version:
+                self.stages = manifest['stages']
+        except (IOError, ValueError, KeyError):
+            self.stages = {}
+
+    # Whether a step was last run with this key and its output files are still as it left them.
+    # If output_filenames is given, the step must also have written exactly those files.
+    def is_up_to_date(self, stage, key, output_filenames = None):
+        entry = self.stages.get(stage)
+        if entry == None or entry['key'] != key:
+            return False
+        return self.outputs_up_to_date(stage, output_filenames)
+
+    # Whether a step's output files are still as it left them (whatever its key).
+    # If output_filenames is given, the step must also have written exactly those files.
+    def outputs_up_to_date(self, stage, output_filenames = None):
+        entry = self.stages.get(stage)
+        if entry == None:
+            return False
+        if output_filenames != None and set(output_filenames) != set(entry['outputs'].keys()):
+            return False
+        for output_filename, output_hash in entry['outputs'].items():
+            if hash_file(output_filename) != output_hash:
+                return False
+        return True
+
+    # The output files recorded for a step (an empty list if there are none).
+    def outputs(self, stage):
+        entry = self.stages.get(stage)
+        if entry == None:
+            return []
+        return entry['outputs'].keys()
+
+    # Record that a step has run with this key and written these output files.
+    def record(self, stage, key, output_filenames):
+        outputs = {}
+        for output_filename in output_filenames:
+            outputs[output_filename] = hash_file(output_filename)
+        self.stages[stage] = {'key': key, 'outputs': outputs}
+
+    # Forget a step, e.g. because it failed part way.
+    def forget(self, stage):
+        self.stages.pop(stage, None)
+
+    def save(self):
+        with open(self.filename, 'w') as manifest_file:
+            json.dump({'version': manifest_version, 'stages': self.stages}, manifest_file, indent = 2, sort_keys = True)
@@ -14,96 +14,168 @@
 #
 # Inputs: filename for the culv_geom csv, filename to write output to.
 
-import numpy, os, re, csv, loader
+import numpy, os, re, csv, loader, spatial_index
 #Imports required packages and modules and the function 'loader' which was written
 # in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
 
+# Signature for incoming geometry file.
+# This creates a list of dictionaries that stores the relevant headers of
+# the input file and the type of data in the column under that header
+geometry_signature = [
+    {'name': 'BarrierID', 'type': str},
+    #eg: The first element of the list 'geometry_signature' is a dictionary for barrier id.
+    #'BarrierID' is the header of a column of data we want to extract from the input file,containing
+    #data of type strings
+    {'name': 'NAACC_ID', 'type': int},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float},
+    {'name': 'HW_m', 'type': float}, 
+    {'name': 'xArea_sqm', 'type': float}, 
+    {'name': 'length_m', 'type': float}, # Length of culvert under road meters
+    {'name': 'D_m', 'type': float}, 
+    {'name': 'c', 'type': float},
+    {'name': 'Y', 'type': float},
+    {'name': 'ks', 'type': float},
+    {'name': 'Culvert_Sl', 'type': float},
+    {'name': 'Comments', 'type': str},
+    {'name': 'Flags', 'type': int},
+    # The NAACC survey of the crossing, used to group the culverts of a crossing together.
+    # Older culv_geom files don't have it; then Flags is used instead (see crossing_groups).
+    {'name': 'Survey_ID', 'type': str, 'optional': True}
+]
+
+# Signature for the capacity output this script produces.
+capacity_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'NAACC_ID', 'type': int},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float},
+    {'name': 'Q', 'type': float},
+    {'name': 'Flags', 'type': int},
+    {'name': 'Comments', 'type': str},
+    {'name': 'Culvert_Area', 'type': float}
+]
+
+# Culverts without a Survey_ID within this many meters of each other are grouped into one
+# crossing by location (see spatial_index.py), instead of by Flags and row order.
+# None keeps the Flags rule. (Separate crossings can be surveyed at the same point, e.g. both
+# ends of a road, so keep this small.)
+crossing_distance_m = None
+
 def inlet_control(culvert_geometry_filename, output_filename):
+    culvert_geometry = load_geometry(culvert_geometry_filename)
+    capacities = calculate_capacity(culvert_geometry)
+    save(output_filename, capacities)
+
+# Load and validate geometry data.
+# geometry_data will now store the relevant data from the culvert geometry input file
+# in the columnar format described in loader.py using the signature defined above.
+# Returns a dictionary of columns holding the valid rows.
+def load_geometry(culvert_geometry_filename):
+    geometry_data = loader.load_columns(culvert_geometry_filename, geometry_signature, 1, -1)
+    return loader.valid_columns(geometry_data)
 
+# Calculate the capacity of every culvert crossing.
+# Parameters:
+#   culvert_geometry: dictionary of culvert geometry columns (see capacity_prep.py).
+# Returns a dictionary of capacity columns, in the format of capacity_signature,
+# with one row per crossing, in the order each crossing first appears.
+def calculate_capacity(culvert_geometry):
+    # Get values needed in computation of capacity.
+    # constants c, Y, Ks tabulated, depend on entrance type, from FHWA engineering pub HIF12026, appendix A
+    Culvert_Area = culvert_geometry['xArea_sqm'] # Calculated in input data prep script sq. meter
+    HW = culvert_geometry['HW_m'] # Hydraulic head above the culvert invert, meters
+    D = culvert_geometry['D_m'] # Diameter or dimension b, (height of culvert) meters
+    Y = culvert_geometry['Y']
+    Ks = culvert_geometry['ks'] # -0.5, except where inlet is mitered in which case +0.7
+    S = culvert_geometry['Culvert_Sl'] # meter/meter
+    c = culvert_geometry['c']
 
-    #csv_writer.writerow(['BarrierID', 'NAACC_ID', 'Lat', 'Long', 'HW_m', 'xArea_sqm', 'length_m', 'D_m', 'c', 'Y', 'ks', 'Culvert_Sl', 'Comments', 'Flags'])
-
-    # Signature for incoming geometry file.
-    # This creates a list of dictionaries that stores the relevant headers of
-    # the input file and the type of data in the column under that header
-    geometry_signature = [
-        {'name': 'BarrierID', 'type': str},
-        #eg: The first element of the list 'geometry_signature' is a dictionary for barrier id.
-        #'BarrierID' is the header of a column of data we want to extract from the input file,containing
-        #data of type strings
-        {'name': 'NAACC_ID', 'type': int},
-        {'name': 'Lat', 'type': float},
-        {'name': 'Long', 'type': float},
-        {'name': 'HW_m', 'type': float}, 
-        {'name': 'xArea_sqm', 'type': float}, 
-        {'name': 'length_m', 'type': float}, # Length of culvert under road meters
-        {'name': 'D_m', 'type': float}, 
-        {'name': 'c', 'type': float},
-        {'name': 'Y', 'type': float},
-        {'name': 'ks', 'type': float},
-        {'name': 'Culvert_Sl', 'type': float},
-        {'name': 'Comments', 'type': str},
-        {'name': 'Flags', 'type': int}
-    ]
-
-    # Load and validate geometry data.
-    # geometry_data will now store the relevant data from the culvert geometry input file
-    # in the format described in loader.py using the signature defined above.
-    # valid_rows will store all value for the key 'valid_rows' in the dictionary geometry_data
-    geometry_data = loader.load(culvert_geometry_filename, geometry_signature, 1, -1)
-    valid_rows = geometry_data["valid_rows"]
-
-    # Go through each culvert and calculate capacity.
-    output_data = []
-    for culvert in valid_rows:
-        # Get values needed in computation of capacity.
-        # constants c, Y, Ks tabulated, depend on entrance type, from FHWA engineering pub HIF12026, appendix A
-        Culvert_Area = culvert['xArea_sqm'] # Calculated in input data prep script sq. meter
-        HW = culvert['HW_m'] # Hydraulic head above the culvert invert, meters
-        D = culvert['D_m'] # Diameter or dimension b, (height of culvert) meters
-        Y = culvert['Y']
-        Ks = culvert['ks'] # -0.5, except where inlet is mitered in which case +0.7
-        S = culvert['Culvert_Sl'] # meter/meter
-        c = culvert['c']
-        
-        Ku = 1.811 # adjustment factor for units (SI=1.811)
-              
-        # Calculate capacity for the culvert and store with the rest of the data for that culvert.
-        culvert['Qc'] = (Culvert_Area * numpy.sqrt(D * ((HW / D) - Y - Ks * S) / c)) / Ku 
+    Ku = 1.811 # adjustment factor for units (SI=1.811)
+
+    # Calculate capacity for every culvert at once.
+    with numpy.errstate(invalid = 'ignore', divide = 'ignore'):
+        Qc = (Culvert_Area * numpy.sqrt(D * ((HW / D) - Y - Ks * S) / c)) / Ku
         #Culvert capacity submerged outlet, inlet control (m^3/s)?
 
-    # Now produce output data using this.
-    output_data = []
+    # Sum together the capacities of the culverts at each crossing. The first culvert of
+    # each crossing is the representative one, whose details go in the output.
+    # If there is just a single culvert (Flags = 0), this simply gets the Qc value for that culvert.
+    crossing = crossing_groups(culvert_geometry)
+    crossing_ids, first_culvert, culvert_crossing = numpy.unique(crossing, return_index = True, return_inverse = True)
+    Qf = numpy.bincount(culvert_crossing, weights = Qc, minlength = len(crossing_ids))
 
-    num_culverts = len(valid_rows)
-    cur_culvert_index = 0
+    # Put the crossings back in the order they first appear.
+    order = numpy.argsort(first_culvert, kind = 'mergesort')
+    first_culvert = first_culvert[order]
+    Qf = Qf[order]
+
+    # Crossings found by location get their number of culverts from the culverts found
+    # (in the Flags format: 0 for 1 culvert).
+    Flags = culvert_geometry['Flags'][first_culvert]
+    located = numpy.array([key.startswith('P') for key in crossing[first_culvert].tolist()], dtype = bool)
+    if numpy.any(located):
+        barrels = numpy.bincount(culvert_crossing, minlength = len(crossing_ids))[order]
+        Flags = numpy.where(located, numpy.where(barrels > 1, barrels, 0), Flags)
 
-    # Use a while loop instead of "culverts in valid_rows" because we need to skip some due to multiple-culverts-in-one-spot.
+    # Compose the output data.
+    # Qf is culvert capacity under inlet control
+    return {
+        'BarrierID': culvert_geometry['BarrierID'][first_culvert],
+        'NAACC_ID': culvert_geometry['NAACC_ID'][first_culvert],
+        'Lat': culvert_geometry['Lat'][first_culvert],
+        'Long': culvert_geometry['Long'][first_culvert],
+        'Q': Qf,
+        'Flags': Flags,
+        'Comments': culvert_geometry['Comments'][first_culvert],
+        'Culvert_Area': culvert_geometry['xArea_sqm'][first_culvert]
+    }
+
+# Work out which crossing each culvert belongs to.
+# Culverts at the same crossing share the same Survey_ID (but have different, and not always
+# adjacent, NAACC_IDs), so culverts with a Survey_ID are grouped by it, wherever they are in the file.
+# Culverts without one (blank, or -1 as extract.py writes blank cells) are grouped by location if
+# crossing_distance_m is set, or else by the old rule: a culvert with Flags = n (n >= 2) is grouped
+# with the n - 1 culverts in the rows below it.
+# Confusingly, Flags = 0 means 1 culvert, and 2+ to mean 2+ culverts.
+# Returns an array of crossing keys, one per culvert; culverts of the same crossing share a key
+# (starting with S for a Survey_ID, P for a location and F for Flags).
+def crossing_groups(culvert_geometry):
+    num_culverts = len(culvert_geometry['Flags'])
+    if 'Survey_ID' in culvert_geometry:
+        survey_ids = numpy.asarray(culvert_geometry['Survey_ID'], dtype = object)
+    else:
+        survey_ids = numpy.array([''] * num_culverts, dtype = object)
+    have_survey = (survey_ids != '') & (survey_ids != '-1')
+
+    keys = numpy.empty(num_culverts, dtype = object)
+    keys[have_survey] = ['S' + survey_id for survey_id in survey_ids[have_survey]]
+
+    # Group the rest by location, whatever order they are in.
+    if crossing_distance_m != None:
+        rows = numpy.flatnonzero(~have_survey)
+        crossing = spatial_index.cluster(culvert_geometry['Lat'][rows], culvert_geometry['Long'][rows], crossing_distance_m)
+        keys[rows] = ['P' + str(row) for row in rows[crossing].tolist()]
+        return keys
+
+    # Group the rest by Flags. This only works if the flagged culverts are appropriately grouped
+    # together in the culv_geom.csv (i.e. the second and third culvert at a crossing appear in the
+    # two rows below the first culvert), which is why the Survey_ID is used where there is one.
+    num_culverts_here = numpy.maximum(culvert_geometry['Flags'], 1)
+    cur_culvert_index = 0
     while cur_culvert_index < num_culverts:
-        culvert = valid_rows[cur_culvert_index]
-        num_culverts_here = culvert['Flags'] 
-        if num_culverts_here == 0:
-            num_culverts_here = 1 # Confusingly, Flags = 0 means 1 culvert, and 2+ to mean 2+ culverts, so fix that.
-
-        # Sum together the capacities of the set of culverts at the given spot, and skip processing the latter ones after the first one (that being the representative culvert?)
-        # If there is just a single culvert (Flags = 0), this simply gets the Qc value for that culvert.
-        Qf = 0
-        for offset in range (0, num_culverts_here):
-            Qf += valid_rows[cur_culvert_index + offset]['Qc'] #This only works if the flagged culverts are appropriately grouped together in the culv_geom.csv (i.e. the second and third culvert at a crossing appear in the two rows below the first culvert. Data often, but not always, is pre-packaged this way. Culverts at the same crossing usually share the same SurveyIDs, but have different (and not alwyas adjacent) NAACC_IDs. To fix this, we'll first have to do an array sort by both lat and long, and then fill in flags where culvert collectors left them out. We should also address this data collection issue with Andrew.  
-        cur_culvert_index += num_culverts_here
-
-        # Compose the output data list.
-        # Qf is culvert capacity under inlet control
-        output_data.append([culvert['BarrierID'], culvert['NAACC_ID'], culvert['Lat'], culvert['Long'], Qf, culvert['Flags'], culvert['Comments'], culvert['xArea_sqm']])
-
-    # Finally, save output data.
-    with open(output_filename, 'wb') as output_file:
-        csv_writer = csv.writer(output_file)
-
-        # Header
-        csv_writer.writerow(['BarrierID','NAACC_ID','Lat','Long','Q','Flags','Comments','Culvert_Area']) 
-
-        # Each row.
-        for result in output_data:
-            csv_writer.writerow(result)
+        if have_survey[cur_culvert_index]:
+            cur_culvert_index += 1
+            continue
+        end = min(cur_culvert_index + num_culverts_here[cur_culvert_index], num_culverts)
+        rows_here = numpy.arange(cur_culvert_index, end)
+        rows_here = rows_here[~have_survey[rows_here]]
+        keys[rows_here] = 'F' + str(cur_culvert_index)
+        cur_culvert_index = end
+
+    return keys
+
+# Save culvert capacities to a new file.
+def save(output_filename, capacities):
+    loader.save_columns(output_filename, ['BarrierID','NAACC_ID','Lat','Long','Q','Flags','Comments','Culvert_Area'], capacities)
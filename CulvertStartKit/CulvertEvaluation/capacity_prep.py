@@ -17,6 +17,13 @@
 # on culvert shape, material and inlet type (from FHWA engineering pub
 # HIF12026, appendix A).
 #
+# The c, Y and ks values are looked up in culvert_coefficients.csv, which can be
+# extended with new combinations. Combinations not covered by it take on the
+# filler value 0.99 (e.g. inlet type "other"). The 1.0 values are also filler
+# values and need to be replaced with real values when they can be found. Things
+# that cannot be modelled include all combination culvert material types and
+# Box/Plastic or Metal/any other type of Inlet thats not Headwall  - Sharon
+#
 # Input:  culvert_field_data.csv with the following columns: BarrierID, Field_ID, Lat, Long,
 # Rd_Name, Culv_Mat, In_Type, In_Shape, In_A, In_B, HW, Slope, Length, Out_Shape, Out_A, Out_B
 # Comments, Flags
@@ -29,207 +36,245 @@ import numpy, os, re, csv, loader
 # in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
 
+# Signature for incoming data.
+# This creates a list of dictionaries that stores the relevant headers of
+# the input file and the type of data in the column under that header
+field_data_signature = [
+    {'name': 'BarrierID', 'type': str},
+    #eg: The first element of the list 'field_data_signature' is a dictionary for barrier id.
+    #'BarrierID' is the header of a column of data we want to extract from the input file,containing
+    #data of type strings
+    {'name': 'NAACC_ID', 'type': int},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float},
+    {'name': 'Length', 'type': float},
+    {'name': 'Slope', 'type': float},
+    {'name': 'Comments', 'type': str},
+    {'name': 'In_Shape', 'type': str},
+    {'name': 'In_A', 'type': float},
+    {'name': 'In_B', 'type': float},
+    {'name': 'In_Type', 'type': str},
+    {'name': 'Culv_Mat', 'type': str},
+    #{'name': 'Out_A', 'type': float}, #Tanvi Naidu (6/16/2017)
+    {'name':'HW','type':float}, ##changed from 'Out_A' to 'HW'
+    {'name': 'Flags', 'type': int},
+    # The NAACC survey the culvert was recorded in; all the culverts of one crossing share it.
+    # Field data from before extract.py wrote it doesn't have it.
+    {'name': 'Survey_ID', 'type': str, 'optional': True}
+];
+
+# Signature for the culvert geometry this script produces (the culv_geom file).
+geometry_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'NAACC_ID', 'type': int},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float},
+    {'name': 'HW_m', 'type': float},
+    {'name': 'xArea_sqm', 'type': float},
+    {'name': 'length_m', 'type': float},
+    {'name': 'D_m', 'type': float},
+    {'name': 'c', 'type': float},
+    {'name': 'Y', 'type': float},
+    {'name': 'ks', 'type': float},
+    {'name': 'Culvert_Sl', 'type': float},
+    {'name': 'Comments', 'type': str},
+    {'name': 'Flags', 'type': int},
+    {'name': 'Survey_ID', 'type': str}
+];
+
+# Signature for the coefficient table (see load_coefficients).
+# The coefficients are loaded as strings since they may be left blank.
+coefficients_signature = [
+    {'name': 'Shape', 'type': str},
+    {'name': 'Material', 'type': str},
+    {'name': 'Inlet_Type', 'type': str},
+    {'name': 'c', 'type': str},
+    {'name': 'Y', 'type': str},
+    {'name': 'ks', 'type': str}
+];
+
+# The coefficient table used unless another is given, kept next to this script.
+default_coefficients_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'culvert_coefficients.csv')
+
 #Function for calculations
 def geometry(field_data_input_filename, output_filename):
+    field_data = load_field_data(field_data_input_filename)
+    culvert_geometry = calculate_geometry(field_data)
+    save(output_filename, culvert_geometry)
+
+# Load and validate field data.
+# field_data will now store the relevant data from the field data input file
+# in the columnar format described in loader.py using the signature defined above.
+# Returns a dictionary of columns holding the valid rows.
+def load_field_data(field_data_input_filename):
+    field_data = loader.load_columns(field_data_input_filename, field_data_signature, 1, -1)
+    return loader.valid_columns(field_data)
+
+# Calculate the geometry and coefficients of every culvert.
+# Parameters:
+#   field_data: dictionary of field data columns, as returned by load_field_data.
+#   coefficients: the coefficient table from load_coefficients. Optional; by default
+#       the table in culvert_coefficients.csv is used.
+# Returns a dictionary of culvert geometry columns, in the format of geometry_signature.
+# Everything is calculated for all culverts at once, as arrays.
+def calculate_geometry(field_data, coefficients = None):
+    if coefficients == None:
+        coefficients = default_coefficients()
+
+    # Culverts whose shape we don't know how to calculate an area for can't be modelled,
+    # so leave them out (and say so).
+    Culvert_shape = field_data['In_Shape'] # assigns culvert shape
+    known_shape = numpy.in1d(Culvert_shape, ['Round', 'Elliptical', 'Pipe Arch', 'Box', 'Arch'])
+    if not numpy.all(known_shape):
+        unknown_shapes = numpy.unique(Culvert_shape[~known_shape]).tolist()
+        print "NOTE: skipped " \
+            + str(numpy.count_nonzero(~known_shape)) \
+            + " culverts with a shape that can't be modelled (" \
+            + ", ".join(["'" + shape + "'" for shape in unknown_shapes]) \
+            + ")."
+    barrier = {}
+    for name in field_data:
+        barrier[name] = field_data[name][known_shape]
+    Culvert_shape = barrier['In_Shape']
+
+    # assign unchanged values to variables and convert english units to SI
+    length = barrier['Length'] / 3.2808 # converts culvert length from feet to meters
+    Culvert_Sl = barrier['Slope'] / 100 # converts slope from percent to meter/meter
+    A = barrier['In_A'] / 3.2808 # converts A measurement (width) from feet to meters
+    B = barrier['In_B'] / 3.2808 # converts B measurement (height) from feet to meters; not needed if culvert is round
+
+    Inlet_type = barrier['In_Type']
+    Culvert_material = barrier['Culv_Mat']
+    HW = barrier['HW']
+    #Tanvi Naidu (6/16/2017): Changed from 'Out_A' to 'HW'
+
+    # calculate areas and assign D values (culvert depth) based on culvert shape
+    round_shape = Culvert_shape == 'Round'
+    elliptical_shape = (Culvert_shape == 'Elliptical') | (Culvert_shape == 'Pipe Arch')
+    box_shape = Culvert_shape == 'Box'
+    arch_shape = Culvert_shape == 'Arch'
+    xArea_sqm = numpy.select(
+        [round_shape, elliptical_shape, box_shape, arch_shape],
+        [
+            ((A/2)**2)*3.14159, #Area in m^2, thus diameter in m
+            (A/2)*(B/2)*3.14159,
+            (A)*(B),
+            ((A/2)*(B/2)*3.14159)/2
+        ])
+    D = numpy.where(round_shape, A, B) # if culvert is round, depth is diameter; otherwise depth is B
+
+    # Calculate head over invert by adding dist from road to top of culvert to D
+    H = HW /  3.2808 + D
 
-    # Signature for incoming data.
-    # This creates a list of dictionaries that stores the relevant headers of
-    # the input file and the type of data in the column under that header
-    field_data_signature = [
-        {'name': 'BarrierID', 'type': str},
-        #eg: The first element of the list 'field_data_signature' is a dictionary for barrier id.
-        #'BarrierID' is the header of a column of data we want to extract from the input file,containing
-        #data of type strings
-        {'name': 'NAACC_ID', 'type': int},
-        {'name': 'Lat', 'type': float},
-        {'name': 'Long', 'type': float},
-        {'name': 'Length', 'type': float},
-        {'name': 'Slope', 'type': float},
-        {'name': 'Comments', 'type': str},
-        {'name': 'In_Shape', 'type': str},
-        {'name': 'In_A', 'type': float},
-        {'name': 'In_B', 'type': float},
-        {'name': 'In_Type', 'type': str},
-        {'name': 'Culv_Mat', 'type': str},
-        #{'name': 'Out_A', 'type': float}, #Tanvi Naidu (6/16/2017)
-        {'name':'HW','type':float}, ##changed from 'Out_A' to 'HW'
-        {'name': 'Flags', 'type': int}
-    ];
-
-    # Load and validate field data.
-    # field_data will now store the relevant data from the culvert geometry input file
-    # in the format described in loader.py using the signature defined above.
-    # valid_rows will store all value for the key 'valid_rows' in the dictionary field_data
-    field_data = loader.load(field_data_input_filename, field_data_signature, 1, -1)
-    valid_rows = field_data['valid_rows']
-    
-    # Modify data.
-    output_data = []
-    for barrier in valid_rows:
-
-        # assign unchanged values to variables and convert english units to SI
-        BarrierID = barrier['BarrierID']
-        #eg: stores values for the key 'BarrierID' 
-        NAACC_ID = barrier['NAACC_ID']
-        Lat = barrier['Lat']
-        Long = barrier['Long']
-        length = barrier['Length'] / 3.2808 # converts culvert length from feet to meters
-        Culvert_Sl = barrier['Slope'] / 100 # converts slope from percent to meter/meter
-        comments = barrier['Comments']
-        Culvert_shape = barrier['In_Shape'] # assigns culvert shape
-        A = barrier['In_A'] / 3.2808 # converts A measurement (width) from feet to meters
-
-        # if culvert is not round, need B (height), so convert from feet to meters
-        if Culvert_shape != "Round":
-            B = barrier['In_B'] / 3.2808 
-
-        Inlet_type = barrier['In_Type']
-        Culvert_material = barrier['Culv_Mat']
-        if "Stone" in Culvert_material: # if the word stone exists in the column it is assigned stone 
-            Culvert_material = "Stone" #Sharon 7/11/17
-        Flags = barrier['Flags']
-        HW = barrier['HW']
-        #Tanvi Naidu (6/16/2017): Changed from 'Out_A' to 'HW'
-
-        # calculate areas and assign D values (culvert depth) based on culvert shape
-        if Culvert_shape == "Round":
-            xArea_sqm=((A/2)**2)*3.14159 #Area in m^2, thus diameter in m
-            D=A # if culvert is round, depth is diameter
-        elif Culvert_shape=='Elliptical' or Culvert_shape=='Pipe Arch':
-            xArea_sqm=(A/2)*(B/2)*3.14159
-            D=B # if culvert is eliptical, depth is B
-        elif Culvert_shape=='Box':
-            xArea_sqm=(A)*(B)
-            D=B # if culvert is a box, depth is B
-        elif Culvert_shape=='Arch':
-            xArea_sqm=((A/2)*(B/2)*3.14159)/2
-            D=B # if culvert is an arch, depth is B
-
-        # Calculate head over invert by adding dist from road to top of culvert to D
-        H = HW /  3.2808 + D
-        #Tanvi Naidu (6/16/2017): Changed from 'Out_A' to 'HW'
-       
-        # assign ks (slope coefficient from FHWA engineering pub HIF12026, appendix A)
-        if Inlet_type == 'Mitered to Slope':
-            ks=0.7
+    # assign c and Y values (coefficients based on shape and material from FHWA engineering pub HIF12026, appendix A)
+    # and ks (slope coefficient from the same), all from the coefficient table.
+    c, Y, ks = assign_coefficients(coefficients, Culvert_shape, Culvert_material, Inlet_type)
+
+    return {
+        'BarrierID': barrier['BarrierID'],
+        'NAACC_ID': barrier['NAACC_ID'],
+        'Lat': barrier['Lat'],
+        'Long': barrier['Long'],
+        'HW_m': H,
+        'xArea_sqm': xArea_sqm,
+        'length_m': length,
+        'D_m': D,
+        'c': c,
+        'Y': Y,
+        'ks': ks,
+        'Culvert_Sl': Culvert_Sl,
+        'Comments': barrier['Comments'],
+        'Flags': barrier['Flags'],
+        'Survey_ID': barrier['Survey_ID']
+    }
+
+# Load a table of culvert coefficients (see culvert_coefficients.csv for the default one).
+# Each row of the file gives c, Y and/or ks for a combination of culvert shape, material and inlet type.
+# A '*' matches any value, and a blank c, Y or ks leaves that coefficient alone.
+# More specific rows (fewer '*'s) win over less specific ones, whatever order they are in;
+# between rows that are equally specific, the later row wins.
+# Returns a dictionary holding the lists of shapes, materials and inlet types named in the file
+# and 3-D arrays c, Y and ks indexed by [shape, material, inlet type]. The last index along
+# each axis stands for any value not named in the file.
+def load_coefficients(coefficients_filename):
+    coefficients_data = loader.load(coefficients_filename, coefficients_signature, 1, -1)
+    rows = coefficients_data['valid_rows']
+
+    # Named values, in the order they first appear.
+    shapes = []
+    materials = []
+    inlet_types = []
+    for row in rows:
+        for values, key in [(shapes, 'Shape'), (materials, 'Material'), (inlet_types, 'Inlet_Type')]:
+            if row[key] != '*' and row[key] not in values:
+                values.append(row[key])
+
+    table = {'shapes': shapes, 'materials': materials, 'inlet_types': inlet_types}
+    for name in ['c', 'Y', 'ks']:
+        table[name] = numpy.zeros((len(shapes) + 1, len(materials) + 1, len(inlet_types) + 1))
+
+    # Fill in the table from the least to the most specific rows.
+    def number_of_wildcards(row):
+        return [row['Shape'], row['Material'], row['Inlet_Type']].count('*')
+    for row in sorted(rows, key = number_of_wildcards, reverse = True):
+        shape_index = slice(None) if row['Shape'] == '*' else shapes.index(row['Shape'])
+        material_index = slice(None) if row['Material'] == '*' else materials.index(row['Material'])
+        inlet_index = slice(None) if row['Inlet_Type'] == '*' else inlet_types.index(row['Inlet_Type'])
+        for name in ['c', 'Y', 'ks']:
+            if row[name].strip() != '':
+                table[name][shape_index, material_index, inlet_index] = float(row[name])
+
+    return table
+
+# The default coefficient table, loaded from culvert_coefficients.csv (next to this script) the first time it is needed.
+default_coefficient_table = None
+def default_coefficients():
+    global default_coefficient_table
+    if default_coefficient_table == None:
+        default_coefficient_table = load_coefficients(default_coefficients_filename)
+    return default_coefficient_table
+
+# Look up the c, Y and ks coefficients of many culverts at once.
+# Parameters:
+#   coefficients: a coefficient table from load_coefficients.
+#   shapes, materials, inlet_types: arrays of the shape, material and inlet type of each culvert.
+# Returns the arrays c, Y and ks.
+def assign_coefficients(coefficients, shapes, materials, inlet_types):
+    shape_codes = category_codes(shapes, coefficients['shapes'])
+    material_codes = category_codes(materials, coefficients['materials'], stone_material)
+    inlet_codes = category_codes(inlet_types, coefficients['inlet_types'])
+
+    # One gather per coefficient for all the culverts.
+    c = coefficients['c'][shape_codes, material_codes, inlet_codes]
+    Y = coefficients['Y'][shape_codes, material_codes, inlet_codes]
+    ks = coefficients['ks'][shape_codes, material_codes, inlet_codes]
+    return c, Y, ks
+
+# if the word stone exists in the material it is assigned stone
+def stone_material(material):
+    if "Stone" in material:
+        return "Stone" #Sharon 7/11/17
+    return material
+
+# Convert an array of values (e.g. culvert shapes) into integer codes: the index of each
+# value in named_values, or len(named_values) for values that aren't in it.
+# If rename is given, each value is first passed through it.
+def category_codes(values, named_values, rename = None):
+    # Codes for the (few) distinct values, then spread out to every culvert.
+    unique_values, inverse = numpy.unique(values, return_inverse = True)
+    codes = []
+    for value in unique_values.tolist():
+        if rename != None:
+            value = rename(value)
+        if value in named_values:
+            codes.append(named_values.index(value))
         else:
-            ks=-0.5
-
-        global c #Renders c and y global variables so that they can be accessed outside of their indent levels (i.e. in Ln 199)
-        global Y #Renders c and y global variables so that they can be accessed outside of their indent levels (i.e. in Ln 199)
-
-        c=0.99 #Filler value to define c and y before declared global variables (and identify culverts not covered by inlet type and material combinations)
-        Y=0.99 #Filler value to define c and y before declared global variables (and identify culverts not covered by inlet type and material combinations)
-
-        # assign c and y values (coefficients based on shape and material from FHWA engineering pub HIF12026, appendix A)
-        # no c and y value provide for inlet_type == "other".  Will take on the filler value, 0.99
-        if Culvert_shape=='Arch':
-            if Culvert_material=="Concrete" or Culvert_material=="Stone":
-                if Inlet_type=="Headwall" or Inlet_type=="Projecting":
-                    c=0.041
-                    Y=0.570
-                elif Inlet_type=='Mitered to Slope':
-                    c=0.040
-                    Y=0.48
-                elif Inlet_type=='Wingwall':
-                     c=0.040
-                     Y=0.620
-                elif Inlet_type=='Wingwall and Headwall':
-                     c=0.040
-                     Y=0.620
-            elif Culvert_material=="Plastic" or Culvert_material=="Metal":  #inlet_type to Culvert_material for plastic - sharon 
-                 if Inlet_type=="Headwall":
-                    c=0.043
-                    Y=0.610
-                 elif Inlet_type=='Mitered to Slope':
-                    c=0.0540
-                    Y=0.5
-                 elif Inlet_type== 'Projecting':
-                    c=0.065
-                    Y=0.12
-                 elif Inlet_type == 'Headwall' or Inlet_type == 'Wingwall and Headwall' or Inlet_type=='Wingwall':
-                     c=0.043
-                     Y=0.610
-            elif Culvert_material=="Combination":
-                     c=1.0   #filler values -sharon
-                     Y=1.0    # filler values - sharon
-
-
-
-        elif Culvert_shape=="Box":
-            if Culvert_material=="Concrete" or Culvert_material=="Stone":
-                c=0.038
-                Y=0.870                 
-            elif Culvert_material=="Plastic" or Culvert_material=='Metal':
-                if Inlet_type=='Headwall':
-                    c=0.038
-                    Y=0.690 #put in else statement in case other inlet types exist-Sharon
-                else:
-                    c=1.0
-                    Y=1.0 #filler numbers -Sharon
-            elif Culvert_material=='Wood':
-                c=0.038
-                Y=0.87
-            elif Culvert_material== "Combination":
-                c=1.0
-                Y=1.0   #filler values -Sharon
-
-        elif Culvert_shape=="Elliptical" or Culvert_shape== 'Pipe Arch':
-            if Culvert_material=="Concrete" or Culvert_material=="Stone":
-                c=0.048
-                Y=0.80
-            elif Culvert_material=="Plastic" or Culvert_material=='Metal':
-                if Inlet_type== 'Projecting':
-                    c=0.060
-                    Y=0.75
-                else:
-                    c=0.048
-                    Y=0.80
-
-            elif Culvert_material =="Combination":
-                  c=1.0
-                  Y=1.0  #filler -Sharon
-        
-        elif Culvert_shape=="Round":
-            if Culvert_material=="Concrete" or Culvert_material=="Stone":
-                if Inlet_type== 'Projecting':
-                    c=0.032
-                    Y=0.69
-                else:
-                    c=0.029
-                    Y=0.74
-            elif Culvert_material=="Plastic" or Culvert_material=='Metal':
-                if Inlet_type == 'Projecting':
-                    c=0.055
-                    Y=0.54
-                elif Inlet_type =='Mitered to Slope':
-                    c=0.046
-                    Y=0.75
-                else:
-                    c=0.038
-                    Y=0.69
-            elif Culvert_material == "Combination":
-                c=1.0
-                Y=1.0 #filler-Sharon
-
-
-        #all filler values i.e. 1.0 need to be replaced with real values when they can be found. things that cannot be modelled include
-        #all combination culvert material types and Box/Plastic or Metal/any other type of Inlet thats not Headwall  - Sharon
-
-        # Add current output row to output_data
-        output_data.append([BarrierID, NAACC_ID, Lat, Long, H, xArea_sqm, length, D, c, Y, ks, Culvert_Sl, comments, Flags])
-
-    
-    # Set up to save results to new file.
-    with open(output_filename, 'wb') as output_file:
-        csv_writer = csv.writer(output_file)
-
-        # Header
-        csv_writer.writerow(['BarrierID', 'NAACC_ID', 'Lat', 'Long', 'HW_m', 'xArea_sqm', 'length_m', 'D_m', 'c', 'Y', 'ks', 'Culvert_Sl', 'Comments', 'Flags'])
-
-        # Each row.
-        for row in output_data:
-            csv_writer.writerow(row)
- 
-                    
-        
+            codes.append(len(named_values))
+    return numpy.array(codes, dtype = numpy.int64)[inverse]
+
+# Save culvert geometry to a new file.
+def save(output_filename, culvert_geometry):
+    headers = []
+    for header in geometry_signature:
+        headers.append(header['name'])
+    loader.save_columns(output_filename, headers, culvert_geometry)
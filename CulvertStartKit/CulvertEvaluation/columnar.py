@@ -0,0 +1,183 @@
+# Binary columnar tables
+# October 2026
+#
+# A faster alternative to csv for the files passed between the steps of the model
+# (sorted_ws, runoff, culv_geom and capacity_output). A table is a folder whose name
+# ends in '.cols', holding one numpy .npy file per column and a schema.json describing
+# them, e.g.:
+#
+#   ALB_culv_geom.cols/
+#       schema.json     {"format": "culvert columns", "version": 1, "rows": 1234,
+#                        "columns": [{"name": "BarrierID", "type": "str", "file": "column_0.npy"}, ...]}
+#       column_0.npy
+#       ...
+#
+# Column types are those of the loader signatures (float, int or str), and numbers are
+# stored exactly as the model holds them (float64 and int64), so nothing needs parsing.
+# Number columns are read memory-mapped (read-only), so they are not copied into memory
+# until they are used. Text columns are stored as fixed-width byte strings and turned
+# back into the object arrays the rest of the model expects when read.
+#
+# loader.load_columns and loader.save_columns use this module for any filename ending
+# in '.cols', so every step can read and write these tables just as it does csv files.
+#
+# Usage:
+#   columnar.save('ALB/ALB_culv_geom.cols', ['BarrierID', 'Q'], columns)
+#   columns = columnar.load('ALB/ALB_culv_geom.cols', capacity.geometry_signature)
+
+import json, os, sys
+import numpy
+
+# Ending of the folder name of a columnar table.
+extension = '.cols'
+schema_filename = 'schema.json'
+format_name = 'culvert columns'
+format_version = 1
+
+# Type name saved in the schema for each signature type.
+type_names = {float: 'float', int: 'int', str: 'str'}
+
+# Whether a filename is a columnar table (rather than a csv file).
+def is_columnar(filename):
+    return filename.rstrip('/\\').endswith(extension)
+
+# Save a dictionary of columns as a columnar table.
+# Parameters:
+#   directory: the folder to save the table in (its name should end in '.cols').
+#   headers: list of the header names to save, in order. Each must be a key of columns.
+#   columns: dictionary mapping header names to arrays (or lists) of equal length.
+# The type of each column comes from its array: float arrays are saved as float,
+# integer arrays as int, and anything else as str.
+def save(directory, headers, columns):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    else:
+        # Clear out the files of any table saved here before.
+        for filename in os.listdir(directory):
+            if filename.endswith('.npy') or filename == schema_filename:
+                os.remove(os.path.join(directory, filename))
+
+    schema_columns = []
+    num_rows = None
+    for i in range(len(headers)):
+        column = numpy.asarray(columns[headers[i]])
+        if numpy.issubdtype(column.dtype, numpy.floating):
+            column_type = 'float'
+            column = column.astype(numpy.float64)
+        elif numpy.issubdtype(column.dtype, numpy.integer) or column.dtype == bool:
+            column_type = 'int'
+            column = column.astype(numpy.int64)
+        else:
+            column_type = 'str'
+            column = numpy.array([str(value) for value in column.tolist()], dtype = numpy.string_)
+        if num_rows == None:
+            num_rows = len(column)
+        elif len(column) != num_rows:
+            print "ERROR: column " + headers[i] + " of table '" + directory + "' has " \
+                + str(len(column)) + " rows instead of " + str(num_rows) + ". Bailing out."
+            sys.exit(0)
+
+        column_filename = 'column_' + str(i) + '.npy'
+        numpy.save(os.path.join(directory, column_filename), column)
+        schema_columns.append({'name': headers[i], 'type': column_type, 'file': column_filename})
+
+    # The schema goes last, so a table is only complete once it has one.
+    with open(os.path.join(directory, schema_filename), 'w') as schema_file:
+        json.dump({
+            'format': format_name,
+            'version': format_version,
+            'rows': num_rows or 0,
+            'columns': schema_columns
+        }, schema_file, indent = 2)
+
+# Load the columns of a signature from a columnar table.
+# Parameters:
+#   directory: the folder of the table.
+#   required_headers: the signature of the headers and their data types, as for loader.load.
+# Returns a dictionary mapping each header name to its array (like loader.valid_columns).
+# If the table is missing, a header is missing or a column has the wrong type, gives an error and exits.
+def load(directory, required_headers):
+    schema = load_schema(directory)
+    num_rows = schema['rows']
+    schema_columns = {}
+    for column in schema['columns']:
+        schema_columns[column['name']] = column
+
+    # Find each header of the signature in the schema, with the right type.
+    missing_headers = []
+    wrong_types = []
+    for header in required_headers:
+        column = schema_columns.get(header['name'])
+        if column == None:
+            if not header.get('optional', False):
+                missing_headers.append(header['name'])
+        elif column['type'] != type_names.get(header['type'], 'str'):
+            wrong_types.append(header['name'] + " (" + column['type'] + ", not " + type_names.get(header['type'], 'str') + ")")
+    if len(missing_headers) > 0:
+        print "ERROR: table '" + directory + "' was missing the following required headers: " \
+            + ", ".join(missing_headers) + ". Bailing out."
+        sys.exit(0)
+    if len(wrong_types) > 0:
+        print "ERROR: table '" + directory + "' had the wrong type for the following headers: " \
+            + ", ".join(wrong_types) + ". Bailing out."
+        sys.exit(0)
+
+    columns = {}
+    for header in required_headers:
+        column = schema_columns.get(header['name'])
+        if column == None:
+            # Optional header missing from the table (see loader.py).
+            columns[header['name']] = missing_column(header['type'], num_rows)
+            continue
+        values = numpy.load(os.path.join(directory, column['file']), mmap_mode = 'r')
+        if column['type'] == 'str':
+            values = values.astype(object)
+        columns[header['name']] = values
+    return columns
+
+# Load the schema of a columnar table, giving an error and exiting if there is none.
+def load_schema(directory):
+    try:
+        with open(os.path.join(directory, schema_filename), 'r') as schema_file:
+            schema = json.load(schema_file)
+    except IOError:
+        print "ERROR: Could not find table '" + directory + "'. Bailing out."
+        sys.exit(0)
+    if schema.get('format') != format_name or schema.get('version') != format_version:
+        print "ERROR: '" + directory + "' is not a version " + str(format_version) + " columnar table. Bailing out."
+        sys.exit(0)
+    # json gives back unicode names; the model's headers are plain strings.
+    for column in schema['columns']:
+        column['name'] = str(column['name'])
+        column['type'] = str(column['type'])
+        column['file'] = str(column['file'])
+    return schema
+
+# Export a columnar table as a csv file, with the same headers in the same order.
+# The csv file is the same as the one the step would have written itself.
+def export_csv(directory, csv_filename):
+    import loader
+    schema = load_schema(directory)
+    signature = []
+    headers = []
+    for column in schema['columns']:
+        signature.append({'name': column['name'], 'type': {'float': float, 'int': int}.get(column['type'], str)})
+        headers.append(column['name'])
+    loader.save_columns(csv_filename, headers, load(directory, signature))
+
+# A column filled with the filler value of its type (as loader.column_fill_value).
+def missing_column(header_type, num_rows):
+    if header_type == float:
+        return numpy.full(num_rows, numpy.nan)
+    elif header_type == int:
+        return numpy.zeros(num_rows, dtype = numpy.int64)
+    return numpy.array([''] * num_rows, dtype = object)
+
+# Run this file to export columnar tables as csv, e.g.:
+#   python columnar.py ALB/ALB_culv_geom.cols ALB/ALB_capacity_output.cols
+# saves ALB/ALB_culv_geom.csv and ALB/ALB_capacity_output.csv.
+if __name__ == '__main__':
+    for directory in sys.argv[1:]:
+        csv_filename = directory.rstrip('/\\')[:-len(extension)] + '.csv'
+        export_csv(directory, csv_filename)
+        print "Saved " + csv_filename
@@ -0,0 +1,502 @@
+# Watershed delineation
+# October 2026
+#
+# Delineates the watershed of every culvert from a DEM, so the watershed table sorter.sort reads
+# (BarrierID, Area_sqkm, Tc_hr, CN) can be made without ArcGIS (CulvertTools.tbx), e.g. on a
+# Linux machine. Plain python and numpy.
+#
+# The DEM is one or more tiles of ESRI binary floating point grids (.flt, each with its .hdr,
+# as ArcGIS's Raster to Float writes them), e.g. the tiles in GIS_files/DEMs. The tiles are
+# memory-mapped and copied a chunk of rows at a time into one grid; they must have the same
+# cell size and line up. Coordinates (of the DEM and of the culverts) must be in a projected
+# coordinate system in meters, e.g. UTM.
+#
+# Every grid is a numpy array of 4-byte values: elevations in float32, like the .flt files, and
+# cells (flow direction, flow order, labels) as 32-bit indexes (64-bit for grids of more than
+# 2^31 cells). Delineating takes about 45 bytes of memory per cell of the DEM at its peak (plus
+# 8 per cell for the flow paths of time_of_concentration.py), e.g. about 3 GB for a county's
+# 10 m DEM of 60 million cells; a bigger area can be delineated in parts, a basin at a time.
+#
+# The steps are the usual ones:
+#   1. Fill depressions (priority-flood, raising each filled cell to the next float32 value above
+#      the one it drains to, so filled flats drain too). This is the only step that goes cell by
+#      cell; cells filled in a depression go in a plain queue rather than the priority queue.
+#   2. Flow direction (D8: each cell drains to the neighbor it drops to most steeply).
+#   3. Flow order: cells in levels, each level draining only to later levels. This gives
+#      flow accumulation (the number of cells draining through each cell) a level at a time.
+#   4. Snap each culvert to the cell of most flow accumulation near it (as ArcGIS's Snap Pour
+#      Point does), and label every cell with the first culvert it drains through, a level at
+#      a time from the outlets upstream. The watershed of a culvert is its labeled cells plus
+#      the watersheds of the culverts upstream of it; its area is the flow accumulation of its cell.
+#
+# CN is worked out from land cover and soil group grids, if given (see zonal_stats.py), and
+# Tc_hr from the longest flow paths, if a method is given (see time_of_concentration.py).
+# Otherwise they can be taken from an earlier watershed table (e.g. an ArcGIS export) for the
+# culverts it has.
+#
+# Usage:
+#   python delineation.py DEM_folder culvert_points output_file [--snap meters] [--earlier table]
+#       [--land-cover grid.flt --soil-groups grid.flt [--curve-numbers table.csv]]
+#       [--tc-method kirpich|tr55|velocity [--precip NRCC_file] [--flow-paths file.npz]]
+#   e.g. python delineation.py ../../GIS_files/DEMs ../../All_Culverts_shapefile/All_Culverts.shp ALB/All_culverts.csv --snap 30
+# The culvert points are a shapefile of points, or a csv file with BarrierID, X and Y columns.
+# Or from other scripts:
+#   dem = delineation.load_dem('../../GIS_files/DEMs')
+#   watersheds = delineation.delineate(dem, barrier_ids, x, y, 30.0)
+
+import argparse, collections, glob, heapq, math, os, sys
+import numpy
+import loader
+
+# Signature of the culvert points file (a shapefile's X and Y are its points).
+culvert_points_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'X', 'type': float},
+    {'name': 'Y', 'type': float}
+]
+
+# About how many cells to work on at a time, where a whole grid isn't needed at once.
+chunk_cells = 4 * 1024 * 1024
+
+# The 8 neighbors of a cell, as (row, column) offsets, and the distance to each (in cells).
+neighbor_offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+neighbor_distances = [math.hypot(offset[0], offset[1]) for offset in neighbor_offsets]
+
+# Read the .hdr file of a grid.
+# Returns a dictionary with ncols, nrows, xllcorner, yllcorner, cellsize, nodata_value and byteorder.
+def read_header(filename):
+    header = {'nodata_value': None, 'byteorder': 'LSBFIRST'}
+    with open(filename, 'r') as header_file:
+        for line in header_file:
+            parts = line.split()
+            if len(parts) >= 2:
+                header[parts[0].lower()] = parts[1]
+    for key in ['ncols', 'nrows', 'cellsize']:
+        if key not in header:
+            print "ERROR: grid header '" + filename + "' has no " + key + ". Bailing out."
+            sys.exit(0)
+    grid = {
+        'ncols': int(header['ncols']),
+        'nrows': int(header['nrows']),
+        'cellsize': float(header['cellsize']),
+        'nodata_value': float(header['nodata_value']) if header['nodata_value'] != None else None,
+        'byteorder': header['byteorder'].upper()
+    }
+    # Corners, or the centers of the corner cells.
+    if 'xllcorner' in header:
+        grid['xllcorner'] = float(header['xllcorner'])
+        grid['yllcorner'] = float(header['yllcorner'])
+    else:
+        grid['xllcorner'] = float(header['xllcenter']) - grid['cellsize'] / 2
+        grid['yllcorner'] = float(header['yllcenter']) - grid['cellsize'] / 2
+    return grid
+
+# Memory-map the cells of a .flt grid, as a read-only array of rows (north first).
+def map_grid(filename, header):
+    dtype = '>f4' if header['byteorder'] in ['MSBFIRST', 'M'] else '<f4'
+    return numpy.memmap(filename, dtype = dtype, mode = 'r', shape = (header['nrows'], header['ncols']))
+
+# The numpy type of the indexes of the cells of a grid of the given number of cells.
+def index_dtype(num_cells):
+    if num_cells < 2 ** 31:
+        return numpy.int32
+    return numpy.int64
+
+# Load a DEM: a .flt file, or a folder of .flt tiles.
+# Returns a dictionary with:
+#   elevation: float32 array of rows (north first) of the elevation of each cell, nan where
+#       there is no data.
+#   padded: the same cells with a ring of nan cells around them (see pad); elevation is its inside.
+#   xllcorner, yllcorner: the lower left corner of the grid.
+#   cellsize: the width of each cell.
+def load_dem(path):
+    if os.path.isdir(path):
+        filenames = sorted(glob.glob(os.path.join(path, '*.flt')))
+    else:
+        filenames = [path]
+    if len(filenames) == 0:
+        print "ERROR: there are no DEM tiles (.flt files) in '" + path + "'. Bailing out."
+        sys.exit(0)
+
+    tiles = []
+    for filename in filenames:
+        header = read_header(os.path.splitext(filename)[0] + '.hdr')
+        tiles.append((filename, header))
+    cellsize = tiles[0][1]['cellsize']
+    for filename, header in tiles:
+        if abs(header['cellsize'] - cellsize) > cellsize * 1e-6:
+            print "ERROR: DEM tile '" + filename + "' has a different cell size than '" + tiles[0][0] + "'. Bailing out."
+            sys.exit(0)
+
+    # The extent of all the tiles.
+    xmin = min([header['xllcorner'] for filename, header in tiles])
+    ymin = min([header['yllcorner'] for filename, header in tiles])
+    xmax = max([header['xllcorner'] + header['ncols'] * cellsize for filename, header in tiles])
+    ymax = max([header['yllcorner'] + header['nrows'] * cellsize for filename, header in tiles])
+    ncols = int(round((xmax - xmin) / cellsize))
+    nrows = int(round((ymax - ymin) / cellsize))
+
+    padded = numpy.full((nrows + 2, ncols + 2), numpy.nan, dtype = numpy.float32)
+    elevation = padded[1:-1, 1:-1]
+    for filename, header in tiles:
+        column = int(round((header['xllcorner'] - xmin) / cellsize))
+        row = int(round((ymax - (header['yllcorner'] + header['nrows'] * cellsize)) / cellsize))
+        cells = map_grid(filename, header)
+        chunk = max(1, chunk_cells // header['ncols'])
+        for start in range(0, header['nrows'], chunk):
+            values = numpy.array(cells[start:start + chunk], dtype = numpy.float32)
+            if header['nodata_value'] != None:
+                values[values == numpy.float32(header['nodata_value'])] = numpy.nan
+            block = elevation[row + start:row + start + len(values), column:column + header['ncols']]
+            # Where tiles overlap, the first tile with data wins.
+            missing = numpy.isnan(block)
+            block[missing] = values[missing]
+        del cells
+    return {'elevation': elevation, 'padded': padded, 'xllcorner': xmin, 'yllcorner': ymin, 'cellsize': cellsize}
+
+# The cells of a grid, padded with a ring of nan cells (so every cell has 8 neighbors),
+# as one flat float32 array. Returns the flat array and the width of a padded row.
+def pad(elevation):
+    padded = numpy.full((elevation.shape[0] + 2, elevation.shape[1] + 2), numpy.nan, dtype = numpy.float32)
+    padded[1:-1, 1:-1] = elevation
+    return padded.ravel(), elevation.shape[1] + 2
+
+# The padded cells of a DEM (see pad), without copying them if load_dem already padded them.
+def padded_cells(dem):
+    if 'padded' in dem:
+        return dem['padded'].ravel(), dem['padded'].shape[1]
+    return pad(dem['elevation'])
+
+# The offset of each neighbor in a flat padded grid with rows of the given width.
+def flat_offsets(width):
+    return [row * width + column for row, column in neighbor_offsets]
+
+# The next float32 value above a float32 value (level), as a python float.
+def next_float32_up(level):
+    if level == 0:
+        return math.ldexp(1.0, -149)
+    mantissa, exponent = math.frexp(level)
+    # Just below a power of 2, towards zero, the values are twice as close together.
+    if mantissa == -0.5:
+        exponent -= 1
+    return level + math.ldexp(1.0, exponent - 24)
+
+# Fill the depressions of a padded DEM (priority-flood), so every cell drains off the edge
+# of the data. Returns the filled elevations (a new float32 array).
+def fill_depressions(padded, width):
+    filled = numpy.array(padded, dtype = numpy.float32)
+    grid = filled.reshape(-1, width)
+    valid = numpy.isfinite(grid)
+    # The edge of the data: cells with a neighbor without data.
+    edge = numpy.zeros(grid.shape, dtype = bool)
+    inside = valid[1:-1, 1:-1]
+    for row_offset, column_offset in neighbor_offsets:
+        neighbor_valid = valid[1 + row_offset:grid.shape[0] - 1 + row_offset, 1 + column_offset:width - 1 + column_offset]
+        edge[1:-1, 1:-1] |= inside & ~neighbor_valid
+    closed = (~valid | edge).ravel()
+    del valid, inside
+
+    queue = zip(filled[edge.ravel()].tolist(), numpy.flatnonzero(edge).tolist())
+    del edge
+    heapq.heapify(queue)
+    # Cells raised in a depression are as low as any in the queue, so they go first, in order.
+    pit = collections.deque()
+    offsets = flat_offsets(width)
+    elevation_of = filled.item
+    set_elevation = filled.itemset
+    is_closed = closed.item
+    close = closed.itemset
+    while len(pit) > 0 or len(queue) > 0:
+        if len(pit) > 0:
+            cell = pit.popleft()
+            level = elevation_of(cell)
+        else:
+            level, cell = heapq.heappop(queue)
+        for offset in offsets:
+            neighbor = cell + offset
+            if is_closed(neighbor):
+                continue
+            close(neighbor, True)
+            neighbor_level = elevation_of(neighbor)
+            if neighbor_level <= level:
+                set_elevation(neighbor, next_float32_up(level))
+                pit.append(neighbor)
+            else:
+                heapq.heappush(queue, (neighbor_level, neighbor))
+    return filled
+
+# D8 flow direction of a filled, padded DEM.
+# Returns an array of the (flat padded) cell each cell drains to, or -1 for cells
+# without data and cells at the edge that drain off it.
+def flow_directions(filled, width):
+    grid = filled.reshape(-1, width)
+    center = grid[1:-1, 1:-1]
+    # The steepest drop from each cell, and the neighbor (its index in neighbor_offsets) it is to.
+    steepest = numpy.zeros(center.shape, dtype = numpy.float32)
+    direction = numpy.full(center.shape, -1, dtype = numpy.int8)
+    for index, (row_offset, column_offset) in enumerate(neighbor_offsets):
+        neighbor = grid[1 + row_offset:grid.shape[0] - 1 + row_offset, 1 + column_offset:width - 1 + column_offset]
+        with numpy.errstate(invalid = 'ignore'):
+            drop = (center - neighbor) / numpy.float32(neighbor_distances[index])
+            steeper = drop > steepest # False for cells and neighbors without data (nan).
+        steepest[steeper] = drop[steeper]
+        direction[steeper] = index
+    del steepest
+
+    downstream = numpy.full(len(filled), -1, dtype = index_dtype(len(filled)))
+    inside = downstream.reshape(-1, width)[1:-1, 1:-1]
+    offsets = numpy.array(flat_offsets(width), dtype = downstream.dtype)
+    columns = numpy.arange(1, width - 1, dtype = downstream.dtype)
+    chunk = max(1, chunk_cells // width)
+    for start in range(0, center.shape[0], chunk):
+        chunk_direction = direction[start:start + chunk]
+        rows = numpy.arange(start + 1, start + 1 + len(chunk_direction), dtype = downstream.dtype)
+        cells = rows[:, numpy.newaxis] * width + columns
+        inside[start:start + chunk] = numpy.where(chunk_direction >= 0, cells + offsets[chunk_direction], -1)
+    return downstream
+
+# Order the cells with data by flow: a list of arrays of cells (levels), where every cell drains
+# to a cell of a later level (or off the edge). The first level is the cells nothing drains into.
+def flow_order(downstream, has_data):
+    # The number of cells draining into each cell (at most 8), a chunk of cells at a time.
+    inflows = numpy.zeros(len(downstream), dtype = numpy.uint8)
+    for start in range(0, len(downstream), chunk_cells):
+        targets = downstream[start:start + chunk_cells]
+        targets = targets[targets >= 0]
+        if len(targets) > 0:
+            lowest = targets.min()
+            counts = numpy.bincount(targets - lowest)
+            inflows[lowest:lowest + len(counts)] += counts.astype(numpy.uint8)
+    level = numpy.flatnonzero(has_data & (inflows == 0)).astype(downstream.dtype)
+    levels = []
+    while len(level) > 0:
+        levels.append(level)
+        targets = downstream[level]
+        targets = targets[targets >= 0]
+        numpy.subtract.at(inflows, targets, 1)
+        targets = numpy.unique(targets)
+        level = targets[inflows[targets] == 0]
+    return levels
+
+# Flow accumulation: for each cell, the sum of the weights of the cells that drain through it
+# (itself included). The weights are 1 for each cell with data if not given, and the
+# accumulation then the number of cells (as cell indexes).
+def flow_accumulation(downstream, levels, weights = None):
+    if weights is None:
+        accumulation = numpy.zeros(len(downstream), dtype = downstream.dtype)
+        for level in levels:
+            accumulation[level] = 1
+    else:
+        accumulation = numpy.array(weights, dtype = numpy.float64)
+    for level in levels:
+        targets = downstream[level]
+        drains = targets >= 0
+        numpy.add.at(accumulation, targets[drains], accumulation[level[drains]])
+    return accumulation
+
+# The (flat padded) cell each point is in, or -1 for points outside the grid.
+def point_cells(dem, width, x, y):
+    nrows, ncols = dem['elevation'].shape
+    ytop = dem['yllcorner'] + nrows * dem['cellsize']
+    with numpy.errstate(invalid = 'ignore'):
+        column = numpy.floor((numpy.asarray(x) - dem['xllcorner']) / dem['cellsize'])
+        row = numpy.floor((ytop - numpy.asarray(y)) / dem['cellsize'])
+        inside = (column >= 0) & (column < ncols) & (row >= 0) & (row < nrows)
+    cells = numpy.full(len(column), -1, dtype = numpy.int64)
+    cells[inside] = (row[inside].astype(numpy.int64) + 1) * width + column[inside].astype(numpy.int64) + 1
+    return cells
+
+# Move each cell to the cell of most flow accumulation within the snap distance (in cells).
+def snap_cells(cells, accumulation, width, snap_cells_distance):
+    snapped = cells.copy()
+    inside = cells >= 0
+    best = numpy.where(inside, accumulation[numpy.maximum(cells, 0)], -1)
+    reach = int(snap_cells_distance)
+    num_rows = len(accumulation) // width
+    row, column = numpy.divmod(cells[inside], width)
+    for row_offset in range(-reach, reach + 1):
+        for column_offset in range(-reach, reach + 1):
+            if math.hypot(row_offset, column_offset) > snap_cells_distance:
+                continue
+            # The padding ring has no data, so clipping to it is safe.
+            candidate = numpy.clip(row + row_offset, 0, num_rows - 1) * width + numpy.clip(column + column_offset, 0, width - 1)
+            more = accumulation[candidate] > best[inside]
+            where = numpy.flatnonzero(inside)[more]
+            best[where] = accumulation[candidate[more]]
+            snapped[where] = candidate[more]
+    return snapped
+
+# Label every cell with the first outlet it drains through.
+# Parameters:
+#   outlets: array of the (flat padded) cells of the outlets.
+# Returns an array with, for each cell, the index in outlets of the first outlet it drains
+# through (itself, if it is one), or -1 if it doesn't drain through any.
+# outlets must be in order (as numpy.unique gives them).
+def watershed_labels(downstream, levels, outlets):
+    labels = numpy.full(len(downstream), -1, dtype = downstream.dtype)
+    if len(outlets) == 0:
+        return labels
+    for level in reversed(levels):
+        targets = downstream[level]
+        inherited = numpy.where(targets >= 0, labels[numpy.maximum(targets, 0)], -1)
+        # Which of the cells are outlets themselves.
+        position = numpy.minimum(numpy.searchsorted(outlets, level), len(outlets) - 1)
+        labels[level] = numpy.where(outlets[position] == level, position, inherited)
+    return labels
+
+# Delineate the watershed of each culvert.
+# Parameters:
+#   dem: a DEM, from load_dem.
+#   barrier_ids: the BarrierID of each culvert.
+#   x, y: arrays of the location of each culvert.
+#   snap_distance_m: how far (in meters) a culvert may be moved onto the stream. Optional.
+# Returns a dictionary with:
+#   BarrierID, Area_sqkm: arrays with the area of the watershed of each culvert (nan for
+#       culverts outside the DEM).
+#   cell: the (flat padded) cell of each culvert (-1 if outside the DEM).
+#   outlets: array of the distinct culvert cells; outlet: the index in outlets of each
+#       culvert's cell (-1 if outside the DEM).
+#   labels: for each cell, the index in outlets of the first culvert it drains through, or -1.
+#   downstream_outlet: for each outlet, the index of the next outlet its water reaches, or -1.
+#   filled, downstream, levels, accumulation: the filled elevations, flow direction, flow
+#       order and flow accumulation.
+#   width, shape: the width of a padded row and the shape of the (unpadded) DEM.
+def delineate(dem, barrier_ids, x, y, snap_distance_m = 0.0):
+    padded, width = padded_cells(dem)
+    filled = fill_depressions(padded, width)
+    downstream = flow_directions(filled, width)
+    levels = flow_order(downstream, numpy.isfinite(padded))
+    accumulation = flow_accumulation(downstream, levels)
+
+    cells = point_cells(dem, width, x, y)
+    if snap_distance_m > 0:
+        cells = snap_cells(cells, accumulation, width, snap_distance_m / dem['cellsize'])
+    inside = cells >= 0
+    # Culverts outside the data count as outside too.
+    inside[inside] = accumulation[cells[inside]] > 0
+    cells[~inside] = -1
+
+    outlets, outlet = numpy.unique(cells[inside], return_inverse = True)
+    culvert_outlet = numpy.full(len(cells), -1, dtype = numpy.int64)
+    culvert_outlet[inside] = outlet
+    labels = watershed_labels(downstream, levels, outlets)
+    next_cells = downstream[outlets]
+    downstream_outlet = numpy.where(next_cells >= 0, labels[numpy.maximum(next_cells, 0)], -1)
+
+    cell_area_sqkm = dem['cellsize'] ** 2 / 1e6
+    area = numpy.full(len(cells), numpy.nan)
+    area[inside] = accumulation[cells[inside]] * cell_area_sqkm
+    return {
+        'BarrierID': numpy.asarray(barrier_ids, dtype = object),
+        'Area_sqkm': area,
+        'cell': cells,
+        'outlets': outlets,
+        'outlet': culvert_outlet,
+        'labels': labels,
+        'downstream_outlet': downstream_outlet,
+        'filled': filled,
+        'downstream': downstream,
+        'levels': levels,
+        'accumulation': accumulation,
+        'width': width,
+        'shape': dem['elevation'].shape
+    }
+
+# Totals over the whole watershed of each outlet, from totals over the cells labeled with it
+# (its own part): each outlet's total plus those of all the outlets upstream of it.
+def upstream_totals(own_totals, downstream_outlet):
+    totals = numpy.array(own_totals, dtype = numpy.float64)
+    # Outlets in flow order: an outlet's total is complete once every outlet draining into it has added to it.
+    inflows = numpy.bincount(downstream_outlet[downstream_outlet >= 0], minlength = len(totals))
+    level = numpy.flatnonzero(inflows == 0)
+    while len(level) > 0:
+        targets = downstream_outlet[level]
+        drains = targets >= 0
+        numpy.add.at(totals, targets[drains], totals[level[drains]])
+        numpy.subtract.at(inflows, targets[drains], 1)
+        targets = numpy.unique(targets[drains])
+        level = targets[inflows[targets] == 0]
+    return totals
+
+# The labels of the cells as a grid of rows (north first), without the padding, e.g. to save.
+def label_grid(watersheds):
+    nrows, ncols = watersheds['shape']
+    return watersheds['labels'].reshape(nrows + 2, ncols + 2)[1:-1, 1:-1]
+
+# Save the watershed table (as ArcGIS exports it, with an FID column) for sorter.sort.
+# Parameters:
+#   watersheds: from delineate.
+#   tc_hr, cn: arrays of the Tc_hr and CN of each culvert; nan where unknown, which are
+#       left blank (so the sorter reports those culverts).
+# Culverts outside the DEM are left out.
+def save_watershed_table(filename, watersheds, tc_hr, cn):
+    inside = watersheds['cell'] >= 0
+    columns = {
+        'FID': range(int(numpy.sum(inside))),
+        'BarrierID': watersheds['BarrierID'][inside],
+        'Area_sqkm': watersheds['Area_sqkm'][inside]
+    }
+    for name, values in [('Tc_hr', tc_hr), ('CN', cn)]:
+        values = numpy.asarray(values, dtype = numpy.float64)[inside]
+        columns[name] = ['' if numpy.isnan(value) else value for value in values.tolist()]
+    loader.save_columns(filename, ['FID', 'BarrierID', 'Area_sqkm', 'Tc_hr', 'CN'], columns)
+
+# The Tc_hr and CN of each culvert in an earlier watershed table (nan for those not in it).
+def earlier_values(filename, barrier_ids):
+    import sorter
+    table = loader.valid_columns(loader.load_columns(filename, sorter.watershed_data_signature, 1, -1))
+    index = dict(zip(table['BarrierID'].tolist(), range(len(table['BarrierID']))))
+    found = numpy.array([index.get(barrier_id, -1) for barrier_id in barrier_ids], dtype = numpy.int64)
+    values = {}
+    for name in ['Tc_hr', 'CN']:
+        values[name] = numpy.full(len(found), numpy.nan)
+        values[name][found >= 0] = table[name][found[found >= 0]]
+    return values
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Delineate the watershed of every culvert from a DEM.')
+    parser.add_argument('dem', help = 'a .flt DEM, or a folder of .flt tiles')
+    parser.add_argument('culvert_points', help = 'a point shapefile, or a csv file with BarrierID, X and Y columns')
+    parser.add_argument('output_file', help = 'the watershed table to write')
+    parser.add_argument('--snap', type = float, default = 0.0, help = 'how far (in meters) a culvert may be moved onto the stream')
+    parser.add_argument('--earlier', help = 'an earlier watershed table to take Tc_hr and CN from')
+    parser.add_argument('--land-cover', help = 'a .flt grid of land cover classes, for CN')
+    parser.add_argument('--soil-groups', help = 'a .flt grid of hydrologic soil groups, for CN')
+    parser.add_argument('--curve-numbers', help = 'the curve number table (curve_numbers.csv by default)')
+    parser.add_argument('--tc-method', choices = ['kirpich', 'tr55', 'velocity'], help = 'how to work out Tc_hr')
+    parser.add_argument('--precip', help = 'an NRCC export, for the 2-year 24-hour rainfall (tr55)')
+    parser.add_argument('--flow-paths', help = 'where to save the flow paths, to work out Tc_hr again later')
+    arguments = parser.parse_args(argv)
+
+    culverts = loader.valid_columns(loader.load_columns(arguments.culvert_points, culvert_points_signature, 1, -1))
+    dem = load_dem(arguments.dem)
+    watersheds = delineate(dem, culverts['BarrierID'], culverts['X'], culverts['Y'], arguments.snap)
+
+    outside = numpy.sum(watersheds['cell'] < 0)
+    if outside > 0:
+        print "NOTE: " + str(outside) + " culverts are outside the DEM, and were left out."
+    if arguments.earlier != None:
+        values = earlier_values(arguments.earlier, watersheds['BarrierID'])
+    else:
+        values = {'Tc_hr': numpy.full(len(watersheds['cell']), numpy.nan), 'CN': numpy.full(len(watersheds['cell']), numpy.nan)}
+    if arguments.land_cover != None or arguments.soil_groups != None:
+        if arguments.land_cover == None or arguments.soil_groups == None:
+            print "ERROR: CN needs both a land cover grid and a soil group grid. Bailing out."
+            sys.exit(0)
+        import zonal_stats
+        cn = zonal_stats.watershed_curve_numbers(watersheds, dem, arguments.land_cover, arguments.soil_groups, arguments.curve_numbers)
+        values['CN'] = numpy.where(numpy.isnan(cn), values['CN'], cn)
+    if arguments.tc_method != None or arguments.flow_paths != None:
+        import time_of_concentration
+        paths = time_of_concentration.flow_paths(watersheds, dem)
+        if arguments.flow_paths != None:
+            time_of_concentration.save_flow_paths(arguments.flow_paths, paths)
+        if arguments.tc_method != None:
+            p2_in = time_of_concentration.nrcc_p2_in(arguments.precip) if arguments.precip != None else None
+            tc_hr = time_of_concentration.concentration_times(paths, arguments.tc_method, p2_in)
+            values['Tc_hr'] = numpy.where(numpy.isnan(tc_hr), values['Tc_hr'], tc_hr)
+    save_watershed_table(arguments.output_file, watersheds, values['Tc_hr'], values['CN'])
+    print "Delineated " + str(len(watersheds['cell']) - outside) + " watersheds. The watershed table is " + arguments.output_file
+
+if __name__ == '__main__':
+    main()
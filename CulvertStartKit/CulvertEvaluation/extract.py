@@ -12,197 +12,388 @@
 #  EDITED Nov 2018 to save files in data folder, and to simplify input.
 #   NOTE: raw data file MUST be saved in folder of the same name as the file
 #       w/in CulvertEvaluation folder-  e.g. CulvertEvaluation/ALB/ALB.csv
+#
+#  EDITED Oct 2026 to stream the export one row at a time, so exports of any size (e.g. a
+#   statewide NAACC dump of millions of rows) are extracted in constant memory, and to read
+#   gzip (.csv.gz) and zip (.zip) compressed exports as well. The raw data file can also be
+#   ALB/ALB.csv.gz or ALB/ALB.zip, or any file given on the command line:
+#       python extract.py ALB N path/to/export.csv.gz
+#   The extraction can be used from other scripts too, e.g.:
+#       import extract
+#       for extracted, row in extract.records('ALB/ALB.csv.gz', 'ALB', 'N'):
+#           ...
+#   or extract.extract('ALB/ALB.csv.gz', 'ALB', 'N', 'ALB/ALB_field_data.csv', 'ALB/ALB_not_extracted.csv')
+#   The output files are exactly as before.
+#
+#  EDITED Oct 2026 to find the columns of the export by their header names (once per file),
+#   so extraction still works when NAACC reorders its columns. A column whose header isn't
+#   found is read from where it used to be only if the header there is blank (as some NAACC
+#   exports leave it); otherwise it is left blank, as missing. A NOTE says which. The NAACC
+#   and Fulcrum names are translated into the model's by the vocabulary tables below, and
+#   values the model doesn't know are left as they are and listed together at the end, with
+#   how many culverts have each.
 
-ws_name=raw_input("Enter watershed abbreviation:")
-data_type=raw_input("Fulcrum data or NAACC data? (Enter F for Fulcrum, N for NAACC):")
-raw_data = ws_name + "/" + ws_name + ".csv"
-
-#Make sure they can't input anything but F or N
-while data_type !='f' and data_type != 'F' and data_type !='n' and data_type !='N':
-    data_type=raw_input('Please enter either F for Fulcrum or N for NAACC:')
-
-# Put the output files in the data folder you created
-output=ws_name+"/"+ws_name+"_field_data.csv"
-not_extracted=ws_name+"/"+ws_name+"_not_extracted.csv"
-    
-import numpy, os, re, csv
-
-f_out = open(output, 'wb') #output file for extracted culverts
-not_extracted_out= open(not_extracted, 'wb') #output for crossings not extracted
-writer = csv.writer(f_out) #write object
-writer_no_extract=csv.writer(not_extracted_out)
-
-#write headings
-writer.writerow(['BarrierID','NAACC_ID','Lat','Long','Rd_Name','Culv_Mat','In_Type','In_Shape','In_A','In_B','HW','Slope','Length','Out_Shape','Out_A','Out_B','Comments','Flags']) #header row
-writer_no_extract.writerow(['Survey_ID','NAACC_ID','Lat','Long','Rd_Name','Culv_Mat','In_Type','In_Shape','In_A','In_B','HW','Slope','Length','Out_Shape','Out_A','Out_B','Comments','Flags']) #header row
-
-# create an array to store field data values from the input spreadsheet
-CD=[] # initialize an array to store field data values
-for j in range(0,67):
-    CD.append('blank')
-
-with open(raw_data, 'r') as f:
-    input_table = csv.reader(f)
-    next(f) # skip header
-    k=1
-    if data_type=='F'or data_type=='f':
-        for row in input_table: #each culvert 
-            
-                
-                Fulcrum_ID=row[15]
-                Lat=float(row[11])
-                Long=float(row[12])
-                Road_Name=row[16]
-                
-                # Assign culvert material and convert to language accepted by model
-                Culv_material=row[18]
-                if Culv_material=="Dual-Walled HDPE":
-                    Culv_material="Plastic"
-                elif Culv_material=="Corrugated HDPE":
-                    Culv_material="Plastic"
-                elif Culv_material=='Smooth Metal':
-                    Culv_material='Metal'
-                elif Culv_material=='Corrugated Metal':
-                    Culv_material='Metal'
-                
-                Inlet_type=row[19]
-                Inlet_Shape=row[22]               
-                Inlet_A=float(row[23])
-                Inlet_B=float(row[24])
-                HW=float(row[25])
-                Slope=float(row[26])
-                Length=float(row[27])
-                Outlet_shape=row[31]
-                Outlet_A=float(row[34])
-                Outlet_B=float(row[35])
-                Comments=row[39]
-                Fulcrum_ID
-                Flags=0
-
-                if Inlet_A<0:
-                    next(f)
-                elif Inlet_B<0:
-                    next(f)
-                elif HW<0:
-                    next(f)
-                elif Slope<0:
-                    next(f)
-                elif Length <1:
-                    next(f)
-
-                BarrierID=str(k)+ws_name
-                k=k+1     
-                writer.writerow([BarrierID, Fulcrum_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_B, Comments])
-                           
-    elif data_type=='N'or data_type=='n':
-        NAAC_ID="1"   
-        for row in input_table: #each culvert
-
-            # eliminate blank cells from data and add data to array
-            for i in range(0,62): 
-                cell_value=row[i]
-                if cell_value=='':
-                    cell_value=-1
-                CD[i]=cell_value # add field data to array
-
-            BarrierID=str(k)+ws_name
-            Survey_ID=CD[0]
-            NAACC_ID=CD[35]
-            Lat=float(CD[20])
-            Long=float(CD[19])
-            Road_Name=CD[26]
-            Culv_material=CD[49]
-            
-            # Assign inlet type and then convert to language accepted by capacity_prep script
-            Inlet_type=CD[22]
-            if Inlet_type=="Headwall and Wingwalls":
-                Inlet_type="Wingwall and Headwall"
-            elif Inlet_type=="Wingwalls":
-                Inlet_type='Wingwall'
-            elif Inlet_type=='None':
-                Inlet_type='Projecting'
-                
-            # Assign culvert shape and then convert to language accepted by capacity_prep script
-            Inlet_Shape=CD[44]
-            if Inlet_Shape=='Round Culvert':
-                Inlet_Shape='Round'
-            elif Inlet_Shape=='Pipe Arch/Elliptical Culvert':
-                Inlet_Shape="Elliptical"
-            elif Inlet_Shape=='Box Culvert':
-                Inlet_Shape='Box'
-            elif Inlet_Shape=='Box/Bridge with Abutments':
-                Inlet_Shape='Box'
-            elif Inlet_Shape=='Open Bottom Arch Bridge/Culvert':
-                Inlet_Shape='Arch'
-            
-            Inlet_A=float(CD[47]) # Inlet_A = Inlet_Width
-            Inlet_B=float(CD[43]) # Inlet B = Inlet Height
-            HW=float(CD[27]) #This is from the top of the culvert, make sure the next step adds the culvert height
-            Slope=float(CD[61]) 
-            if Slope<0: # Negatives slopes are assumed to be zero
-                Slope=0
-            Length=float(CD[39])
-            Outlet_shape=CD[55]
-            Outlet_A=float(CD[58])
-            Outlet_B=float(CD[54])
-            Comments=CD[8]
-            Number_of_culverts=float(CD[24])
-            if Number_of_culverts > 1:
-                if Number_of_culverts == 2:
-                    Flags=2 # the crossing has two culverts
-                elif Number_of_culverts == 3:
-                    Flags=3 # The crossing has three culverts
-                elif Number_of_culverts == 4:
-                    Flags=4 # The crossing has four culverts
-                elif Number_of_culverts == 5:
-                    Flags=5 # The crossings has five culverts
-                elif Number_of_culverts == 6:
-                    Flags=6 # The crossing has six culverts
-                elif Number_of_culverts == 7:
-                    Flags=7 # The crossings has seven culverts
-                elif Number_of_culverts == 8:
-                    Flags=8 # The crossings has eight culverts
-                elif Number_of_culverts == 9:
-                    Flags=9 # The crossings has nine culverts
-                elif Number_of_culverts == 10:
-                    Flags=10 # The crossings has ten culverts                              
-            else:
-                Flags=0
-
-            Neg_test=[Inlet_A,Inlet_B,HW,Length] # This step eliminates rows with negative values of Inlet_A, Inlet_B, HW, or Length from the analysis
-            N=0
-            for i in range(0,4):
-                if Neg_test[i]<0:
-                    N=N+1
-                
-            if CD[11]!="Bridge" and N==0:
-                # Bridge crossings are not modeled
-                # From Allison, 8/16/17: There are other types of crossings we do not model that are missed by this (e.g., ford, buried stream)
-                writer.writerow([BarrierID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags])
-                k=k+1
-            elif CD[44]=="Box/Bridge with Abutments" and Inlet_A<20 and N==0:
-                # Bridge crossings less than 20 ft are considered culverts (question from Allison, 8/16/17: why do we not model Crossing_Type == Bridge AND Outlet_Type == Box Culvert?)
-                writer.writerow([BarrierID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags])
-                k=k+1
-            elif CD[44]=="Open Bottom Arch Bridge/Culvert" and Inlet_A<20 and N==0:
-                # Bridge crossings less than 20 ft are considered culverts (see above question from Allison)
-                writer.writerow([BarrierID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags])
-                k=k+1
+import csv, gzip, os, sys, zipfile
+
+# Header rows of the two output files.
+field_data_headers = ['BarrierID','NAACC_ID','Lat','Long','Rd_Name','Culv_Mat','In_Type','In_Shape','In_A','In_B','HW','Slope','Length','Out_Shape','Out_A','Out_B','Comments','Flags','Survey_ID']
+not_extracted_headers = ['Survey_ID','NAACC_ID','Lat','Long','Rd_Name','Culv_Mat','In_Type','In_Shape','In_A','In_B','HW','Slope','Length','Out_Shape','Out_A','Out_B','Comments','Flags']
+
+# The raw data files looked for in the data folder, in order (see raw_data_filename).
+raw_data_endings = ['.csv', '.csv.gz', '.zip']
+
+# Vocabulary tables: the name the model uses for each name in the exports.
+# The model's own names map to themselves; anything not in a table is left as it is and
+# reported (see note_unmapped). Culvert materials with "Stone" in them are all treated as
+# stone by capacity_prep.py, so they aren't reported.
+model_materials = {'Concrete': 'Concrete', 'Metal': 'Metal', 'Plastic': 'Plastic', 'Stone': 'Stone', 'Wood': 'Wood', 'Combination': 'Combination'}
+model_inlet_types = {'Headwall': 'Headwall', 'Projecting': 'Projecting', 'Mitered to Slope': 'Mitered to Slope', 'Wingwall': 'Wingwall', 'Wingwall and Headwall': 'Wingwall and Headwall'}
+model_shapes = {'Round': 'Round', 'Elliptical': 'Elliptical', 'Pipe Arch': 'Pipe Arch', 'Box': 'Box', 'Arch': 'Arch'}
+
+naacc_materials = dict(model_materials)
+naacc_inlet_types = dict(model_inlet_types, **{
+    'Headwall and Wingwalls': 'Wingwall and Headwall',
+    'Wingwalls': 'Wingwall',
+    'None': 'Projecting'
+})
+naacc_shapes = dict(model_shapes, **{
+    'Round Culvert': 'Round',
+    'Pipe Arch/Elliptical Culvert': 'Elliptical',
+    'Box Culvert': 'Box',
+    'Box/Bridge with Abutments': 'Box',
+    'Open Bottom Arch Bridge/Culvert': 'Arch'
+})
+
+fulcrum_materials = dict(model_materials, **{
+    'Dual-Walled HDPE': 'Plastic',
+    'Corrugated HDPE': 'Plastic',
+    'Smooth Metal': 'Metal',
+    'Corrugated Metal': 'Metal'
+})
+fulcrum_inlet_types = dict(model_inlet_types)
+fulcrum_shapes = dict(model_shapes)
+
+# Cell conversions.
+# NAACC blank cells become -1.
+def naacc_text(cell):
+    if cell=='':
+        return -1
+    return cell
+
+def naacc_number(cell):
+    return float(naacc_text(cell))
+
+def naacc_vocabulary(table):
+    def translate(cell):
+        value = naacc_text(cell)
+        return table.get(value, value)
+    return translate
+
+def fulcrum_text(cell):
+    return cell
+
+def fulcrum_number(cell):
+    return float(cell)
+
+def fulcrum_vocabulary(table):
+    def translate(cell):
+        return table.get(cell, cell)
+    return translate
+
+# The columns read from each kind of export, in the order the record functions unpack them.
+# Each has the header names it may have, where it used to be (used if none of them is found
+# and the header there is blank, as some NAACC exports leave some headers) and how its cells
+# are converted.
+naacc_columns = [
+    {'name': 'Survey_ID', 'headers': ['Survey_Id'], 'position': 0, 'convert': naacc_text},
+    {'name': 'Comments', 'headers': ['Crossing_Comment', 'Comments'], 'position': 8, 'convert': naacc_text},
+    {'name': 'Crossing_Type', 'headers': ['Crossing_Type'], 'position': 11, 'convert': naacc_text},
+    {'name': 'Long', 'headers': ['GPS_X_Coordinate'], 'position': 19, 'convert': naacc_number},
+    {'name': 'Lat', 'headers': ['GPS_Y_Coordinate'], 'position': 20, 'convert': naacc_number},
+    {'name': 'Inlet_Type', 'headers': ['Inlet_Type'], 'position': 22, 'convert': naacc_vocabulary(naacc_inlet_types)},
+    {'name': 'Number_Of_Culverts', 'headers': ['Number_Of_Culverts'], 'position': 24, 'convert': naacc_number},
+    {'name': 'Rd_Name', 'headers': ['Road', 'Road_Name'], 'position': 26, 'convert': naacc_text},
+    {'name': 'HW', 'headers': ['Road_Fill_Height'], 'position': 27, 'convert': naacc_number},
+    {'name': 'NAACC_ID', 'headers': ['Naacc_Culvert_Id'], 'position': 35, 'convert': naacc_text},
+    {'name': 'Length', 'headers': ['Crossing_Structure_Length'], 'position': 39, 'convert': naacc_number},
+    {'name': 'In_B', 'headers': ['Inlet_Height'], 'position': 43, 'convert': naacc_number},
+    {'name': 'Structure_Type', 'headers': ['Inlet_Structure_Type'], 'position': 44, 'convert': naacc_text},
+    {'name': 'In_Shape', 'headers': ['Inlet_Structure_Type'], 'position': 44, 'convert': naacc_vocabulary(naacc_shapes)},
+    {'name': 'In_A', 'headers': ['Inlet_Width'], 'position': 47, 'convert': naacc_number},
+    {'name': 'Culv_Mat', 'headers': ['Material'], 'position': 49, 'convert': naacc_vocabulary(naacc_materials)},
+    {'name': 'Out_B', 'headers': ['Outlet_Height'], 'position': 54, 'convert': naacc_number},
+    {'name': 'Out_Shape', 'headers': ['Outlet_Structure_Type'], 'position': 55, 'convert': naacc_text},
+    {'name': 'Out_A', 'headers': ['Outlet_Width'], 'position': 58, 'convert': naacc_number},
+    {'name': 'Slope', 'headers': ['Slope_Percent'], 'position': 61, 'convert': naacc_number}
+]
+
+# Fulcrum exports start with Fulcrum's own columns (fulcrum_id, ..., latitude, longitude);
+# the rest are the fields of the survey app, whose names aren't known here, so they are
+# read from where they have always been. Add their names to 'headers' to find them by name.
+fulcrum_columns = [
+    {'name': 'Fulcrum_ID', 'headers': [], 'position': 15, 'convert': fulcrum_text},
+    {'name': 'Lat', 'headers': ['latitude'], 'position': 11, 'convert': fulcrum_number},
+    {'name': 'Long', 'headers': ['longitude'], 'position': 12, 'convert': fulcrum_number},
+    {'name': 'Rd_Name', 'headers': [], 'position': 16, 'convert': fulcrum_text},
+    {'name': 'Culv_Mat', 'headers': [], 'position': 18, 'convert': fulcrum_vocabulary(fulcrum_materials)},
+    {'name': 'In_Type', 'headers': [], 'position': 19, 'convert': fulcrum_vocabulary(fulcrum_inlet_types)},
+    {'name': 'In_Shape', 'headers': [], 'position': 22, 'convert': fulcrum_vocabulary(fulcrum_shapes)},
+    {'name': 'In_A', 'headers': [], 'position': 23, 'convert': fulcrum_number},
+    {'name': 'In_B', 'headers': [], 'position': 24, 'convert': fulcrum_number},
+    {'name': 'HW', 'headers': [], 'position': 25, 'convert': fulcrum_number},
+    {'name': 'Slope', 'headers': [], 'position': 26, 'convert': fulcrum_number},
+    {'name': 'Length', 'headers': [], 'position': 27, 'convert': fulcrum_number},
+    {'name': 'Out_Shape', 'headers': [], 'position': 31, 'convert': fulcrum_text},
+    {'name': 'Out_A', 'headers': [], 'position': 34, 'convert': fulcrum_number},
+    {'name': 'Out_B', 'headers': [], 'position': 35, 'convert': fulcrum_number},
+    {'name': 'Comments', 'headers': [], 'position': 39, 'convert': fulcrum_text}
+]
+
+# Header names are compared ignoring case, spaces and underscores.
+def header_key(header):
+    return ''.join([character for character in header.lower() if character.isalnum()])
+
+# Compile the conversion of the rows of an export: find each column by its header, once, and
+# return a function that converts a row into the list of the converted values of the columns,
+# in order. A column not found by name is read from where it used to be if the header there
+# is blank (or if it has no known names, like most Fulcrum columns); otherwise some other
+# column has taken its place, so it is missing and converted from a blank cell in every row.
+# Columns read from where they used to be are added to report['positional'], and missing
+# columns to report['missing'].
+def compile_transform(columns, header_row, report):
+    header_index = {}
+    for index in range(len(header_row)):
+        header_index.setdefault(header_key(header_row[index]), index)
+
+    steps = []
+    for column in columns:
+        index = None
+        for header in column['headers']:
+            if header_key(header) in header_index:
+                index = header_index[header_key(header)]
+                break
+        if index == None:
+            index = column['position']
+            if len(column['headers']) > 0:
+                if index < len(header_row) and header_row[index].strip() == '':
+                    report['positional'].append((column['headers'][0], index))
+                else:
+                    report['missing'].append((column['headers'][0], index, header_row[index] if index < len(header_row) else None))
+                    index = None
+        steps.append((index, column['convert']))
+
+    def transform(row):
+        return [convert(row[index] if index != None else '') for index, convert in steps]
+    return transform
+
+# Count a value the model doesn't know (blank cells aside) in report['unmapped'].
+def note_unmapped(report, name, value, table):
+    if value in table.values() or value == -1 or str(value).strip() == '':
+        return
+    if name == 'Culv_Mat' and "Stone" in value:
+        return
+    values = report['unmapped'].setdefault(name, {})
+    values[value] = values.get(value, 0) + 1
+
+# A new, empty report of the columns not found by name and the values the model doesn't know.
+def new_report():
+    return {'positional': [], 'missing': [], 'unmapped': {}}
+
+# Print a report, if there is anything in it.
+def print_report(report):
+    seen = set()
+    for header, index in report['positional']:
+        if header not in seen:
+            seen.add(header)
+            print "NOTE: the export has no column named " + header + "; column " + str(index + 1) + " was used, where it used to be."
+    for header, index, found in report['missing']:
+        if header not in seen:
+            seen.add(header)
+            if found == None:
+                where = "the export has no column " + str(index + 1) + ", where it used to be"
             else:
-                writer_no_extract.writerow([Survey_ID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags])
-            
-f.close()
-f_out.close()
-not_extracted_out.close()
+                where = "column " + str(index + 1) + ", where it used to be, is now '" + found + "'"
+            print "NOTE: the export has no column named " + header + " (" + where + "), so it was left blank for every culvert."
+    if len(report['unmapped']) > 0:
+        print "NOTE: these values (in the extracted culverts) are not ones the model knows, so they were left as they are" \
+            + " (see the vocabulary tables in extract.py):"
+        for name in sorted(report['unmapped']):
+            values = report['unmapped'][name]
+            for value in sorted(values, key = lambda value: (-values[value], value)):
+                print "   " + name + " '" + value + "': " + str(values[value]) + " culverts"
+
+# Open an export for reading line by line, uncompressing it on the fly if it is
+# gzip (.gz) or zip (.zip) compressed. A zip file is expected to hold the export as its
+# only (or first) .csv file.
+def open_export(raw_data):
+    if raw_data.lower().endswith('.gz'):
+        return gzip.open(raw_data, 'rb')
+    if raw_data.lower().endswith('.zip'):
+        archive = zipfile.ZipFile(raw_data, 'r')
+        names = [name for name in archive.namelist() if name.lower().endswith('.csv')]
+        if len(names) == 0:
+            print "ERROR: zip file '" + raw_data + "' has no csv file in it. Bailing out."
+            sys.exit(0)
+        return archive.open(names[0], 'r')
+    return open(raw_data, 'r')
+
+# The lines of an export, header first, one at a time.
+def export_lines(raw_data):
+    f = open_export(raw_data)
+    try:
+        for line in f:
+            yield line
+    finally:
+        f.close()
+
+# Extract the culverts of an export, one at a time.
+# Parameters:
+#   raw_data: the export file (.csv, .csv.gz or .zip).
+#   ws_name: the watershed (county) abbreviation, added to each BarrierID.
+#   data_type: 'F' (or 'f') for Fulcrum data, 'N' (or 'n') for NAACC data.
+#   report: a report (see new_report) to add missing headers and unknown values to. Optional.
+# Yields (extracted, row) for each culvert: extracted is True if it goes in the field data
+# and False if it is not extracted (NAACC data only), and row is its row of that file.
+def records(raw_data, ws_name, data_type, report = None):
+    if report == None:
+        report = new_report()
+    lines = export_lines(raw_data)
+    header_line = next(lines, '')
+    header_row = next(csv.reader([header_line]), [])
+    if data_type=='F'or data_type=='f':
+        return fulcrum_records(lines, compile_transform(fulcrum_columns, header_row, report), ws_name, report)
+    return naacc_records(lines, compile_transform(naacc_columns, header_row, report), ws_name, report)
+
+# Extract the culverts of a Fulcrum export (see records).
+# lines is an iterator over the lines of the export, after the header, and transform
+# converts a row into the values of fulcrum_columns.
+def fulcrum_records(lines, transform, ws_name, report):
+    k=1
+    for row in csv.reader(lines): #each culvert
+        [Fulcrum_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B,
+            HW, Slope, Length, Outlet_shape, Outlet_A, Outlet_B, Comments] = transform(row)
+
+        # A culvert with a bad value skips the line after it (but is still extracted itself).
+        if Inlet_A<0 or Inlet_B<0 or HW<0 or Slope<0 or Length <1:
+            next(lines, None)
+
+        note_unmapped(report, 'Culv_Mat', Culv_material, fulcrum_materials)
+        note_unmapped(report, 'In_Type', Inlet_type, fulcrum_inlet_types)
+        note_unmapped(report, 'In_Shape', Inlet_Shape, fulcrum_shapes)
+
+        BarrierID=str(k)+ws_name
+        k=k+1
+        yield True, [BarrierID, Fulcrum_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_B, Comments]
+
+# Extract the culverts of a NAACC export (see records).
+# lines is an iterator over the lines of the export, after the header, and transform
+# converts a row into the values of naacc_columns (blank cells are -1).
+def naacc_records(lines, transform, ws_name, report):
+    k=1
+    Flags=None
+    for row in csv.reader(lines): #each culvert
+        [Survey_ID, Comments, Crossing_Type, Long, Lat, Inlet_type, Number_of_culverts, Road_Name, HW, NAACC_ID,
+            Length, Inlet_B, Structure_type, Inlet_Shape, Inlet_A, Culv_material, Outlet_B, Outlet_shape, Outlet_A, Slope] = transform(row)
+
+        BarrierID=str(k)+ws_name
+        # HW is from the top of the culvert, make sure the next step adds the culvert height
+        if Slope<0: # Negatives slopes are assumed to be zero
+            Slope=0
+        if Number_of_culverts > 1:
+            if Number_of_culverts in [2, 3, 4, 5, 6, 7, 8, 9, 10]:
+                Flags=int(Number_of_culverts) # the crossing has this many culverts
+            # Any other number leaves Flags as it was for the culvert before, as it always has.
+        else:
+            Flags=0
+
+        # This step eliminates rows with negative values of Inlet_A, Inlet_B, HW, or Length from the analysis
+        N=0
+        for value in [Inlet_A,Inlet_B,HW,Length]:
+            if value<0:
+                N=N+1
+
+        # Bridge crossings are not modeled
+        # From Allison, 8/16/17: There are other types of crossings we do not model that are missed by this (e.g., ford, buried stream)
+        # Bridge crossings less than 20 ft are considered culverts (question from Allison, 8/16/17: why do we not model Crossing_Type == Bridge AND Outlet_Type == Box Culvert?)
+        if (Crossing_Type!="Bridge" and N==0) \
+            or (Structure_type=="Box/Bridge with Abutments" and Inlet_A<20 and N==0) \
+            or (Structure_type=="Open Bottom Arch Bridge/Culvert" and Inlet_A<20 and N==0):
+            note_unmapped(report, 'Culv_Mat', Culv_material, naacc_materials)
+            note_unmapped(report, 'In_Type', Inlet_type, naacc_inlet_types)
+            note_unmapped(report, 'In_Shape', Inlet_Shape, naacc_shapes)
+            # (Outlet_A goes in the Out_B column too, as it always has.)
+            yield True, [BarrierID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags, Survey_ID]
+            k=k+1
+        else:
+            yield False, [Survey_ID, NAACC_ID, Lat, Long, Road_Name, Culv_material, Inlet_type, Inlet_Shape, Inlet_A, Inlet_B, HW, Slope,Length, Outlet_shape, Outlet_A, Outlet_A, Comments, Flags]
+
+# Extract an export into the field data file and the file of crossings not extracted.
+# Parameters as for records, plus the output filenames.
+# Returns a dictionary with the number of culverts extracted and not_extracted, and the
+# report of missing headers and unknown values (see new_report).
+def extract(raw_data, ws_name, data_type, output, not_extracted):
+    report = new_report()
+    num_extracted = 0
+    num_not_extracted = 0
+    with open(output, 'wb') as f_out: #output file for extracted culverts
+        with open(not_extracted, 'wb') as not_extracted_out: #output for crossings not extracted
+            writer = csv.writer(f_out) #write object
+            writer_no_extract=csv.writer(not_extracted_out)
+
+            #write headings
+            writer.writerow(field_data_headers)
+            writer_no_extract.writerow(not_extracted_headers)
+
+            for extracted, row in records(raw_data, ws_name, data_type, report):
+                if extracted:
+                    writer.writerow(row)
+                    num_extracted += 1
+                else:
+                    writer_no_extract.writerow(row)
+                    num_not_extracted += 1
+    return {'extracted': num_extracted, 'not_extracted': num_not_extracted, 'report': report}
+
+# The raw data file of a watershed: the first of ws_name/ws_name.csv, .csv.gz or .zip there is.
+def raw_data_filename(ws_name):
+    for ending in raw_data_endings:
+        raw_data = ws_name + "/" + ws_name + ending
+        if os.path.isfile(raw_data):
+            return raw_data
+    return ws_name + "/" + ws_name + ".csv"
+
+def main():
+    # The watershed, data type and raw data file can be given on the command line; otherwise ask.
+    if len(sys.argv) > 1:
+        ws_name=sys.argv[1]
+    else:
+        ws_name=raw_input("Enter watershed abbreviation:")
+    if len(sys.argv) > 2:
+        data_type=sys.argv[2]
+    else:
+        data_type=raw_input("Fulcrum data or NAACC data? (Enter F for Fulcrum, N for NAACC):")
+    if len(sys.argv) > 3:
+        raw_data=sys.argv[3]
+    else:
+        raw_data=raw_data_filename(ws_name)
+
+    #Make sure they can't input anything but F or N
+    while data_type !='f' and data_type != 'F' and data_type !='n' and data_type !='N':
+        data_type=raw_input('Please enter either F for Fulcrum or N for NAACC:')
+
+    # Put the output files in the data folder you created
+    output=ws_name+"/"+ws_name+"_field_data.csv"
+    not_extracted=ws_name+"/"+ws_name+"_not_extracted.csv"
 
-file_out_path=os.path.dirname(os.path.abspath(output))+'\\' + output
-no_extract_out_path=os.path.dirname(os.path.abspath(not_extracted))+'\\' + not_extracted
+    result = extract(raw_data, ws_name, data_type, output, not_extracted)
+    print_report(result['report'])
 
-print '\nExtraction complete! Exctracted values can be found here:\n'
-print file_out_path
-print 'Crossings excluded from analysis can be found here:\n'
-print no_extract_out_path
+    file_out_path=os.path.dirname(os.path.abspath(output))+'\\' + output
+    no_extract_out_path=os.path.dirname(os.path.abspath(not_extracted))+'\\' + not_extracted
 
+    print '\nExtraction complete! Exctracted values can be found here:\n'
+    print file_out_path
+    print 'Crossings excluded from analysis can be found here:\n'
+    print no_extract_out_path
 
-                    
-        
+if __name__ == '__main__':
+    main()
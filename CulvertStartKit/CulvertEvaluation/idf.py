@@ -0,0 +1,80 @@
+# Precipitation depth-duration-frequency tables
+# October 2026
+#
+# Reads every duration of an NRCC export (5-min to 10-day, for each of the 9 return periods),
+# not just the 24-hr column runoff.py uses, and interpolates the depth of a storm of any
+# duration, e.g. one lasting the time of concentration of each watershed. Used by runoff.py's
+# rational method for small watersheds (see small_watershed_method there).
+#
+# Each file is parsed once per process and kept as a compact array (return periods x
+# durations, in cm); a file counts as the same if its size and modification time are.
+# Depths are interpolated linearly in log(depth) against log(duration), between the two
+# durations of the table on either side, for all watersheds at once. Durations shorter than
+# 5 minutes or longer than 10 days take the depth of the shortest or longest duration.
+#
+# Usage:
+#   table = idf.load_table('ALB/ALB_precip.csv')
+#   depths = idf.depths_at(table['durations_hr'], table['depths'], tc_hr)  # watersheds x return periods, cm
+#   intensities = depths / tc_hr[:, numpy.newaxis]  # cm/hr
+
+import os, sys
+import numpy
+import loader
+
+# The duration columns of an NRCC export, and their length in hours.
+duration_headers = ['5-min', '10-min', '15-min', '30-min', '60-min', '120-min', '3-hr', '6-hr', '12-hr', '24-hr', '2-day', '4-day', '7-day', '10-day']
+durations_hr = numpy.array([5 / 60.0, 10 / 60.0, 15 / 60.0, 0.5, 1, 2, 3, 6, 12, 24, 48, 96, 168, 240])
+
+# Signature of the mean estimates of an NRCC export (header on row 10, then 9 return periods).
+idf_signature = [{'name': 'Freq (yr)', 'type': str}] + [{'name': header, 'type': float} for header in duration_headers]
+
+# Tables already loaded, by absolute path, size and modification time.
+tables = {}
+
+# Load the depth-duration-frequency table of an NRCC export.
+# Returns a dictionary with durations_hr (the durations, in hours), frequencies (the return
+# periods, as in the file) and depths (return periods x durations, in cm).
+def load_table(filename):
+    try:
+        file_status = os.stat(filename)
+    except OSError:
+        print "ERROR: could not find NRCC export '" + filename + "'. Bailing out."
+        sys.exit(0)
+    key = (os.path.abspath(filename), file_status.st_size, file_status.st_mtime)
+    if key not in tables:
+        rows = loader.load(filename, idf_signature, 10, 9)['valid_rows']
+        if len(rows) < 9:
+            print "ERROR: failed to load all precipitation durations from file '" + filename + "'. Bailing out."
+            sys.exit(0)
+        depths = numpy.array([[row[header] for header in duration_headers] for row in rows]) * 2.54
+        tables[key] = {
+            'durations_hr': durations_hr,
+            'frequencies': [row['Freq (yr)'] for row in rows],
+            'depths': depths
+        }
+    return tables[key]
+
+# The depth of the storms of each return period lasting the given durations.
+# Parameters:
+#   table_durations_hr: the durations of the table (e.g. load_table(...)['durations_hr']).
+#   depths: the depths of the table, return periods x durations; or one such table per
+#       watershed (watersheds x return periods x durations).
+#   durations: array of the duration (hours) of each watershed's storms.
+# Returns an array of watersheds x return periods, in the units of depths.
+def depths_at(table_durations_hr, depths, durations):
+    durations = numpy.asarray(durations, dtype = numpy.float64)
+    log_table = numpy.log(table_durations_hr)
+    log_durations = numpy.log(numpy.clip(durations, table_durations_hr[0], table_durations_hr[-1]))
+    # The table durations on either side, and how far between them each duration is.
+    below = numpy.clip(numpy.searchsorted(log_table, log_durations, side = 'right') - 1, 0, len(log_table) - 2)
+    fraction = ((log_durations - log_table[below]) / (log_table[below + 1] - log_table[below]))[:, numpy.newaxis]
+
+    log_depths = numpy.log(numpy.maximum(depths, 1e-9))
+    if log_depths.ndim == 2:
+        lower = log_depths[:, below].T
+        upper = log_depths[:, below + 1].T
+    else:
+        watersheds = numpy.arange(len(durations))
+        lower = log_depths[watersheds, :, below]
+        upper = log_depths[watersheds, :, below + 1]
+    return numpy.exp(lower + fraction * (upper - lower))
@@ -0,0 +1,245 @@
+# Run instrumentation
+# October 2026
+#
+# Records what each stage of a county run cost, so a slow run can be tracked down to
+# the stage (and the part of it: loading, calculating or saving) that is slow.
+# For every stage it records:
+#   seconds, cpu_seconds: wall clock and CPU (user + system) time.
+#   phases: wall clock seconds of each named part of the stage, e.g. load, calculate and save.
+#   rows_read, rows_invalid: rows read from csv files by loader.py during the stage,
+#       and how many of them were invalid.
+#   cache_hits, cache_misses: files loaded from loader.py's cache, and files it had to parse.
+#   rows_in, rows_out, rows_rejected: rows going into and out of the stage, and how many
+#       it threw out (set by the stage itself; see pipeline.py).
+#   peak_rss_mb: peak resident memory of the process so far, in MB. (A process that runs
+#       several counties, e.g. a pool worker, reports the peak of all of them so far.)
+#       On Windows, the peak working set; None where neither is available.
+#   failed: True if the stage stopped with an error.
+#   skipped: True if the stage was not calculated, because nothing it depends on had
+#       changed since the last run (see build_manifest.py).
+# The report of a county run is saved as JSON next to its model output.
+#
+# To find out where the time goes inside one stage, set the environment variable
+# CULVERT_PROFILE_STAGE to its name (e.g. calculate_capacity). The stage is then run
+# under cProfile and the profile saved next to the run report (read it with pstats).
+#
+# Usage:
+#   report = instrumentation.RunReport('ALB', profile_prefix = 'ALB/ALB_')
+#   with report.stage('calculate_capacity') as stage:
+#       with stage.phase('calculate'):
+#           ...
+#       stage.rows_in = ...
+#   report.finish(True)
+#   report.save('ALB/ALB_run_report.json')
+
+import cProfile, json, os, sys, time
+try:
+    import resource # Unix only.
+except ImportError:
+    resource = None
+
+# Environment variable naming the stage to profile.
+profile_stage_variable = 'CULVERT_PROFILE_STAGE'
+
+# The stage that is running, if any, so loader.py can count the rows it reads.
+current_stage = None
+
+# Peak resident memory of this process so far, in MB, or None if it can't be found out.
+def peak_rss_mb():
+    if resource != None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return peak / (1024.0 * 1024.0) # bytes
+        return peak / 1024.0 # kilobytes
+    if sys.platform == 'win32':
+        return windows_peak_working_set_mb()
+    return None
+
+# Peak working set (resident memory) of this process so far on Windows, in MB, or None.
+def windows_peak_working_set_mb():
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', wintypes.DWORD),
+                ('PageFaultCount', wintypes.DWORD),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)
+            ]
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize / (1024.0 * 1024.0) # bytes
+    except Exception:
+        return None
+
+# CPU time (user + system) used by this process so far, in seconds.
+def cpu_seconds():
+    times = os.times()
+    return times[0] + times[1]
+
+# Called by loader.py for every file it reads: adds the rows to the running stage, if any.
+def count_rows_read(num_rows, num_invalid_rows):
+    if current_stage != None:
+        current_stage.rows_read += num_rows
+        current_stage.rows_invalid += num_invalid_rows
+
+# Called by loader.py for every file it looks for in its cache: counts the hit or miss for the running stage, if any.
+def count_cache(hit):
+    if current_stage != None:
+        if hit:
+            current_stage.cache_hits += 1
+        else:
+            current_stage.cache_misses += 1
+
+# The report of one county run: a list of stages, plus totals.
+class RunReport(object):
+
+    # Parameters:
+    #   county_abbreviation: the county being run.
+    #   profile_stage: name of the stage to run under cProfile. Optional; by default
+    #       the CULVERT_PROFILE_STAGE environment variable, if set.
+    #   profile_prefix: path and start of the name of the profile file, e.g. 'ALB/ALB_'.
+    def __init__(self, county_abbreviation, profile_stage = None, profile_prefix = ''):
+        self.county_abbreviation = county_abbreviation
+        self.profile_stage = profile_stage
+        if self.profile_stage == None:
+            self.profile_stage = os.environ.get(profile_stage_variable)
+        self.profile_prefix = profile_prefix
+
+        self.stages = []
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.start_time = time.time()
+        self.start_cpu = cpu_seconds()
+        self.seconds = None
+        self.cpu_seconds = None
+        self.succeeded = None
+        self.loader_cache = None # loader.cache_statistics() at the end of the run, if given.
+
+    # A new stage, to be used in a with statement.
+    def stage(self, name):
+        stage = Stage(name, name == self.profile_stage, self.profile_prefix)
+        self.stages.append(stage)
+        return stage
+
+    # Record the totals of the run.
+    def finish(self, succeeded):
+        self.seconds = time.time() - self.start_time
+        self.cpu_seconds = cpu_seconds() - self.start_cpu
+        self.succeeded = succeeded
+
+    # The report as a dictionary, ready to save as JSON.
+    def as_dict(self):
+        return {
+            'county_abbreviation': self.county_abbreviation,
+            'started': self.started,
+            'seconds': self.seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_mb': peak_rss_mb(),
+            'succeeded': self.succeeded,
+            'loader_cache': self.loader_cache,
+            'stages': [stage.as_dict() for stage in self.stages]
+        }
+
+    # Save the report as JSON.
+    def save(self, filename):
+        save_report(filename, self.as_dict())
+
+# One stage of a run. Times whatever runs inside its with statement.
+class Stage(object):
+
+    def __init__(self, name, profile = False, profile_prefix = ''):
+        self.name = name
+        self.profile = profile
+        self.profile_filename = None
+        if profile:
+            self.profile_filename = profile_prefix + 'profile_' + name + '.prof'
+        self.phases = {}
+        self.rows_read = 0
+        self.rows_invalid = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rows_in = None
+        self.rows_out = None
+        self.rows_rejected = None
+        self.seconds = None
+        self.cpu_seconds = None
+        self.peak_rss_mb = None
+        self.failed = False
+        self.skipped = False
+
+    def __enter__(self):
+        global current_stage
+        self.outer_stage = current_stage
+        current_stage = self
+        self.profiler = None
+        if self.profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start_time = time.time()
+        self.start_cpu = cpu_seconds()
+        return self
+
+    def __exit__(self, exception_type, exception, trace):
+        global current_stage
+        self.seconds = time.time() - self.start_time
+        self.cpu_seconds = cpu_seconds() - self.start_cpu
+        if self.profiler != None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_filename)
+        self.peak_rss_mb = peak_rss_mb()
+        self.failed = exception_type != None
+        current_stage = self.outer_stage
+        return False # Don't hide errors.
+
+    # Time part of the stage, to be used in a with statement. Phases with the same name add up.
+    def phase(self, name):
+        return Phase(self, name)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'seconds': self.seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'phases': self.phases,
+            'rows_read': self.rows_read,
+            'rows_invalid': self.rows_invalid,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_rejected': self.rows_rejected,
+            'peak_rss_mb': self.peak_rss_mb,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'profile': self.profile_filename
+        }
+
+# A timed part of a stage.
+class Phase(object):
+
+    def __init__(self, stage, name):
+        self.stage = stage
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception, trace):
+        self.stage.phases[self.name] = self.stage.phases.get(self.name, 0) + (time.time() - self.start_time)
+        return False
+
+# Save a report (or a list of them) as JSON.
+def save_report(filename, report):
+    with open(filename, 'w') as report_file:
+        json.dump(report, report_file, indent = 2, sort_keys = True)
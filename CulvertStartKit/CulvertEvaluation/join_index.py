@@ -0,0 +1,106 @@
+# BarrierID join index
+# October 2026
+#
+# Every step of the model identifies a culvert (and its watershed) by its BarrierID:
+# a number followed by a county code, e.g. '27AAA' in our files or '27aaaws' in the
+# watershed data exported from GIS.
+#
+# This module parses BarrierIDs into their number and county code (for sorting), and
+# matches two lists of BarrierIDs with a merge join: each BarrierID is numbered once,
+# and the numbers are matched with searchsorted instead of a dictionary of strings.
+#
+# Usage:
+#   ids = join_index.parse_barrier_ids(watersheds['BarrierID'])
+#   ids['numbers'] -> array([27, 103, ...]), ids['codes'] -> array(['aaaws', 'aaaws', ...])
+#
+#   join = join_index.merge_join(culverts['BarrierID'], runoffs['BarrierID'])
+#   join['right_index'][i] is the row of runoffs matching culvert i (or -1 if there is none).
+
+import re
+import numpy
+
+# A BarrierID is its number, then (optionally) its county code.
+barrier_id_pattern = re.compile(r'^(\d+)(.*)$')
+
+# The largest BarrierID number that fits in the numbers array.
+max_number = numpy.iinfo(numpy.int64).max
+
+# Split BarrierIDs into their numbers and county codes.
+# Parameters:
+#   barrier_ids: array or list of BarrierID strings.
+# Returns a dictionary with:
+#   numbers: int array of the number at the start of each BarrierID (-1 if it doesn't start with one).
+#   codes: object array of the rest of each BarrierID, i.e. the county code
+#          (the whole BarrierID if it doesn't start with a number).
+#   valid: boolean array, True for each BarrierID that starts with a number.
+#   too_large: boolean array, True for each BarrierID whose number is bigger than max_number
+#              (its number is -1 and it isn't valid).
+def parse_barrier_ids(barrier_ids):
+    numbers = []
+    codes = []
+    valid = []
+    too_large = []
+    for barrier_id in barrier_ids:
+        match = barrier_id_pattern.match(barrier_id)
+        if match and int(match.group(1)) <= max_number:
+            numbers.append(int(match.group(1)))
+            codes.append(match.group(2))
+            valid.append(True)
+            too_large.append(False)
+        else:
+            numbers.append(-1)
+            codes.append(barrier_id)
+            valid.append(False)
+            too_large.append(match is not None)
+    return {
+        'numbers': numpy.array(numbers, dtype = numpy.int64),
+        'codes': numpy.array(codes, dtype = object),
+        'valid': numpy.array(valid, dtype = bool),
+        'too_large': numpy.array(too_large, dtype = bool)
+    }
+
+# Match two lists of BarrierIDs, exactly as strings.
+# Both lists are turned into integer keys, the right side is sorted once, and every
+# left key is looked up in it with a binary search. BarrierIDs only match if they are
+# the very same string, e.g. '01AAA' matches '01AAA' but not '1AAA'.
+# If a BarrierID appears more than once on the right, its last row is used.
+# Parameters:
+#   left_ids, right_ids: arrays or lists of BarrierID strings, e.g. culverts and watersheds.
+# Returns a dictionary with:
+#   right_index: int array, one per left BarrierID, of the row of right_ids with the same
+#                BarrierID, or -1 if there is none.
+#   matched: boolean array, True for each left BarrierID that was found.
+#   unmatched_left: indices of the left BarrierIDs not found on the right.
+#   unmatched_right: indices of the right BarrierIDs not found on the left.
+def merge_join(left_ids, right_ids):
+    left_keys, right_keys = join_keys(left_ids, right_ids)
+
+    # Sort the right keys. mergesort is stable, so the last of any duplicate keys
+    # is also the last in the sorted order.
+    order = numpy.argsort(right_keys, kind = 'mergesort')
+    sorted_keys = right_keys[order]
+
+    position = numpy.searchsorted(sorted_keys, left_keys, side = 'right') - 1
+    found = position >= 0
+    found[found] = sorted_keys[position[found]] == left_keys[found]
+
+    right_index = numpy.full(len(left_keys), -1, dtype = numpy.int64)
+    right_index[found] = order[position[found]]
+
+    return {
+        'right_index': right_index,
+        'matched': found,
+        'unmatched_left': numpy.flatnonzero(~found),
+        'unmatched_right': numpy.flatnonzero(~numpy.in1d(right_keys, left_keys))
+    }
+
+# Turn two lists of BarrierIDs into integer keys that are equal exactly when the
+# BarrierIDs are. Both lists are numbered together (by the position of each BarrierID
+# among the distinct BarrierIDs of both), so the keys of the two lists can be compared.
+# Returns the pair of int arrays of keys (left, right).
+def join_keys(left_ids, right_ids):
+    left_ids = numpy.asarray(left_ids, dtype = object)
+    right_ids = numpy.asarray(right_ids, dtype = object)
+    all_ids = numpy.concatenate([left_ids, right_ids])
+    keys = numpy.unique(all_ids, return_inverse = True)[1].astype(numpy.int64)
+    return keys[:len(left_ids)], keys[len(left_ids):]
@@ -35,11 +35,41 @@
 # ]
 # 
 # Importantly, if anything is wrong with the file, a helpful error will be given.
+#
+# A header can be marked as optional by adding 'optional': True to its dictionary
+# in the signature, e.g. {'name': 'Survey_ID', 'type': str, 'optional': True}.
+# If an optional header is missing from the file, every row gets a filler value
+# for it instead ('' for str, 0 for int, nan for float).
+#
+# For large files there is also loader.load_columns, which takes the same parameters
+# but returns one numpy array per header (plus a mask of which rows were valid)
+# instead of one dictionary per row. See below.
+#
+# load_columns and save_columns also read and write binary columnar tables
+# (see columnar.py) when given a filename ending in '.cols' instead of '.csv'.
+# load_columns also reads shapefiles (see shapefile_reader.py) when given a filename
+# ending in '.shp' or '.dbf'.
+#
+# Parsed csv files are kept in a cache, so loading the same unchanged file again with
+# the same signature (e.g. the precipitation file of several counties) doesn't parse it
+# again. A file counts as unchanged if its size and modification time are the same.
+# The least recently used files are dropped once the cache holds more than cache_max_mb
+# (set it to 0 to turn the cache off). The arrays load_columns returns are read-only,
+# since they are shared with the cache; copy them before changing them.
+#
+# Big csv files can be parsed on several CPU cores at once (see parallel_parse.py):
+# set parallel_processes (below) to how many processes to use, or 0 for every core.
 
 import csv
+import os
 import sys
 import operator
+import collections
 import numpy
+import instrumentation
+import columnar
+import parallel_parse
+import shapefile_reader
 
 # Load and validate a file.
 # Parameters:
@@ -56,6 +86,24 @@ import numpy
 #   invalid_rows is a dictionary containing row_number, 
 #   row (the actual row list), and reason_invalid string.
 def load(filename, required_headers, start_row, max_rows) :
+    key = cache_key('rows', filename, required_headers, start_row, max_rows)
+    result = cache_get(key)
+    if result == None:
+        result = parse_rows(filename, required_headers, start_row, max_rows)
+        cache_put(key, result, rows_size(result))
+    instrumentation.count_rows_read(len(result['valid_rows']), len(result['invalid_rows']))
+
+    # Copy the rows, so changing them doesn't change the cache.
+    return {
+        "valid_rows": [dict(row) for row in result['valid_rows']],
+        "invalid_rows": list(result['invalid_rows'])
+    }
+
+# The work of load: read and parse the file.
+def parse_rows(filename, required_headers, start_row, max_rows):
+    result = parallel_parse.parse(filename, required_headers, start_row, max_rows, 'rows')
+    if result != None:
+        return result
     try:
         with open(filename, 'r') as csv_file:
             input_table = csv.reader(csv_file)
@@ -64,30 +112,9 @@ def load(filename, required_headers, start_row, max_rows) :
             for i in range (1, start_row):
                 next(input_table)
             
-            # Read the header row.
+            # Read the header row and find each header of the signature in it.
             header_row = next(input_table)
-            
-            # For each header in the signature, find it in the table's header row.
-            # If it's missing, keep a list of them so we can give an error later.
-            header_index = {} #empty dictionary for header names
-            missing_headers = [] #empty list for missing headers
-            for header in required_headers:
-                try:
-                    index = header_row.index(header['name']) 
-                    header_index[header['name']] = index
-                except ValueError:
-                    missing_headers.append(header['name'])
-
-            # If any headers were missing, give an error and exit.
-            if len(missing_headers) > 0:
-                print "ERROR: file '" \
-                    + filename \
-                    + "' was missing the following required headers on row " \
-                    + str(start_row) \
-                    + ": " \
-                    + ", ".join(missing_headers) \
-                    + ". Bailing out."
-                sys.exit(0)
+            header_index = locate_headers(filename, header_row, required_headers, start_row)
 
             # Now we can attempt to grab all the values from each row and put them in dictionaries.
             result_list = []
@@ -98,45 +125,11 @@ def load(filename, required_headers, start_row, max_rows) :
                 if max_rows != -1 and row_number - start_row > max_rows:
                     break
 
-                result_item = {}
-                for header in required_headers:
-                    index = header_index[header['name']]
-                    
-                    if index >= len(row):
-                        # Row not long enough to reach at least one header.
-                        invalid_rows.append({
-                            "row_number": row_number,
-                            "row": row,
-                            "reason_invalid": "it did not have enough columns to reach header " \
-                                + header['name'] \
-                                + " in column " \
-                                + column_string(index + 1) \
-                                + "." \
-                        })
-                        break
-                    value = row[index]
-                    try:
-                        # Attempt to parse the value to the correct type.
-                        result_item[header['name']] = header['type'](value)
-                    except ValueError:
-                        invalid_rows.append({
-                        "row_number": row_number,
-                        "row": row,
-                        "reason_invalid": "in row " \
-                            + str(row_number) \
-                            + ", column " \
-                            + column_string(index + 1) \
-                            + " (" \
-                            + header['name'] \
-                            + ") of file '" \
-                            + filename \
-                            + "', the value '" \
-                            + value \
-                            + "' could not be parsed to " \
-                            + str(header['type']) \
-                            + "." \
-                        })
-                        break
+                # Parse the row. Note that a row which fails part-way is still added
+                # (with whatever values were parsed before the failure), as it always has been.
+                result_item, invalid_row = parse_row(filename, row, row_number, required_headers, header_index)
+                if invalid_row != None:
+                    invalid_rows.append(invalid_row)
 
                 #Successful, so add to result list.
                 result_list.append(result_item)
@@ -152,7 +145,376 @@ def load(filename, required_headers, start_row, max_rows) :
         print "ERROR: Could not find file '" \
             + filename \
             + "'. Bailing out."
-        sys.exit(0)    
+        sys.exit(0)
+
+# Columnar version of load, for large files.
+# Takes exactly the same parameters (and signature format) as load, but instead of
+# building one dictionary per row it builds one typed numpy array per header:
+# float headers become float64 arrays, int headers int64 arrays and anything else
+# (e.g. str) an object array.
+# Returns:
+#   A dictionary containing four entries: columns, valid_mask, row_numbers and invalid_rows.
+#
+#   columns is a dictionary mapping each header name to its array. Every array has one
+#   entry per data row read, valid or not; entries of invalid rows hold a filler value
+#   (nan, 0 or '') and should be ignored.
+#
+#   valid_mask is a boolean array that is True for each row that parsed completely.
+#
+#   row_numbers is an int array holding the file row number of each data row,
+#   for use in messages.
+#
+#   invalid_rows is the same list of invalid row reports that load returns.
+#
+# Use valid_columns (below) to get just the valid rows.
+#
+# If filename is a columnar table (see columnar.py), start_row is ignored and every row is valid.
+# If filename is a shapefile (see shapefile_reader.py), start_row is ignored and the row numbers
+# are record numbers.
+def load_columns(filename, required_headers, start_row, max_rows):
+    if columnar.is_columnar(filename):
+        return load_columnar(filename, required_headers, start_row, max_rows)
+    if shapefile_reader.is_shapefile(filename):
+        result = shapefile_reader.load_columns(filename, required_headers, start_row, max_rows)
+        instrumentation.count_rows_read(len(result['row_numbers']), len(result['invalid_rows']))
+        return result
+
+    key = cache_key('columns', filename, required_headers, start_row, max_rows)
+    result = cache_get(key)
+    if result == None:
+        result = parse_columns(filename, required_headers, start_row, max_rows)
+        for column in [result['valid_mask'], result['row_numbers']] + result['columns'].values():
+            column.setflags(write = False)
+        cache_put(key, result, columns_size(result))
+    instrumentation.count_rows_read(len(result['row_numbers']), len(result['invalid_rows']))
+
+    # A new dictionary (of the same arrays), so changing it doesn't change the cache.
+    return {
+        "columns": dict(result['columns']),
+        "valid_mask": result['valid_mask'],
+        "row_numbers": result['row_numbers'],
+        "invalid_rows": list(result['invalid_rows'])
+    }
+
+# The work of load_columns for a csv file: read and parse it.
+def parse_columns(filename, required_headers, start_row, max_rows):
+    result = parallel_parse.parse(filename, required_headers, start_row, max_rows, 'columns')
+    if result != None:
+        return result
+    try:
+        with open(filename, 'r') as csv_file:
+            input_table = csv.reader(csv_file)
+
+            # Get down to the start row.
+            for i in range (1, start_row):
+                next(input_table)
+
+            # Read the header row and find each header of the signature in it.
+            header_row = next(input_table)
+            header_index = locate_headers(filename, header_row, required_headers, start_row)
+
+            # One list per header, plus the bookkeeping lists.
+            values = {}
+            for header in required_headers:
+                values[header['name']] = []
+            valid_mask = []
+            row_numbers = []
+            invalid_rows = []
+
+            row_number = start_row + 1 #initializing row number as the first row below headers
+            for row in input_table:
+                # Stop if there is a maximum number of rows to load and we've reached it.
+                if max_rows != -1 and row_number - start_row > max_rows:
+                    break
+
+                result_item, invalid_row = parse_row(filename, row, row_number, required_headers, header_index)
+                if invalid_row != None:
+                    invalid_rows.append(invalid_row)
+
+                # Fill in every column for every row, so all the arrays line up.
+                for header in required_headers:
+                    name = header['name']
+                    if invalid_row == None:
+                        values[name].append(result_item[name])
+                    else:
+                        values[name].append(column_fill_value(header['type']))
+                valid_mask.append(invalid_row == None)
+                row_numbers.append(row_number)
+                row_number += 1
+
+        # Convert the lists to typed arrays.
+        columns = {}
+        for header in required_headers:
+            columns[header['name']] = numpy.array(values[header['name']], dtype = column_dtype(header['type']))
+
+        return {
+            "columns": columns,
+            "valid_mask": numpy.array(valid_mask, dtype = bool),
+            "row_numbers": numpy.array(row_numbers, dtype = numpy.int64),
+            "invalid_rows": invalid_rows
+        }
+    except IOError:
+        print "ERROR: Could not find file '" \
+            + filename \
+            + "'. Bailing out."
+        sys.exit(0)
+
+# load_columns for a columnar table: the same result, but with every row valid
+# and the number columns memory-mapped rather than parsed.
+def load_columnar(filename, required_headers, start_row, max_rows):
+    columns = columnar.load(filename, required_headers)
+    num_rows = columnar.load_schema(filename)['rows']
+    if max_rows != -1 and num_rows > max_rows:
+        num_rows = max_rows
+        for name in columns:
+            columns[name] = columns[name][:num_rows]
+    instrumentation.count_rows_read(num_rows, 0)
+    return {
+        "columns": columns,
+        "valid_mask": numpy.ones(num_rows, dtype = bool),
+        "row_numbers": numpy.arange(start_row + 1, start_row + 1 + num_rows, dtype = numpy.int64),
+        "invalid_rows": []
+    }
+
+# Given the result of load_columns, return a dictionary of columns holding only the valid rows.
+# (If every row is valid, the columns themselves are returned, without copying them.)
+def valid_columns(column_data):
+    mask = column_data['valid_mask']
+    if numpy.all(mask):
+        return dict(column_data['columns'])
+    columns = {}
+    for name, column in column_data['columns'].items():
+        columns[name] = column[mask]
+    return columns
+
+# Build a dictionary of columns from a list of rows.
+# Parameters:
+#   rows: list of rows, each a list of values in the same order as the signature.
+#   signature: the signature of the headers and their data types, as for load.
+# Returns a dictionary mapping header names to typed arrays, like valid_columns.
+def rows_to_columns(rows, signature):
+    columns = {}
+    for i in range(len(signature)):
+        header = signature[i]
+        columns[header['name']] = numpy.array([row[i] for row in rows], dtype = column_dtype(header['type']))
+    return columns
+
+# The opposite of rows_to_columns: a list of row dictionaries, one per row of the columns,
+# with plain python values (as load would have returned them).
+def columns_to_rows(columns):
+    names = list(columns.keys())
+    column_lists = []
+    for name in names:
+        column_lists.append(columns[name].tolist())
+    return [dict(zip(names, values)) for values in zip(*column_lists)]
+
+# Save a dictionary of columns (as returned by valid_columns, or built by any of the
+# model stages) to a csv file.
+# Parameters:
+#   filename: the path and filename of the csv file to write.
+#   headers: list of the header names to write, in order. Each must be a key of columns.
+#   columns: dictionary mapping header names to arrays (or lists) of equal length.
+# If filename ends in '.cols', saves a columnar table (see columnar.py) instead.
+def save_columns(filename, headers, columns):
+    if columnar.is_columnar(filename):
+        columnar.save(filename, headers, columns)
+        return
+
+    # Convert each column to a plain python list, so values are written exactly
+    # as they would be if they had never been in an array.
+    column_lists = []
+    for header in headers:
+        column = columns[header]
+        if isinstance(column, numpy.ndarray):
+            column = column.tolist()
+        column_lists.append(column)
+
+    with open(filename, 'wb') as output_file:
+        csv_writer = csv.writer(output_file)
+
+        # Header
+        csv_writer.writerow(headers)
+
+        # Each row.
+        for row in zip(*column_lists):
+            csv_writer.writerow(row)
+
+# Find each header of the signature in the header row.
+# Returns a dictionary mapping header names to column indices.
+# If any headers are missing, gives an error and exits.
+def locate_headers(filename, header_row, required_headers, start_row):
+    # For each header in the signature, find it in the table's header row.
+    # If it's missing, keep a list of them so we can give an error later.
+    header_index = {} #empty dictionary for header names
+    missing_headers = [] #empty list for missing headers
+    for header in required_headers:
+        try:
+            index = header_row.index(header['name'])
+            header_index[header['name']] = index
+        except ValueError:
+            if not header.get('optional', False):
+                missing_headers.append(header['name'])
+
+    # If any headers were missing, give an error and exit.
+    if len(missing_headers) > 0:
+        print "ERROR: file '" \
+            + filename \
+            + "' was missing the following required headers on row " \
+            + str(start_row) \
+            + ": " \
+            + ", ".join(missing_headers) \
+            + ". Bailing out."
+        sys.exit(0)
+
+    return header_index
+
+# Parse one row of the table against the signature.
+# Returns a pair: the dictionary of values parsed so far, and either None (if the
+# whole row parsed) or an invalid row report describing the first failure.
+def parse_row(filename, row, row_number, required_headers, header_index):
+    result_item = {}
+    for header in required_headers:
+        if header['name'] not in header_index:
+            # Optional header missing from the file.
+            result_item[header['name']] = column_fill_value(header['type'])
+            continue
+        index = header_index[header['name']]
+
+        if index >= len(row):
+            # Row not long enough to reach at least one header.
+            return result_item, {
+                "row_number": row_number,
+                "row": row,
+                "reason_invalid": "it did not have enough columns to reach header " \
+                    + header['name'] \
+                    + " in column " \
+                    + column_string(index + 1) \
+                    + "." \
+            }
+        value = row[index]
+        try:
+            # Attempt to parse the value to the correct type.
+            result_item[header['name']] = header['type'](value)
+        except ValueError:
+            return result_item, {
+                "row_number": row_number,
+                "row": row,
+                "reason_invalid": "in row " \
+                    + str(row_number) \
+                    + ", column " \
+                    + column_string(index + 1) \
+                    + " (" \
+                    + header['name'] \
+                    + ") of file '" \
+                    + filename \
+                    + "', the value '" \
+                    + value \
+                    + "' could not be parsed to " \
+                    + str(header['type']) \
+                    + "." \
+            }
+    return result_item, None
+
+# Parallel parsing (see parallel_parse.py).
+# How many processes parse a big csv file: 1 parses every file in this process; 0 uses every CPU core.
+parallel_processes = 1
+# Files smaller than this many MB are always parsed in this process, which is quicker for them.
+parallel_min_mb = 32
+
+# Parsed file cache.
+# Maximum size of the cache in MB (roughly); 0 turns it off.
+cache_max_mb = 256
+
+# Cached results, least recently used first: key -> (result, size in bytes).
+cache = collections.OrderedDict()
+cache_bytes = 0
+cache_counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# The cache key of loading a file: what was loaded (rows or columns), the file's absolute path,
+# size and modification time, the signature and which rows. None if the file can't be found.
+def cache_key(kind, filename, required_headers, start_row, max_rows):
+    try:
+        file_status = os.stat(filename)
+    except OSError:
+        return None
+    signature = []
+    for header in required_headers:
+        signature.append((header['name'], getattr(header['type'], '__name__', str(header['type'])), bool(header.get('optional', False))))
+    return (kind, os.path.abspath(filename), file_status.st_size, file_status.st_mtime, tuple(signature), start_row, max_rows)
+
+# Get a result from the cache (making it the most recently used), or None if it isn't there.
+def cache_get(key):
+    if key == None or cache_max_mb <= 0:
+        return None
+    entry = cache.pop(key, None)
+    if entry == None:
+        cache_counters['misses'] += 1
+        instrumentation.count_cache(False)
+        return None
+    cache[key] = entry
+    cache_counters['hits'] += 1
+    instrumentation.count_cache(True)
+    return entry[0]
+
+# Put a result in the cache, dropping the least recently used ones if it gets too big.
+def cache_put(key, result, size):
+    global cache_bytes
+    limit = cache_max_mb * 1024 * 1024
+    if key != None and size <= limit:
+        cache[key] = (result, size)
+        cache_bytes += size
+    while cache_bytes > limit:
+        old_key, (old_result, old_size) = cache.popitem(last = False)
+        cache_bytes -= old_size
+        cache_counters['evictions'] += 1
+
+# Empty the cache (the counters keep counting).
+def clear_cache():
+    global cache_bytes
+    cache.clear()
+    cache_bytes = 0
+
+# The cache counters (hits, misses and evictions) and how much it holds (files and MB).
+def cache_statistics():
+    statistics = dict(cache_counters)
+    statistics['files'] = len(cache)
+    statistics['mb'] = cache_bytes / (1024.0 * 1024.0)
+    return statistics
+
+# Rough size in bytes of the result of parse_rows.
+def rows_size(result):
+    size = 0
+    for row in result['valid_rows']:
+        size += sys.getsizeof(row)
+        for value in row.values():
+            size += sys.getsizeof(value)
+    return size + 1000 * len(result['invalid_rows'])
+
+# Rough size in bytes of the result of parse_columns.
+def columns_size(result):
+    size = result['valid_mask'].nbytes + result['row_numbers'].nbytes + 1000 * len(result['invalid_rows'])
+    for column in result['columns'].values():
+        size += column.nbytes
+        if column.dtype == object:
+            for value in column:
+                size += sys.getsizeof(value)
+    return size
+
+# Numpy data type used by load_columns for each signature type.
+def column_dtype(header_type):
+    if header_type == float:
+        return numpy.float64
+    elif header_type == int:
+        return numpy.int64
+    return object
+
+# Value load_columns puts in the columns of invalid rows.
+def column_fill_value(header_type):
+    if header_type == float:
+        return numpy.nan
+    elif header_type == int:
+        return 0
+    return ''
 
 # Define a helper function to get a spreadsheet column name from an index.
 # Copied straight from http://stackoverflow.com/questions/23861680/convert-spreadsheet-number-to-column-letter
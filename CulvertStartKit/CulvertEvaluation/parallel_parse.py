@@ -0,0 +1,235 @@
+# Parallel csv parsing
+# October 2026
+#
+# Parses big csv files (e.g. statewide watershed or field data exports) on several CPU cores
+# at once, for loader.load and loader.load_columns. The file is split into chunks at line
+# breaks (by byte offset, so nothing is read twice), each chunk is parsed against the same
+# signature in a pool of processes, and the rows of the chunks are put back together in
+# order. The result is exactly the one the loader would get parsing the file itself,
+# including the row numbers in the messages about invalid rows.
+#
+# A value in quotes may have a line break in it, which a split must not fall inside. Before
+# any chunk is parsed, the quotes of the file are scanned (as the csv module reads them: a
+# quote only starts a quoted value at the start of a value, so a stray inch mark such as 18"
+# in an unquoted comment is just a quote) to see whether any split falls inside a quoted
+# value; if one does, the file is parsed in one process instead.
+#
+# It is only used for files of at least loader.parallel_min_mb, when loader.parallel_processes
+# is more than 1 (or 0, for every core) and the whole file is being read (max_rows = -1).
+# It is not used inside a process of a process pool (e.g. when several counties run at once),
+# which can't start processes of its own.
+#
+# Usage (normally through the loader):
+#   loader.parallel_processes = 4
+#   column_data = loader.load_columns('ALB/ALB_ws.csv', sorter.watershed_signature, 1, -1)
+
+import cStringIO, csv, mmap, multiprocessing, os
+import numpy
+
+# Chunks per process, so a slow chunk doesn't hold up the others for long.
+chunks_per_process = 4
+
+# How many bytes of the file to look for quotes in at a time.
+scan_bytes = 16 * 1024 * 1024
+
+# The number of processes to parse a file with, or 0 if it should be parsed in this process.
+def processes_for(filename, max_rows):
+    import loader
+    processes = loader.parallel_processes
+    if processes == 0:
+        processes = multiprocessing.cpu_count()
+    if processes <= 1 or max_rows != -1 or multiprocessing.current_process().daemon:
+        return 0
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        return 0 # Let the loader say the file is missing.
+    if size < loader.parallel_min_mb * 1024 * 1024:
+        return 0
+    return processes
+
+# Parse a file in parallel, if it is worth it.
+# Parameters:
+#   filename, required_headers, start_row, max_rows: as for loader.load.
+#   kind: 'rows' for the result of loader.parse_rows, 'columns' for that of loader.parse_columns.
+# Returns the same result as loader.parse_rows or loader.parse_columns, or None if the file
+# should be parsed in one process instead.
+def parse(filename, required_headers, start_row, max_rows, kind):
+    import loader
+    processes = processes_for(filename, max_rows)
+    if processes == 0:
+        return None
+
+    header_row, data_start = read_header(filename, start_row)
+    header_index = loader.locate_headers(filename, header_row, required_headers, start_row)
+
+    offsets = chunk_offsets(filename, data_start, processes * chunks_per_process)
+    if not splits_outside_quotes(filename, data_start, offsets[1:-1]):
+        return None
+    tasks = []
+    for i in range(len(offsets) - 1):
+        tasks.append((filename, offsets[i], offsets[i + 1], required_headers, header_index, kind))
+    pool = multiprocessing.Pool(processes)
+    try:
+        chunks = pool.map(parse_chunk, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    if kind == 'rows':
+        return merge_rows(filename, required_headers, header_index, start_row, chunks)
+    return merge_columns(filename, required_headers, header_index, start_row, chunks)
+
+# Read the header row (on start_row) and find where the data starts.
+# Returns the header row and the byte offset of the first data row.
+def read_header(filename, start_row):
+    with open(filename, 'rb') as csv_file:
+        for i in range(1, start_row):
+            csv_file.readline()
+        header_row = next(csv.reader([csv_file.readline()]), [])
+        return header_row, csv_file.tell()
+
+# Split the data of a file into about num_chunks chunks, each starting at the start of a line.
+# Returns the list of byte offsets of the chunks, plus the end of the file.
+def chunk_offsets(filename, data_start, num_chunks):
+    size = os.path.getsize(filename)
+    offsets = [data_start]
+    with open(filename, 'rb') as csv_file:
+        for i in range(1, num_chunks):
+            target = data_start + (size - data_start) * i // num_chunks
+            if target <= offsets[-1]:
+                continue
+            # Move on to the start of the next line (or stay put, if target is one).
+            csv_file.seek(target - 1)
+            csv_file.readline()
+            offset = csv_file.tell()
+            if offset > offsets[-1] and offset < size:
+                offsets.append(offset)
+    offsets.append(size)
+    return offsets
+
+# Whether none of the splits (byte offsets, in order, each at the start of a line) falls inside
+# a quoted value. Only the quotes of the file are looked at, as the csv module reads them: a
+# quote at the start of a value opens a quoted value, two quotes in one are a quote, and any
+# other quote in one closes it; any other quote is part of the value.
+def splits_outside_quotes(filename, data_start, splits):
+    if len(splits) == 0:
+        return True
+    with open(filename, 'rb') as csv_file:
+        data = numpy.frombuffer(mmap.mmap(csv_file.fileno(), 0, access = mmap.ACCESS_READ), dtype = numpy.uint8)
+    end = splits[-1]
+    quote, comma, line_feed, carriage_return = [ord(character) for character in '",\n\r']
+
+    in_quotes = False
+    skip_next = False
+    split_index = 0
+    for block_start in range(data_start, end, scan_bytes):
+        block = data[block_start:min(block_start + scan_bytes, end)]
+        positions = numpy.flatnonzero(block == quote) + block_start
+        if len(positions) == 0:
+            continue
+        # Whether each quote is at the start of a value, and whether the next byte is a quote too.
+        before = data[numpy.maximum(positions - 1, 0)]
+        starts = (positions == data_start) | (before == comma) | (before == line_feed) | (before == carriage_return)
+        doubled = data[numpy.minimum(positions + 1, len(data) - 1)] == quote
+        for position, starts_value, is_doubled in zip(positions.tolist(), starts.tolist(), doubled.tolist()):
+            while split_index < len(splits) and splits[split_index] <= position:
+                if in_quotes:
+                    return False
+                split_index += 1
+            if skip_next:
+                skip_next = False
+            elif not in_quotes:
+                in_quotes = starts_value
+            elif is_doubled:
+                skip_next = True
+            else:
+                in_quotes = False
+    return not in_quotes
+
+# Parse one chunk of a file (in a pool process).
+# Returns a dictionary with the number of rows in the chunk, the invalid rows
+# (as pairs of their index in the chunk and the row itself) and, depending on the kind,
+# the row dictionaries (rows) or the typed columns and valid mask (columns, valid_mask).
+def parse_chunk(task):
+    import loader
+    filename, start, end, required_headers, header_index, kind = task
+    with open(filename, 'rb') as csv_file:
+        csv_file.seek(start)
+        data = csv_file.read(end - start)
+
+    rows = []
+    values = {}
+    for header in required_headers:
+        values[header['name']] = []
+    valid_mask = []
+    invalid_rows = []
+
+    num_rows = 0
+    for row in csv.reader(cStringIO.StringIO(data)):
+        # The row number isn't known yet; the messages of invalid rows are made again later.
+        result_item, invalid_row = loader.parse_row(filename, row, 0, required_headers, header_index)
+        if invalid_row != None:
+            invalid_rows.append((num_rows, row))
+        if kind == 'rows':
+            rows.append(result_item)
+        else:
+            for header in required_headers:
+                name = header['name']
+                if invalid_row == None:
+                    values[name].append(result_item[name])
+                else:
+                    values[name].append(loader.column_fill_value(header['type']))
+            valid_mask.append(invalid_row == None)
+        num_rows += 1
+
+    chunk = {'num_rows': num_rows, 'invalid_rows': invalid_rows}
+    if kind == 'rows':
+        chunk['rows'] = rows
+    else:
+        chunk['columns'] = {}
+        for header in required_headers:
+            chunk['columns'][header['name']] = numpy.array(values[header['name']], dtype = loader.column_dtype(header['type']))
+        chunk['valid_mask'] = numpy.array(valid_mask, dtype = bool)
+    return chunk
+
+# The invalid row reports of all the chunks, with their real row numbers.
+def merge_invalid_rows(filename, required_headers, header_index, start_row, chunks):
+    import loader
+    invalid_rows = []
+    first_row = 0
+    for chunk in chunks:
+        for index, row in chunk['invalid_rows']:
+            row_number = start_row + 1 + first_row + index
+            invalid_rows.append(loader.parse_row(filename, row, row_number, required_headers, header_index)[1])
+        first_row += chunk['num_rows']
+    return invalid_rows
+
+# Put the chunks back together as the result of loader.parse_rows.
+def merge_rows(filename, required_headers, header_index, start_row, chunks):
+    rows = []
+    for chunk in chunks:
+        rows.extend(chunk['rows'])
+    return {
+        "valid_rows": rows,
+        "invalid_rows": merge_invalid_rows(filename, required_headers, header_index, start_row, chunks)
+    }
+
+# Put the chunks back together as the result of loader.parse_columns.
+def merge_columns(filename, required_headers, header_index, start_row, chunks):
+    import loader
+    columns = {}
+    for header in required_headers:
+        name = header['name']
+        parts = [chunk['columns'][name] for chunk in chunks]
+        if len(parts) == 0:
+            columns[name] = numpy.array([], dtype = loader.column_dtype(header['type']))
+        else:
+            columns[name] = numpy.concatenate(parts)
+    num_rows = sum([chunk['num_rows'] for chunk in chunks])
+    return {
+        "columns": columns,
+        "valid_mask": numpy.concatenate([chunk['valid_mask'] for chunk in chunks] + [numpy.zeros(0, dtype = bool)]),
+        "row_numbers": numpy.arange(start_row + 1, start_row + 1 + num_rows, dtype = numpy.int64),
+        "invalid_rows": merge_invalid_rows(filename, required_headers, header_index, start_row, chunks)
+    }
@@ -0,0 +1,570 @@
+# Culvert model pipeline
+# October 2026
+#
+# Runs all the steps of the Cornell Culvert Evaluation model for one county in memory:
+# 1. sort the watersheds by BarrierID (sorter.py)
+# 2. calculate runoff for every rainfall scenario (runoff.py)
+# 3. calculate culvert geometry and coefficients (capacity_prep.py)
+# 4. calculate culvert capacity under inlet control (capacity.py)
+# 5. find the max return period each culvert can pass (return_periods.py)
+#
+# Each step hands its results straight to the next as columns (see loader.load_columns),
+# instead of writing a csv file that the next step reads back in. Only the return
+# periods and the final model output are always saved. The intermediate files
+# (sorted_ws, runoff, culv_geom and capacity_output) are only saved if asked for,
+# e.g. for debugging; they are exactly the files the separate steps would write.
+# They are saved as csv, or as binary columnar tables (see columnar.py), which are
+# much faster for the separate steps to read back in on large counties.
+#
+# Each step is timed (see instrumentation.py) and the run report saved next to the
+# model output, as run_report.json.
+#
+# What each step was calculated from is saved in build_manifest.json (see build_manifest.py).
+# With incremental = True, steps whose inputs, code and settings haven't changed since the
+# last run are skipped. A skipped step whose results are needed by a later step that does
+# have to run is loaded from its intermediate file if there is one, or run again if not.
+# With update_changed_culverts = True as well, if only the field data has changed, just the
+# crossings whose culverts were changed, added or removed are recalculated and patched into
+# the existing output files (see row_delta.py).
+#
+# Usage:
+#   county_pipeline = pipeline.CountyPipeline('ALB', 'ALB/ALB_ws.csv', 'ALB/ALB_precip.csv',
+#       'ALB/ALB_field_data.csv', 'ALB/ALB_', rainfall_scenarios, write_intermediates = False)
+#   county_pipeline.run()
+
+import multiprocessing, Queue, sys, traceback, StringIO, numpy
+import sorter, runoff, capacity_prep, capacity, return_periods, instrumentation, loader, build_manifest, row_delta, precip_surface, idf
+
+# The steps, in the order they run, and the steps that use each one's results.
+stage_names = ['sort_watersheds', 'calculate_runoff', 'calculate_geometry', 'calculate_capacity', 'calculate_return_periods']
+stage_dependents = {
+    'sort_watersheds': ['calculate_runoff'],
+    'calculate_runoff': ['calculate_return_periods'],
+    'calculate_geometry': ['calculate_capacity'],
+    'calculate_capacity': ['calculate_return_periods'],
+    'calculate_return_periods': []
+}
+stage_descriptions = {
+    'sort_watersheds': 'Sorted watersheds',
+    'calculate_runoff': 'Runoff',
+    'calculate_geometry': 'Culvert geometry',
+    'calculate_capacity': 'Culvert capacity',
+    'calculate_return_periods': 'Return periods and final output'
+}
+
+class CountyPipeline(object):
+
+    # Parameters:
+    #   county_abbreviation: our abbreviation for the county, added to each watershed's BarrierID.
+    #   watershed_data_filename: the watershed data exported from GIS.
+    #   watershed_precip_filename: the NRCC precipitation export.
+    #   field_data_filename: the field data written by extract.py.
+    #   output_prefix: path and start of the name of every output file, e.g. 'ALB/ALB_'.
+    #   rainfall_scenarios: list of dictionaries with the name and adjustment of each rainfall
+    #       scenario. Must include scenarios named 'current' and 'future'.
+    #   write_intermediates: if True, also save the intermediate files of each step.
+    #   intermediate_format: 'csv' to save the intermediate files as csv, or 'cols' to save them
+    #       as columnar tables.
+    #   incremental: if True, skip the steps that are unchanged since the last run.
+    #   update_changed_culverts: if True (and incremental), only recalculate the crossings whose
+    #       field data changed since the last run, when nothing else did.
+    def __init__(self, county_abbreviation, watershed_data_filename, watershed_precip_filename, field_data_filename, output_prefix, rainfall_scenarios, write_intermediates = False, intermediate_format = 'csv', incremental = False, update_changed_culverts = False):
+        self.county_abbreviation = county_abbreviation
+        self.watershed_data_filename = watershed_data_filename
+        self.watershed_precip_filename = watershed_precip_filename
+        self.field_data_filename = field_data_filename
+        self.output_prefix = output_prefix
+        self.rainfall_scenarios = rainfall_scenarios
+        self.write_intermediates = write_intermediates
+        self.incremental = incremental
+        self.update_changed_culverts = update_changed_culverts
+
+        # Create filenames for all of the output files.
+        intermediate_extension = "." + intermediate_format
+        self.sorted_filename = output_prefix + "sorted_ws" + intermediate_extension
+        self.runoff_filenames = []
+        for scenario in rainfall_scenarios:
+            self.runoff_filenames.append(output_prefix + scenario['name'] + "_runoff" + intermediate_extension)
+        self.culvert_geometry_filename = output_prefix + "culv_geom" + intermediate_extension
+        self.capacity_filename = output_prefix + "capacity_output" + intermediate_extension
+        self.return_period_filename = output_prefix + "return_periods.csv"
+        self.scenario_filename = output_prefix + "scenario_return_periods.csv"
+        self.final_output_filename = output_prefix + "model_output.csv"
+        self.report_filename = output_prefix + "run_report.json"
+        self.manifest_filename = output_prefix + "build_manifest.json"
+        self.snapshot_filename = output_prefix + "field_data_snapshot.csv"
+
+        # The results of each step, filled in as they run.
+        self.sorted_watersheds = None
+        self.runoffs = None
+        self.culvert_geometry = None
+        self.capacities = None
+        self.results = None
+
+        # When only the changed crossings are recalculated: the changes found by
+        # row_delta.find_changes (and the results above are just of those crossings).
+        self.only_changed = False
+        self.changes = None
+
+        # What each step cost (see instrumentation.py).
+        self.report = instrumentation.RunReport(county_abbreviation, profile_prefix = output_prefix)
+
+    # Run every step (that needs running), in order, then save the build manifest
+    # and the run report (even if a step failed).
+    def run(self):
+        succeeded = False
+        manifest = build_manifest.BuildManifest(self.manifest_filename)
+        try:
+            keys = self.stage_keys()
+            self.only_changed = self.can_update_changed_culverts(manifest, keys)
+            plan = self.plan(manifest, keys, self.only_changed)
+            if plan['calculate_geometry'] != 'skip':
+                manifest.forget('field_data_snapshot')
+            unchanged = self.incremental and 'run' not in plan.values() and 'update' not in plan.values()
+            if unchanged:
+                print " * Nothing has changed since the last run; skipping every step."
+            # Steps that only update the changed crossings don't write their files until
+            # calculate_return_periods patches them, so they are recorded after it.
+            updated = []
+            for name in stage_names:
+                if plan[name] in ['run', 'update']:
+                    manifest.forget(name)
+                    getattr(self, name)()
+                    if plan[name] == 'update':
+                        updated.append(name)
+                    else:
+                        manifest.record(name, keys[name], self.stage_outputs(name))
+                    if name == 'calculate_return_periods':
+                        for updated_name in updated:
+                            manifest.record(updated_name, keys[updated_name], self.stage_outputs(updated_name))
+                    if name == 'calculate_return_periods' and self.update_changed_culverts:
+                        # Keep the field data, to find what changes before the next run.
+                        row_delta.save_snapshot(self.field_data_filename, self.snapshot_filename)
+                        manifest.record('field_data_snapshot', keys['field_data_snapshot'], [self.snapshot_filename])
+                elif plan[name] == 'load':
+                    self.load_stage(name)
+                else:
+                    with self.report.stage(name) as stage:
+                        stage.skipped = True
+                        if not unchanged:
+                            print " * " + stage_descriptions[name] + " unchanged since the last run; skipping it."
+            succeeded = True
+        finally:
+            try:
+                manifest.save()
+            except IOError:
+                print "NOTE: could not save the build manifest to " + self.manifest_filename + "."
+
+            cache = loader.cache_statistics()
+            print " * Loader cache: " + str(cache['hits']) + " hits, " + str(cache['misses']) + " misses so far (" \
+                + str(cache['files']) + " files, %.1f MB)." % cache['mb']
+            self.report.loader_cache = cache
+            self.report.finish(succeeded)
+            try:
+                self.report.save(self.report_filename)
+            except IOError:
+                print "NOTE: could not save the run report to " + self.report_filename + "."
+
+    # 1. WATERSHED PEAK DISCHARGE
+    # Sort watersheds so they match original numbering (GIS changes numbering)
+    def sort_watersheds(self):
+        with self.report.stage('sort_watersheds') as stage:
+            print " * Sorting watersheds by BarrierID."
+            with stage.phase('load'):
+                watersheds = sorter.load(self.watershed_data_filename)
+            with stage.phase('calculate'):
+                self.sorted_watersheds = sorter.sort_watersheds(watersheds, self.county_abbreviation)
+            if self.write_intermediates:
+                print "   (saving them to " + self.sorted_filename + ")"
+                with stage.phase('save'):
+                    sorter.save(self.sorted_filename, self.sorted_watersheds)
+            stage.rows_in = stage.rows_read
+            stage.rows_out = len(self.sorted_watersheds['BarrierID'])
+            stage.rows_rejected = stage.rows_invalid
+
+    # Culvert Peak Discharge calculates the peak discharge for each culvert for every rainfall scenario in one pass.
+    def calculate_runoff(self):
+        with self.report.stage('calculate_runoff') as stage:
+            scenario_names = self.scenario_names()
+            print " * Calculating runoff for " + ", ".join(scenario_names) + " rainfall."
+            # A precipitation surface gives each watershed its own precipitation (see precip_surface.py).
+            surface = None
+            with stage.phase('load'):
+                idf_depths = None
+                if precip_surface.is_surface(self.watershed_precip_filename):
+                    surface = precip_surface.load_surface(self.watershed_precip_filename)
+                    lat, long = precip_surface.culvert_locations(self.field_data_filename, self.sorted_watersheds['BarrierID'])
+                else:
+                    precips = runoff.load_precipitation(self.watershed_precip_filename)
+                    if runoff.small_watershed_method != None:
+                        idf_depths = idf.load_table(self.watershed_precip_filename)['depths']
+            adjustments = []
+            for scenario in self.rainfall_scenarios:
+                adjustments.append(scenario['adjustment'])
+            with stage.phase('calculate'):
+                if surface != None:
+                    precips = precip_surface.watershed_precipitation(surface, lat, long)
+                    if runoff.small_watershed_method != None:
+                        idf_depths = precip_surface.watershed_idf(surface, lat, long)
+                self.runoffs = runoff.scenario_runoff(self.sorted_watersheds, precips, adjustments, idf_depths)
+            if self.write_intermediates:
+                print "   (saving it to " + ", ".join(self.runoff_filenames) + ")"
+                with stage.phase('save'):
+                    for scenario in range(len(self.rainfall_scenarios)):
+                        runoff.save(self.runoff_filenames[scenario], self.runoffs, scenario)
+            stage.rows_in = len(self.sorted_watersheds['BarrierID'])
+            stage.rows_out = len(self.runoffs['BarrierID'])
+            stage.rows_rejected = stage.rows_in - stage.rows_out
+
+    # 2. CULVERT GEOMETRY
+    # Calculates the cross sectional area and assigns c and Y coeffs to each culvert
+    def calculate_geometry(self):
+        with self.report.stage('calculate_geometry') as stage:
+            print " * Calculating culvert geometry."
+            with stage.phase('load'):
+                field_data = capacity_prep.load_field_data(self.field_data_filename)
+                if self.only_changed:
+                    self.changes = row_delta.find_changes(capacity_prep.load_field_data(self.snapshot_filename), field_data)
+            if self.changes != None:
+                print "   (just the crossings with culverts changed, added or removed since the last run: " \
+                    + str(len(self.changes['surveys'])) + " crossings, " + str(self.changes['changed_culverts']) + " culverts)"
+                field_data = row_delta.select_rows(field_data, self.changes['new_rows'])
+            elif self.only_changed:
+                print "NOTE: could not match the culverts up with the last run's (every culvert needs a Survey_ID" \
+                    + " and its own BarrierID), so all of them are being recalculated."
+            with stage.phase('calculate'):
+                self.culvert_geometry = capacity_prep.calculate_geometry(field_data)
+            if self.write_intermediates and self.changes == None:
+                print "   (saving it to " + self.culvert_geometry_filename + ")"
+                with stage.phase('save'):
+                    capacity_prep.save(self.culvert_geometry_filename, self.culvert_geometry)
+            # Rejected: invalid rows and culverts with a shape that can't be modelled.
+            stage.rows_in = stage.rows_read
+            stage.rows_out = len(self.culvert_geometry['BarrierID'])
+            stage.rows_rejected = stage.rows_in - stage.rows_out
+
+    # 3. CULVERT CAPACITY
+    # Calculates the capacity of each culvert (m^3/s) based on inlet control
+    def calculate_capacity(self):
+        with self.report.stage('calculate_capacity') as stage:
+            print " * Calculating culvert capacity."
+            with stage.phase('calculate'):
+                self.capacities = capacity.calculate_capacity(self.culvert_geometry)
+            if self.write_intermediates and self.changes == None:
+                print "   (saving it to " + self.capacity_filename + ")"
+                with stage.phase('save'):
+                    capacity.save(self.capacity_filename, self.capacities)
+            # One row out per crossing; the culverts of a crossing are combined, not rejected.
+            stage.rows_in = len(self.culvert_geometry['BarrierID'])
+            stage.rows_out = len(self.capacities['BarrierID'])
+            stage.rows_rejected = 0
+
+    # 4. RETURN PERIODS AND FINAL OUTPUT
+    def calculate_return_periods(self):
+        with self.report.stage('calculate_return_periods') as stage:
+            print " * Calculating return periods and saving them to " + self.return_period_filename + "."
+            print " * Calculating final output and saving it to " + self.final_output_filename + "."
+            scenario_names = self.scenario_names()
+            with stage.phase('calculate'):
+                self.results = return_periods.calculate_return_periods(self.capacities, [self.runoffs])
+            current = scenario_names.index('current')
+            future = scenario_names.index('future')
+            with stage.phase('save'):
+                if self.changes != None:
+                    self.patch_outputs(current, future)
+                else:
+                    return_periods.save_return_periods(self.return_period_filename, self.results, current, future)
+                    return_periods.save_final_output(self.final_output_filename, self.results, current, future)
+                if len(scenario_names) > 2:
+                    print " * Saving return periods for all rainfall scenarios to " + self.scenario_filename + "."
+                    if self.changes == None:
+                        return_periods.save_scenario_return_periods(self.scenario_filename, self.results, scenario_names)
+            # Rejected: culverts without a watershed.
+            stage.rows_in = len(self.capacities['BarrierID'])
+            stage.rows_out = int(numpy.count_nonzero(self.results['matched']))
+            stage.rows_rejected = stage.rows_in - stage.rows_out
+
+    # Patch the results of the changed crossings into the output files of the last run
+    # (and the intermediate files, if they are saved).
+    def patch_outputs(self, current, future):
+        scenario_names = self.scenario_names()
+        patches = []
+        if self.write_intermediates:
+            patches.append((self.culvert_geometry_filename, lambda filename: capacity_prep.save(filename, self.culvert_geometry)))
+            patches.append((self.capacity_filename, lambda filename: capacity.save(filename, self.capacities)))
+        patches.append((self.return_period_filename, lambda filename: return_periods.save_return_periods(filename, self.results, current, future)))
+        patches.append((self.final_output_filename, lambda filename: return_periods.save_final_output(filename, self.results, current, future)))
+        if len(scenario_names) > 2:
+            patches.append((self.scenario_filename, lambda filename: return_periods.save_scenario_return_periods(filename, self.results, scenario_names)))
+        if not row_delta.patch_outputs(patches, self.changes):
+            print "ERROR: could not patch the changed culverts into the output files of the last run" \
+                + " (they no longer match it). Run the county again to recalculate every culvert. Bailing out."
+            sys.exit(0)
+
+    # Whether to recalculate only the crossings whose field data changed: when the field data is
+    # the only input that changed since the last run, and the last run's snapshot of it and its
+    # output files are as it left them.
+    def can_update_changed_culverts(self, manifest, keys):
+        if not (self.incremental and self.update_changed_culverts):
+            return False
+        if self.write_intermediates and not self.culvert_geometry_filename.endswith('.csv'):
+            return False # Only csv files can be patched.
+        if manifest.is_up_to_date('calculate_geometry', keys['calculate_geometry'], self.stage_outputs('calculate_geometry')):
+            return False # Nothing to update.
+        for name in ['sort_watersheds', 'calculate_runoff']:
+            if not manifest.is_up_to_date(name, keys[name], self.stage_outputs(name)):
+                return False
+        for name in ['calculate_geometry', 'calculate_capacity', 'calculate_return_periods']:
+            if not manifest.outputs_up_to_date(name, self.stage_outputs(name)):
+                return False
+        return manifest.is_up_to_date('field_data_snapshot', keys['field_data_snapshot'], [self.snapshot_filename])
+
+    # The key of each step (see build_manifest.py): a hash of everything its results depend on.
+    def stage_keys(self):
+        hash_file = build_manifest.hash_file
+        hash_values = build_manifest.hash_values
+        hash_code = build_manifest.hash_code
+        # The modules every step reads its files through (loader.py and what it imports).
+        common_code = ['loader.py', 'columnar.py', 'parallel_parse.py', 'shapefile_reader.py', 'pipeline.py']
+
+        keys = {}
+        keys['sort_watersheds'] = hash_values('sort_watersheds', self.county_abbreviation,
+            hash_file(self.watershed_data_filename), hash_code(*(common_code + ['sorter.py', 'join_index.py'])))
+        keys['calculate_runoff'] = hash_values('calculate_runoff', keys['sort_watersheds'],
+            hash_file(self.watershed_precip_filename), self.rainfall_scenarios, runoff.small_watershed_method, runoff.small_watershed_max_area_sqkm,
+            hash_code(*(common_code + ['runoff.py', 'precip_surface.py', 'idf.py'])))
+        if precip_surface.is_surface(self.watershed_precip_filename):
+            # Each watershed's precipitation depends on where its culvert is.
+            keys['calculate_runoff'] = hash_values(keys['calculate_runoff'], hash_file(self.field_data_filename))
+        keys['calculate_geometry'] = hash_values('calculate_geometry', hash_file(self.field_data_filename),
+            hash_file(capacity_prep.default_coefficients_filename), hash_code(*(common_code + ['capacity_prep.py'])))
+        keys['calculate_capacity'] = hash_values('calculate_capacity', keys['calculate_geometry'], capacity.crossing_distance_m,
+            hash_code(*(common_code + ['capacity.py', 'spatial_index.py'])))
+        keys['calculate_return_periods'] = hash_values('calculate_return_periods', keys['calculate_capacity'], keys['calculate_runoff'],
+            hash_code(*(common_code + ['return_periods.py', 'join_index.py'])))
+        # Everything the last three steps depend on except the field data: if this is the same,
+        # the crossings whose field data didn't change don't need recalculating.
+        keys['field_data_snapshot'] = hash_values('field_data_snapshot', keys['calculate_runoff'],
+            hash_file(capacity_prep.default_coefficients_filename),
+            capacity.crossing_distance_m,
+            hash_code(*(common_code + ['capacity_prep.py', 'capacity.py', 'spatial_index.py', 'return_periods.py', 'join_index.py', 'row_delta.py'])))
+        return keys
+
+    # The files a step saves.
+    def stage_outputs(self, name):
+        if name == 'calculate_return_periods':
+            outputs = [self.return_period_filename, self.final_output_filename]
+            if len(self.rainfall_scenarios) > 2:
+                outputs.append(self.scenario_filename)
+            return outputs
+        if not self.write_intermediates:
+            return []
+        if name == 'sort_watersheds':
+            return [self.sorted_filename]
+        elif name == 'calculate_runoff':
+            return list(self.runoff_filenames)
+        elif name == 'calculate_geometry':
+            return [self.culvert_geometry_filename]
+        return [self.capacity_filename]
+
+    # Decide what to do with each step: 'run' it, 'skip' it, or 'load' its results from its
+    # files because a later step needs them. Without incremental, every step runs.
+    # If only_changed is True, the last three steps 'update' just the changed crossings.
+    def plan(self, manifest, keys, only_changed = False):
+        plan = {}
+        for name in reversed(stage_names):
+            outputs = self.stage_outputs(name)
+            needed = False
+            for dependent in stage_dependents[name]:
+                if plan[dependent] in ['run', 'update']:
+                    needed = True
+            if only_changed and name in ['calculate_geometry', 'calculate_capacity', 'calculate_return_periods']:
+                plan[name] = 'update'
+            elif not self.incremental or not manifest.is_up_to_date(name, keys[name], outputs):
+                plan[name] = 'run'
+            elif not needed:
+                plan[name] = 'skip'
+            elif len(outputs) > 0:
+                plan[name] = 'load'
+            else:
+                plan[name] = 'run' # Needed, but there is nothing to load it from.
+        return plan
+
+    # Load the results of an unchanged step from its intermediate files.
+    def load_stage(self, name):
+        with self.report.stage(name) as stage:
+            stage.skipped = True
+            outputs = self.stage_outputs(name)
+            print " * " + stage_descriptions[name] + " unchanged since the last run; loading it from " + ", ".join(outputs) + "."
+            with stage.phase('load'):
+                if name == 'sort_watersheds':
+                    self.sorted_watersheds = runoff.load_watersheds(self.sorted_filename)
+                elif name == 'calculate_runoff':
+                    runoff_sets = []
+                    for runoff_filename in self.runoff_filenames:
+                        runoff_sets.append(return_periods.load_runoffs(runoff_filename))
+                    self.runoffs = dict(runoff_sets[0])
+                    self.runoffs['q_peak'] = numpy.concatenate([runoff_set['q_peak'] for runoff_set in runoff_sets], axis = 1)
+                elif name == 'calculate_geometry':
+                    self.culvert_geometry = capacity.load_geometry(self.culvert_geometry_filename)
+                elif name == 'calculate_capacity':
+                    self.capacities = return_periods.load_capacities(self.capacity_filename)
+
+    # The names of the rainfall scenarios, in order.
+    def scenario_names(self):
+        names = []
+        for scenario in self.rainfall_scenarios:
+            names.append(scenario['name'])
+        return names
+
+# Set the model settings of the driver (see Cornell_Culvert_Evaluation.py) on the modules they
+# belong to. settings maps 'module.name' (e.g. 'runoff.small_watershed_method') to its value.
+# run_county does this for every county, so worker processes that import the modules afresh
+# instead of forking from the driver (as on Windows) don't keep the defaults.
+def apply_settings(settings):
+    modules = {'loader': loader, 'capacity': capacity, 'runoff': runoff}
+    for name, value in settings.items():
+        module_name, attribute = name.split('.')
+        setattr(modules[module_name], attribute, value)
+
+# Run the whole model for one row of the county list.
+# This is what the driver runs for each county, either directly or in a worker process.
+# Parameters:
+#   county: dictionary for one county row of county_list.csv (county_abbreviation and the three input filenames).
+#   data_path: path of the data folder, which holds the input files and gets the output files.
+#   rainfall_scenarios, write_intermediates, intermediate_format, incremental, update_changed_culverts:
+#       as for CountyPipeline.
+#   capture_output: if True, collect everything the county prints into its log instead of printing it,
+#       so the messages of counties run side by side don't get mixed up.
+#   settings: the model settings to apply first (see apply_settings). Optional.
+# Returns a dictionary with the county_abbreviation, whether it succeeded, its log (if captured)
+# and its run report (see instrumentation.py; None if it failed before it started).
+# A county that fails (including the steps bailing out on bad input) does not stop the others.
+def run_county(county, data_path, rainfall_scenarios, write_intermediates, capture_output, intermediate_format = 'csv', incremental = False, update_changed_culverts = False, settings = None):
+    county_abbreviation = county["county_abbreviation"]
+    if settings != None:
+        apply_settings(settings)
+
+    log = None
+    original_stdout = sys.stdout
+    original_stderr = sys.stderr
+    if capture_output:
+        log = StringIO.StringIO()
+        sys.stdout = log
+        sys.stderr = log
+
+    succeeded = False
+    county_pipeline = None
+    try:
+        # Grab the filenames from the county row.
+        watershed_data_input_filename = data_path + county["watershed_data_filename"]
+        watershed_precip_input_filename = data_path + county["watershed_precipitation_filename"]
+        field_data_input_filename = data_path + county["field_data_filename"]
+
+        # All the output files start with this.
+        output_prefix = data_path + county_abbreviation + "_"
+
+        #Notifies user about runnign calculations
+        print "\nRunning calculations for culverts in county " + county_abbreviation + ":"
+
+        county_pipeline = CountyPipeline(county_abbreviation, watershed_data_input_filename, watershed_precip_input_filename, field_data_input_filename, output_prefix, rainfall_scenarios, write_intermediates, intermediate_format, incremental, update_changed_culverts)
+        county_pipeline.run()
+        succeeded = True
+    except SystemExit:
+        # One of the steps bailed out; it has already said why.
+        print "ERROR: county " + county_abbreviation + " stopped early."
+    except Exception:
+        print "ERROR: county " + county_abbreviation + " failed:"
+        traceback.print_exc(file = sys.stdout)
+    finally:
+        sys.stdout = original_stdout
+        sys.stderr = original_stderr
+
+    report = None
+    if county_pipeline != None:
+        report = county_pipeline.report.as_dict()
+
+    return {
+        'county_abbreviation': county_abbreviation,
+        'succeeded': succeeded,
+        'log': log.getvalue() if capture_output else None,
+        'report': report
+    }
+
+# The same as run_county, but with all the parameters in one tuple, as a process pool hands them over.
+def run_county_job(job):
+    return run_county(*job)
+
+# How often (in seconds) to check whether the processes running counties are still running.
+poll_seconds = 1.0
+
+# Run county jobs (see run_county_job) side by side, each county in its own process, at most
+# the given number at a time. Each county's log is printed once it and the counties before it
+# are finished, so they come out in order.
+# A county whose process dies without a result (e.g. killed for running out of memory) is
+# reported as failed, with the exit code of its process, instead of holding up the run.
+# Returns the results of run_county, in the order of the jobs.
+def run_county_jobs(county_jobs, processes):
+    results = multiprocessing.Queue()
+    county_results = [None] * len(county_jobs)
+    running = {}
+    next_job = 0
+    next_printed = 0
+    try:
+        while next_printed < len(county_jobs):
+            while len(running) < processes and next_job < len(county_jobs):
+                process = multiprocessing.Process(target = run_county_in_process, args = (results, next_job, county_jobs[next_job]))
+                # Like a pool's workers, so they don't start processes of their own (see parallel_parse.py).
+                process.daemon = True
+                process.start()
+                running[next_job] = process
+                next_job += 1
+
+            try:
+                index, county_result = results.get(timeout = poll_seconds)
+                county_results[index] = county_result
+                running.pop(index).join()
+            except Queue.Empty:
+                ended = [index for index in running if running[index].exitcode != None]
+                if len(ended) > 0:
+                    # Any of them may have put its result just before it ended.
+                    try:
+                        while True:
+                            index, county_result = results.get(timeout = poll_seconds)
+                            county_results[index] = county_result
+                    except Queue.Empty:
+                        pass
+                    for index in ended:
+                        process = running.pop(index)
+                        process.join()
+                        if county_results[index] == None:
+                            county_results[index] = died_result(county_jobs[index], process.exitcode)
+                    for index in running.keys():
+                        if county_results[index] != None:
+                            running.pop(index).join()
+
+            while next_printed < len(county_jobs) and county_results[next_printed] != None:
+                sys.stdout.write(county_results[next_printed]['log'])
+                next_printed += 1
+    finally:
+        # E.g. on Ctrl-C, don't leave counties running.
+        for process in running.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return county_results
+
+# Run a county job in a process of run_county_jobs, and hand back its result with its index.
+def run_county_in_process(results, index, job):
+    results.put((index, run_county_job(job)))
+
+# The result of a county whose process died without a result.
+def died_result(job, exit_code):
+    county_abbreviation = job[0]["county_abbreviation"]
+    return {
+        'county_abbreviation': county_abbreviation,
+        'succeeded': False,
+        'log': "\nERROR: county " + county_abbreviation + " failed: its process died (exit code " + str(exit_code) + ").\n",
+        'report': None,
+        'exit_code': exit_code
+    }
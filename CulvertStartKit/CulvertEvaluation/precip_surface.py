@@ -0,0 +1,229 @@
+# Precipitation surface
+# October 2026
+#
+# Gives every watershed its own 24-hour storm depths, from many NRCC points, instead of one
+# NRCC export for the whole county; big counties can have quite different rainfall from one
+# end to the other. The watershed precipitation file of a county in county_list.csv can be:
+#   - one NRCC export, as before (the same depths for every watershed);
+#   - a folder of NRCC exports (point estimates), each with its Lon (dd) and Lat (dd) rows;
+#   - a csv table of points (e.g. the nodes of a gridded product), with Lat and Long columns
+#     and the 24-hour depth (inches) of each return period in columns Y1, Y2, ... Y500.
+# The points are loaded into arrays (location, and depth by return period) once. If they are
+# the nodes of a regular latitude/longitude grid, each watershed's depths are interpolated
+# bilinearly from the grid cell it is in (found by arithmetic, without searching); otherwise
+# they are the inverse distance weighted average of the nearest points, found in batches.
+# Locations outside the points take the depths of the nearest edge of the grid, or of the
+# nearest points.
+#
+# A watershed is located by its culvert (Lat and Long in the field data), which for the small
+# watersheds of culverts is close enough to its centroid.
+#
+# Usage:
+#   surface = precip_surface.load_surface('ALB/precip_points')
+#   precips = precip_surface.watershed_precipitation(surface, lat, long)  # watersheds x return periods, cm
+#   runoffs = runoff.scenario_runoff(watersheds, precips, adjustments)
+
+import csv, glob, os, sys
+import numpy
+import loader, runoff, spatial_index, idf
+
+# How many of the nearest points to average, and the power of the inverse distance weights.
+nearest_points = 4
+distance_power = 2.0
+
+# About how many watershed/point distances to work out at a time.
+chunk_distances = 4 * 1024 * 1024
+
+# Signature of a table of points.
+def table_signature():
+    signature = [{'name': 'Lat', 'type': float}, {'name': 'Long', 'type': float}]
+    for header in runoff.return_period_headers:
+        signature.append({'name': header, 'type': float})
+    return signature
+
+# Signature of the culvert locations in the field data.
+location_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float}
+]
+
+# Whether a watershed precipitation file is a precipitation surface (a folder of NRCC exports or
+# a table of points), rather than a single NRCC export.
+def is_surface(filename):
+    if os.path.isdir(filename):
+        return True
+    try:
+        with open(filename, 'rb') as precip_file:
+            header_row = next(csv.reader(precip_file), [])
+    except IOError:
+        return False # Let the loader say the file is missing.
+    return 'Lat' in header_row and 'Long' in header_row
+
+# Read the location of an NRCC export, from its Lon (dd) and Lat (dd) rows.
+def read_location(filename):
+    location = {}
+    with open(filename, 'rb') as precip_file:
+        for row in csv.reader(precip_file):
+            if len(row) >= 2 and row[0].strip() in ['Lon (dd)', 'Lat (dd)']:
+                try:
+                    location[row[0].strip()] = float(row[1])
+                except ValueError:
+                    pass
+            if len(row) > 0 and row[0].startswith('Freq'):
+                break
+    if len(location) < 2:
+        print "ERROR: NRCC export '" + filename + "' has no Lon (dd) and Lat (dd) rows. Bailing out."
+        sys.exit(0)
+    return location['Lat (dd)'], location['Lon (dd)']
+
+# Load a precipitation surface (see the top of this file).
+# Returns a dictionary with the arrays lat and long of the points, depths (points x return
+# periods, in cm), idf (points x return periods x durations, in cm, for a folder of NRCC
+# exports; None for a table) and grid: the regular grid the points are the nodes of, or None.
+def load_surface(filename):
+    if os.path.isdir(filename):
+        filenames = sorted(glob.glob(os.path.join(filename, '*.csv')))
+        if len(filenames) == 0:
+            print "ERROR: there are no NRCC exports (.csv files) in '" + filename + "'. Bailing out."
+            sys.exit(0)
+        lat = numpy.zeros(len(filenames))
+        long = numpy.zeros(len(filenames))
+        depths = numpy.zeros((len(filenames), len(runoff.return_period_headers)))
+        idf_depths = []
+        for i, point_filename in enumerate(filenames):
+            lat[i], long[i] = read_location(point_filename)
+            depths[i] = runoff.load_precipitation(point_filename)
+            idf_depths.append(idf.load_table(point_filename)['depths'])
+        idf_depths = numpy.array(idf_depths)
+    else:
+        table = loader.valid_columns(loader.load_columns(filename, table_signature(), 1, -1))
+        if len(table['Lat']) == 0:
+            print "ERROR: precipitation table '" + filename + "' has no valid points. Bailing out."
+            sys.exit(0)
+        lat = table['Lat']
+        long = table['Long']
+        depths = numpy.column_stack([table[header] for header in runoff.return_period_headers]) * 2.54
+        idf_depths = None
+    return {'lat': lat, 'long': long, 'depths': depths, 'idf': idf_depths, 'grid': regular_grid(lat, long)}
+
+# If the points are the nodes of a regular grid (every combination of evenly spaced latitudes
+# and longitudes, once), the grid: a dictionary with the lats and longs of its rows and columns
+# and nodes, the index of the point at each row and column. Otherwise None.
+def regular_grid(lat, long):
+    lats = numpy.unique(lat)
+    longs = numpy.unique(long)
+    if len(lats) < 2 or len(longs) < 2 or len(lats) * len(longs) != len(lat):
+        return None
+    for values in [lats, longs]:
+        steps = numpy.diff(values)
+        if numpy.max(steps) - numpy.min(steps) > 1e-6 * numpy.max(steps):
+            return None
+    rows = numpy.searchsorted(lats, lat)
+    columns = numpy.searchsorted(longs, long)
+    nodes = numpy.full((len(lats), len(longs)), -1, dtype = numpy.int64)
+    nodes[rows, columns] = numpy.arange(len(lat))
+    if numpy.any(nodes < 0):
+        return None
+    return {'lats': lats, 'longs': longs, 'nodes': nodes}
+
+# The values (one row per point) at each location, interpolated bilinearly in a regular grid.
+def grid_values(grid, values, lat, long):
+    lats = grid['lats']
+    longs = grid['longs']
+    # Fractional row and column of each location, kept inside the grid.
+    row = numpy.clip((lat - lats[0]) / (lats[1] - lats[0]), 0, len(lats) - 1)
+    column = numpy.clip((long - longs[0]) / (longs[1] - longs[0]), 0, len(longs) - 1)
+    row0 = numpy.minimum(numpy.floor(row).astype(numpy.int64), len(lats) - 2)
+    column0 = numpy.minimum(numpy.floor(column).astype(numpy.int64), len(longs) - 2)
+    row_weight = (row - row0)[:, numpy.newaxis]
+    column_weight = (column - column0)[:, numpy.newaxis]
+    nodes = grid['nodes']
+    return (values[nodes[row0, column0]] * (1 - row_weight) * (1 - column_weight)
+        + values[nodes[row0 + 1, column0]] * row_weight * (1 - column_weight)
+        + values[nodes[row0, column0 + 1]] * (1 - row_weight) * column_weight
+        + values[nodes[row0 + 1, column0 + 1]] * row_weight * column_weight)
+
+# The values (one row per point) at each location, as the inverse distance weighted average
+# of the nearest points.
+def nearest_values(surface, values, lat, long):
+    # Project to meters, as spatial_index does.
+    reference_lat = numpy.radians(numpy.mean(surface['lat']))
+    point_x = spatial_index.earth_radius_m * numpy.radians(surface['long']) * numpy.cos(reference_lat)
+    point_y = spatial_index.earth_radius_m * numpy.radians(surface['lat'])
+    x = spatial_index.earth_radius_m * numpy.radians(long) * numpy.cos(reference_lat)
+    y = spatial_index.earth_radius_m * numpy.radians(lat)
+
+    k = min(nearest_points, len(point_x))
+    result = numpy.zeros((len(lat), values.shape[1]))
+    chunk = max(1, chunk_distances // len(point_x))
+    for start in range(0, len(lat), chunk):
+        distances = numpy.hypot(x[start:start + chunk, numpy.newaxis] - point_x, y[start:start + chunk, numpy.newaxis] - point_y)
+        if k < len(point_x):
+            nearest = numpy.argpartition(distances, k - 1, axis = 1)[:, :k]
+        else:
+            nearest = numpy.tile(numpy.arange(k), (len(distances), 1))
+        nearest_distances = distances[numpy.arange(len(distances))[:, numpy.newaxis], nearest]
+        # A location right on a point takes its values.
+        with numpy.errstate(divide = 'ignore'):
+            weights = 1.0 / nearest_distances ** distance_power
+        on_point = numpy.isinf(weights)
+        weights[numpy.any(on_point, axis = 1)] = 0
+        weights[on_point] = 1
+        weights /= weights.sum(axis = 1)[:, numpy.newaxis]
+        result[start:start + chunk] = numpy.einsum('ij,ijk->ik', weights, values[nearest])
+    return result
+
+# The values of the points (an array with one row per point, of any shape) interpolated at
+# each location, as watershed_precipitation does the depths.
+def interpolate(surface, values, lat, long):
+    lat = numpy.asarray(lat, dtype = numpy.float64)
+    long = numpy.asarray(long, dtype = numpy.float64)
+    # Every value of a point in one row, and back again at the end.
+    shape = values.shape[1:]
+    values = values.reshape(len(values), -1)
+    known = numpy.isfinite(lat) & numpy.isfinite(long)
+    result = numpy.zeros((len(lat), values.shape[1]))
+    if numpy.any(known):
+        if surface['grid'] != None:
+            result[known] = grid_values(surface['grid'], values, lat[known], long[known])
+        else:
+            result[known] = nearest_values(surface, values, lat[known], long[known])
+    if not numpy.all(known):
+        result[~known] = result[known].mean(axis = 0) if numpy.any(known) else values.mean(axis = 0)
+    return result.reshape((len(lat),) + shape)
+
+# The 24-hour depths (cm) of each watershed, from its location.
+# Parameters:
+#   surface: from load_surface.
+#   lat, long: arrays of the location of each watershed; nan where unknown, which get the
+#       average of the others (or of the points, if none are known).
+# Returns an array of watersheds x return periods.
+def watershed_precipitation(surface, lat, long):
+    unknown = numpy.sum(~(numpy.isfinite(lat) & numpy.isfinite(long)))
+    if unknown > 0:
+        print "NOTE: " + str(unknown) + " watersheds have no culvert location; they get the average precipitation."
+    return interpolate(surface, surface['depths'], lat, long)
+
+# The depth of every duration of each watershed's storms (see idf.py), from its location.
+# Returns an array of watersheds x return periods x durations (cm), or None if the surface
+# only has 24-hour depths (a table of points).
+def watershed_idf(surface, lat, long):
+    if surface['idf'] is None:
+        return None
+    return interpolate(surface, surface['idf'], lat, long)
+
+# The location (Lat and Long of the culvert) of each watershed, from the field data.
+# Returns the arrays lat and long, nan for watersheds without a culvert in the field data.
+def culvert_locations(field_data_filename, barrier_ids):
+    culverts = loader.valid_columns(loader.load_columns(field_data_filename, location_signature, 1, -1))
+    locations = {}
+    for barrier_id, lat, long in zip(culverts['BarrierID'].tolist(), culverts['Lat'].tolist(), culverts['Long'].tolist()):
+        if barrier_id not in locations:
+            locations[barrier_id] = (lat, long)
+    lat = numpy.full(len(barrier_ids), numpy.nan)
+    long = numpy.full(len(barrier_ids), numpy.nan)
+    for i, barrier_id in enumerate(numpy.asarray(barrier_ids).tolist()):
+        if barrier_id in locations:
+            lat[i], long[i] = locations[barrier_id]
+    return lat, long
@@ -10,158 +10,251 @@
 # Given culvert capacity and peak discharge from storm events, determine the
 # highest return period storm that a culvert can pass for current and future rainfall conditions.
 
-import numpy, os, re, csv, loader
+import numpy, os, re, csv, loader, join_index
 #Imports required packages and modules and the function loader which was written
 #by Noah in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
 
-def return_periods(capacity_filename, current_runoff_filename, future_runoff_filename, return_periods_output_filename, final_output_filename):
+# Signature for the runoff files written by runoff.py.
+runoff_signature = [
+    {'name': 'BarrierID', 'type': str},
+    #eg: The first element of the list 'runoff_signature' is a dictionary for barrier id.
+    #'BarrierID' is the header of a column of data we want to extract from the input file,containing
+    #data of type strings
+    {'name': 'Area_sqkm', 'type': float},
+    # Later: NEW_Lat, NEW_Long
+    {'name': 'Tc_hr', 'type': float},
+    {'name': 'CN', 'type': float},
+    {'name': 'Y1', 'type': float},
+    {'name': 'Y2', 'type': float},
+    {'name': 'Y5', 'type': float},
+    {'name': 'Y10', 'type': float},
+    {'name': 'Y25', 'type': float},
+    {'name': 'Y50', 'type': float},
+    {'name': 'Y100', 'type': float},
+    {'name': 'Y200', 'type': float},
+    {'name': 'Y500', 'type': float}
+]
 
-    # 1st Signature: Runoff signature:
-    # This creates a list of dictionaries that stores the relevant headers of
-    # the input file and the type of data in the column under that header
-    runoff_signature = [
-        {'name': 'BarrierID', 'type': str},
-        #eg: The first element of the list 'runoff_signature' is a dictionary for barrier id.
-        #'BarrierID' is the header of a column of data we want to extract from the input file,containing
-        #data of type strings
-        {'name': 'Area_sqkm', 'type': float},
-        # Later: NEW_Lat, NEW_Long
-        {'name': 'Tc_hr', 'type': float},
-        {'name': 'CN', 'type': float},
-        {'name': 'Y1', 'type': float},
-        {'name': 'Y2', 'type': float},
-        {'name': 'Y5', 'type': float},
-        {'name': 'Y10', 'type': float},
-        {'name': 'Y25', 'type': float},
-        {'name': 'Y50', 'type': float},
-        {'name': 'Y100', 'type': float},
-        {'name': 'Y200', 'type': float},
-        {'name': 'Y500', 'type': float}
-    ]
-
-    # 2nd Signature: Culvert signature:
-    culvert_signature = [
-        {'name': 'BarrierID', 'type': str},
-        {'name': 'NAACC_ID', 'type': int},
-        {'name': 'Lat', 'type': float},
-        {'name': 'Long', 'type': float},
-        {'name': 'Q', 'type': float},
-        {'name': 'Flags', 'type': int},
-        {'name': 'Comments', 'type': str},
-        {'name': 'Culvert_Area', 'type': float},
-    ]
+# Signature for the capacity file written by capacity.py.
+culvert_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'NAACC_ID', 'type': int},
+    {'name': 'Lat', 'type': float},
+    {'name': 'Long', 'type': float},
+    {'name': 'Q', 'type': float},
+    {'name': 'Flags', 'type': int},
+    {'name': 'Comments', 'type': str},
+    {'name': 'Culvert_Area', 'type': float},
+]
 
-    # Load and validate current and future runoffs:
-    # current_runoff_data will now store the relevant data from the current runoff input file
-    # in the format described in loader.py using the first signature defined above.
-    # valid_rows will store all value for the key 'valid_rows' in the dictionary current_runoff_data
+# The return periods of the storms, with 0 in front for culverts that can't pass even the 1 year storm.
+years = [0, 1, 2, 5, 10, 25, 50, 100, 200, 500]
 
-    current_runoff_data = loader.load(current_runoff_filename, runoff_signature, 1, -1)
-    current_runoff_rows = current_runoff_data['valid_rows']
+# A helper function to find the first overflow, for many culverts and storms at once.
+# Parameters:
+#   capacity: the max flow in each culvert (an array, or a single number).
+#   peaks: array of the watersheds' peak discharges, one row per culvert (with scenarios in
+#          between, if there are any) and one column per return period in years (after the 0).
+#   years: the list of years above.
+# Returns an array of the highest return period each culvert can pass in each scenario:
+# the year before the first storm whose peak is more than the capacity, or the last year
+# if the culvert can pass them all.
+def find_first_overflow(capacity, peaks, years):
+    peaks = numpy.asarray(peaks, dtype = numpy.float64)
+    capacity = numpy.asarray(capacity, dtype = numpy.float64)
+    capacity = capacity.reshape(capacity.shape + (1,) * (peaks.ndim - capacity.ndim))
+    years = numpy.asarray(years)
 
-    future_runoff_data = loader.load(future_runoff_filename, runoff_signature, 1, -1)
-    future_runoff_rows = future_runoff_data['valid_rows']
+    # One comparison for every culvert, scenario and storm; then the first storm
+    # that overflows each culvert is the first True along the last axis.
+    # (A culvert with no capacity, nan, never overflows, as before.)
+    with numpy.errstate(invalid = 'ignore'):
+        overflow = capacity < peaks
+    first_overflow = numpy.argmax(overflow, axis = -1)
+    return numpy.where(overflow.any(axis = -1), years[first_overflow], years[peaks.shape[-1]])
 
-    # Create lookup dictionaries for the runoffs. This speeds matching culverts to watersheds up quite a bit.
-    current_runoff_lookup = {}
-    for watershed in current_runoff_rows:
-        current_runoff_lookup[watershed['BarrierID']] = watershed
+def return_periods(capacity_filename, current_runoff_filename, future_runoff_filename, return_periods_output_filename, final_output_filename):
+    # Load and validate current and future runoffs:
+    # each will now store the relevant data from its runoff input file
+    # in the columnar format described in loader.py using the runoff signature defined above.
+    current_runoffs = load_runoffs(current_runoff_filename)
+    future_runoffs = load_runoffs(future_runoff_filename)
 
-    future_runoff_lookup = {}
-    for watershed in future_runoff_rows:
-        future_runoff_lookup[watershed['BarrierID']] = watershed
-    
     # Load culvert capacities:
-    culvert_data = loader.load(capacity_filename, culvert_signature, 1, -1)
-    culvert_rows = culvert_data['valid_rows']
-
-    # A list of the years.
-    years = [0, 1, 2, 5, 10, 25, 50, 100, 200, 500]
-
-    # A helper function to find the first overflow.
-    def find_first_overflow(culvert, watershed, years):
-        capacity = culvert['Q']
-        #stores the max flow in culvert as 'capacity' 
-        i = 1
-        while i < len(years):
-            year = years[i]
-            #loops through all the relevant return periods
-            if capacity < watershed['Y' + str(year)]:
-                return years[i - 1]
-            #if capacity is lower than the runoff for a particular return period,
-            # return the previous highest return period. 
-            i += 1
-        return years[i - 1]
-    
-    # Compute which return period each culvert will be able to withstand.
-    for culvert in culvert_rows:
-        # Find the corresponding current and future watersheds (they share BarrierID):
-        culvert['watershed'] = None
-        try:
-            current_watershed = current_runoff_lookup[culvert['BarrierID']]
-            future_watershed = future_runoff_lookup[culvert['BarrierID']]
-
-            culvert['current_return'] = find_first_overflow(culvert, current_watershed, years)
-            #returns the highest withstandable return period for current storm data
-            culvert['future_return'] = find_first_overflow(culvert, future_watershed, years)
-            #returns the highest withstandable return period for future storm data
-            culvert['watershed'] = current_watershed # Also save the watershed info, since we'll want it for our final output.
-            if culvert['Flags'] == 0:
-                culvert['Flags'] = 1 # Also fix flags so it means number of culverts (previously, flag '0' meant 1 culvert)
-        except KeyError:
-            print "Did not find watershed for barrierID " + culvert['BarrierID']
-            # Did not find a watershed corresponding to this culvert in the runoffs. Skip.
-            # TODO export skipped culverts.
-            continue
-
-
-
-    # Just save the return periods.
-    with open(return_periods_output_filename, 'wb') as return_output_file:
-        csv_writer = csv.writer(return_output_file)
-
-        # Header
-        csv_writer.writerow(['BarrierID','Current Max Return (yr)','Future Max Return (yr)'])
-
-        # Each row.
-        for culvert in culvert_rows:
-            watershed = culvert['watershed']
-            if watershed == None:
-                continue # Skip all the culverts we couldn't match with watersheds.
-            csv_writer.writerow([culvert['BarrierID'], culvert['current_return'], culvert['future_return']])
-        
-
-
-    # Now save all the final data (easier to do that here since all the relevant files are already open.)
-    with open(final_output_filename, 'wb') as final_output_file:
-        csv_writer = csv.writer(final_output_file)
-
-        # Header
-        csv_writer.writerow(['BarrierID', 'NAACC_ID', 'Original Latitude', 'Original Longitude', 'Point Moved', 'New Latitude', 'New Longitude', 'Current Max Return Period (yr)', 'Future Max Return Period (yr)', 'Capacity (m^3/s)', 'Cross sectional Area (m^2)', 'WS Area (sq km)', 'Tc (hr)', 'CN', 'Number of Culverts', 'Comments'])
-
-        # Each row.
-        for culvert in culvert_rows:
-            watershed = culvert['watershed']
-            if watershed == None:
-                print "Skipping culvert " + culvert['BarrierID']
-                continue # Skip all the culverts we couldn't match with watersheds.
-            csv_writer.writerow([
-                culvert['BarrierID'], \
-                culvert['NAACC_ID'], \
-                culvert['Lat'], \
-                culvert['Long'], \
-                "?", \
-                "?", \
-                "?", \
-                culvert['current_return'], \
-                culvert['future_return'], \
-                culvert['Q'], \
-                culvert['Culvert_Area'], \
-                watershed['Area_sqkm'], \
-                watershed['Tc_hr'], \
-                watershed['CN'], \
-                culvert['Flags'], \
-                culvert['Comments']
-            ])
+    capacities = load_capacities(capacity_filename)
+
+    # Compute which return period each culvert will be able to withstand (current is scenario 0, future is scenario 1).
+    results = calculate_return_periods(capacities, [current_runoffs, future_runoffs])
+
+    # Just save the return periods, then all the final data.
+    save_return_periods(return_periods_output_filename, results, 0, 1)
+    save_final_output(final_output_filename, results, 0, 1)
+
+# Max return periods for any number of rainfall scenarios (e.g. a climate sensitivity sweep).
+# Parameters:
+#   capacity_filename: the capacity file written by capacity.py.
+#   runoff_filenames: list of runoff files written by runoff.py, one per scenario.
+#   scenario_names: list of names for the scenarios, used in the output header.
+#   output_filename: where to save the results.
+# Output: a file with the BarrierID and the max return period for each scenario.
+# Culverts without a watershed in every scenario are left out.
+def scenario_return_periods(capacity_filename, runoff_filenames, scenario_names, output_filename):
+    runoff_sets = []
+    for runoff_filename in runoff_filenames:
+        runoff_sets.append(load_runoffs(runoff_filename))
+    capacities = load_capacities(capacity_filename)
+
+    results = calculate_return_periods(capacities, runoff_sets)
+    save_scenario_return_periods(output_filename, results, scenario_names)
+
+# Load a runoff file written by runoff.py.
+# Returns a dictionary of columns in the same format as runoff.scenario_runoff,
+# i.e. with 'q_peak' as watersheds x scenarios (just the one) x return periods.
+def load_runoffs(runoff_filename):
+    runoff_data = loader.load_columns(runoff_filename, runoff_signature, 1, -1)
+    runoff_columns = loader.valid_columns(runoff_data)
+
+    peaks = []
+    for year in years[1:]:
+        peaks.append(runoff_columns['Y' + str(year)])
+
+    return {
+        'BarrierID': runoff_columns['BarrierID'],
+        'Area_sqkm': runoff_columns['Area_sqkm'],
+        'Tc_hr': runoff_columns['Tc_hr'],
+        'CN': runoff_columns['CN'],
+        'q_peak': numpy.array(peaks).T[:, numpy.newaxis, :]
+    }
+
+# Load a capacity file written by capacity.py.
+# Returns a dictionary of columns holding the valid rows.
+def load_capacities(capacity_filename):
+    culvert_data = loader.load_columns(capacity_filename, culvert_signature, 1, -1)
+    return loader.valid_columns(culvert_data)
+
+# Find the max return period each culvert can pass under each rainfall scenario.
+# Parameters:
+#   capacities: dictionary of capacity columns (see capacity.py).
+#   runoff_sets: list of runoff results (see runoff.scenario_runoff), each holding one or more scenarios.
+#                Culverts and watersheds are matched by BarrierID.
+# Returns a dictionary with:
+#   culverts: the capacity columns, with Flags fixed to mean the number of culverts.
+#   matched: boolean array, True for each culvert that has a watershed in every runoff set.
+#   returns: array of max return periods, culverts x scenarios (all the scenarios of all the sets, in order).
+#   watersheds: dictionary of the Area_sqkm, Tc_hr and CN of each culvert's watershed (from the first set).
+def calculate_return_periods(capacities, runoff_sets):
+    barrier_ids = capacities['BarrierID'].tolist()
+    num_culverts = len(barrier_ids)
+    num_scenarios = 0
+    for runoffs in runoff_sets:
+        num_scenarios += runoffs['q_peak'].shape[1]
+
+    matched = numpy.ones(num_culverts, dtype = bool)
+
+    # Find the corresponding watershed in each set (they share BarrierID); -1 where there is none.
+    watershed_indices = []
+    for runoffs in runoff_sets:
+        join = join_index.merge_join(capacities['BarrierID'], runoffs['BarrierID'])
+        matched &= join['matched']
+        watershed_indices.append(join['right_index'])
+
+    for culvert in numpy.flatnonzero(~matched).tolist():
+        print "Did not find watershed for barrierID " + barrier_ids[culvert]
+        # Did not find a watershed corresponding to this culvert in the runoffs. Skip.
+        # TODO export skipped culverts.
+    watershed_index = numpy.where(matched, watershed_indices[0], 0) # Also save the watershed info, since we'll want it for our final output.
+
+    # Stack the peaks of every scenario of every set: culverts x scenarios x return periods.
+    peaks = numpy.empty((num_culverts, num_scenarios, len(years) - 1))
+    first_scenario = 0
+    for set_index in range(len(runoff_sets)):
+        set_peaks = runoff_sets[set_index]['q_peak']
+        last_scenario = first_scenario + set_peaks.shape[1]
+        peaks[matched, first_scenario:last_scenario] = set_peaks[watershed_indices[set_index][matched]]
+        first_scenario = last_scenario
+
+    # Compute which return period each culvert will be able to withstand, under every scenario at once.
+    returns = numpy.zeros((num_culverts, num_scenarios), dtype = numpy.int64)
+    returns[matched] = find_first_overflow(capacities['Q'][matched], peaks[matched], years)
+
+    # Also fix flags so it means number of culverts (previously, flag '0' meant 1 culvert)
+    culverts = dict(capacities)
+    culverts['Flags'] = numpy.where(capacities['Flags'] == 0, 1, capacities['Flags'])
+
+    # The watershed info of each culvert, from the first set (nan where there is no watershed).
+    watersheds = {}
+    for header in ['Area_sqkm', 'Tc_hr', 'CN']:
+        values = numpy.full(num_culverts, numpy.nan)
+        values[matched] = runoff_sets[0][header][watershed_index[matched]]
+        watersheds[header] = values
+
+    return {
+        'culverts': culverts,
+        'matched': matched,
+        'returns': returns,
+        'watersheds': watersheds
+    }
+
+# Just save the return periods.
+# Parameters:
+#   return_periods_output_filename: where to save them.
+#   results: the results of calculate_return_periods.
+#   current, future: the scenario index of the current and future rainfall.
+def save_return_periods(return_periods_output_filename, results, current, future):
+    matched = results['matched']
+    # Skip all the culverts we couldn't match with watersheds.
+    loader.save_columns(return_periods_output_filename, ['BarrierID','Current Max Return (yr)','Future Max Return (yr)'], {
+        'BarrierID': results['culverts']['BarrierID'][matched],
+        'Current Max Return (yr)': results['returns'][matched, current],
+        'Future Max Return (yr)': results['returns'][matched, future]
+    })
+
+# Now save all the final data.
+# Parameters as for save_return_periods.
+def save_final_output(final_output_filename, results, current, future):
+    culverts = results['culverts']
+    watersheds = results['watersheds']
+    matched = results['matched']
+
+    # Skip all the culverts we couldn't match with watersheds.
+    for barrier_id in culverts['BarrierID'][~matched].tolist():
+        print "Skipping culvert " + barrier_id
+
+    num_matched = numpy.count_nonzero(matched)
+    unknown = numpy.array(["?"] * num_matched, dtype = object)
+
+    headers = ['BarrierID', 'NAACC_ID', 'Original Latitude', 'Original Longitude', 'Point Moved', 'New Latitude', 'New Longitude', 'Current Max Return Period (yr)', 'Future Max Return Period (yr)', 'Capacity (m^3/s)', 'Cross sectional Area (m^2)', 'WS Area (sq km)', 'Tc (hr)', 'CN', 'Number of Culverts', 'Comments']
+    loader.save_columns(final_output_filename, headers, {
+        'BarrierID': culverts['BarrierID'][matched],
+        'NAACC_ID': culverts['NAACC_ID'][matched],
+        'Original Latitude': culverts['Lat'][matched],
+        'Original Longitude': culverts['Long'][matched],
+        'Point Moved': unknown,
+        'New Latitude': unknown,
+        'New Longitude': unknown,
+        'Current Max Return Period (yr)': results['returns'][matched, current],
+        'Future Max Return Period (yr)': results['returns'][matched, future],
+        'Capacity (m^3/s)': culverts['Q'][matched],
+        'Cross sectional Area (m^2)': culverts['Culvert_Area'][matched],
+        'WS Area (sq km)': watersheds['Area_sqkm'][matched],
+        'Tc (hr)': watersheds['Tc_hr'][matched],
+        'CN': watersheds['CN'][matched],
+        'Number of Culverts': culverts['Flags'][matched],
+        'Comments': culverts['Comments'][matched]
+    })
 
+# Save the max return periods of every rainfall scenario.
+# Parameters:
+#   output_filename: where to save them.
+#   results: the results of calculate_return_periods.
+#   scenario_names: list of names for the scenarios, used in the output header.
+def save_scenario_return_periods(output_filename, results, scenario_names):
+    matched = results['matched']
+    headers = ['BarrierID']
+    columns = {'BarrierID': results['culverts']['BarrierID'][matched]}
+    for scenario in range(len(scenario_names)):
+        header = scenario_names[scenario] + ' Max Return (yr)'
+        headers.append(header)
+        columns[header] = results['returns'][matched, scenario]
+    loader.save_columns(output_filename, headers, columns)
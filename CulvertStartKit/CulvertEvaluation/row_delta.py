@@ -0,0 +1,164 @@
+# Row-level updates of culvert outputs
+# October 2026
+#
+# When a field crew corrects a few culverts (HW, slope, inlet dimensions, ...) in a county of
+# thousands, only the crossings of those culverts need their geometry, capacity and return
+# periods recalculated. This compares the field data with a snapshot of the field data of the
+# last run, culvert by culvert (by BarrierID, checking the NAACC_ID too), and finds the crossings
+# that were changed, added or removed. pipeline.py recalculates just those crossings and
+# patches their rows into the existing output files (culv_geom, capacity_output, return_periods,
+# scenario_return_periods and model_output), which come out the same as if the whole county
+# had been run again.
+#
+# Crossings are matched by Survey_ID (see capacity.crossing_groups), so this only works on
+# field data where every culvert has one; find_changes returns None otherwise, and for field
+# data with repeated BarrierIDs, and the whole county has to be run again.
+#
+# Usage:
+#   changes = row_delta.find_changes(old_field_data, new_field_data)
+#   changed_field_data = row_delta.select_rows(new_field_data, changes['new_rows'])
+#   ... calculate the geometry, capacity and return periods of changed_field_data ...
+#   row_delta.patch_outputs([('ALB/ALB_model_output.csv', save_changed_output), ...], changes)
+
+import csv, os, shutil, tempfile
+import numpy
+
+# Save a copy of the field data a run used, to compare the next run's field data with.
+def save_snapshot(field_data_filename, snapshot_filename):
+    shutil.copyfile(field_data_filename, snapshot_filename)
+
+# Find the crossings whose culverts changed between two sets of field data.
+# Parameters:
+#   old_field_data, new_field_data: dictionaries of field data columns, as returned by
+#       capacity_prep.load_field_data, of the last run and of this one.
+# Returns None if the rows can't be matched up (see above), or a dictionary with:
+#   surveys: set of the Survey_IDs of the changed crossings. A crossing has changed if any of
+#       its culverts was changed, added or removed, or its culverts are in a different order.
+#   changed_culverts: how many culverts were changed, added or removed.
+#   new_rows: boolean array, True for the rows of new_field_data in a changed crossing.
+#   replaced_ids: set of the BarrierIDs of every culvert of a changed crossing, old or new;
+#       the output rows to be replaced.
+#   position: dictionary mapping each BarrierID of new_field_data to its row, which is
+#       the order the output rows go in.
+def find_changes(old_field_data, new_field_data):
+    old_rows = culvert_rows(old_field_data)
+    new_rows = culvert_rows(new_field_data)
+    if old_rows == None or new_rows == None:
+        return None
+
+    # The culverts that were changed, added or removed.
+    changed_ids = set()
+    for barrier_id in set(old_rows['values']) | set(new_rows['values']):
+        if old_rows['values'].get(barrier_id) != new_rows['values'].get(barrier_id):
+            changed_ids.add(barrier_id)
+
+    # Their crossings, plus any crossing whose culverts were reordered (that can change
+    # which culvert's details go in the output).
+    surveys = set()
+    for barrier_id in changed_ids:
+        for rows in [old_rows, new_rows]:
+            if barrier_id in rows['surveys']:
+                surveys.add(rows['surveys'][barrier_id])
+    for survey_id in set(old_rows['crossings']) | set(new_rows['crossings']):
+        if old_rows['crossings'].get(survey_id) != new_rows['crossings'].get(survey_id):
+            surveys.add(survey_id)
+
+    replaced_ids = set()
+    for rows in [old_rows, new_rows]:
+        for survey_id in surveys:
+            replaced_ids.update(rows['crossings'].get(survey_id, []))
+
+    position = {}
+    new_barrier_ids = new_field_data['BarrierID'].tolist()
+    for row in range(len(new_barrier_ids)):
+        position[new_barrier_ids[row]] = row
+
+    return {
+        'surveys': surveys,
+        'changed_culverts': len(changed_ids),
+        'new_rows': numpy.in1d(numpy.asarray(new_field_data['Survey_ID'], dtype = object), list(surveys)),
+        'replaced_ids': replaced_ids,
+        'position': position
+    }
+
+# Index the rows of some field data by BarrierID.
+# Returns a dictionary with the values of each culvert (values), the Survey_ID of each culvert
+# (surveys) and the BarrierIDs of each crossing in order (crossings), or None if a BarrierID
+# is repeated or a culvert has no Survey_ID.
+def culvert_rows(field_data):
+    names = sorted(field_data.keys())
+    barrier_ids = field_data['BarrierID'].tolist()
+    survey_ids = numpy.asarray(field_data['Survey_ID'], dtype = object).tolist()
+    columns = [numpy.asarray(field_data[name]).tolist() for name in names]
+
+    values = {}
+    surveys = {}
+    crossings = {}
+    for row in range(len(barrier_ids)):
+        barrier_id = barrier_ids[row]
+        survey_id = survey_ids[row]
+        if barrier_id in values or survey_id in ['', '-1']:
+            return None
+        # repr, so that nan equals nan and floats are compared exactly.
+        values[barrier_id] = tuple([repr(column[row]) for column in columns])
+        surveys[barrier_id] = survey_id
+        crossings.setdefault(survey_id, []).append(barrier_id)
+    return {'values': values, 'surveys': surveys, 'crossings': crossings}
+
+# Select some rows of a dictionary of columns.
+def select_rows(columns, rows):
+    selected = {}
+    for name in columns:
+        selected[name] = numpy.asarray(columns[name])[rows]
+    return selected
+
+# Patch the rows of changed crossings into existing csv output files.
+# Parameters:
+#   patches: list of (filename, save_changed) pairs, where save_changed is a function that
+#       saves the recalculated rows, in the same format, to the filename it is given.
+#   changes: the changes found by find_changes.
+# In each file, the rows whose first column (the BarrierID) is one of changes['replaced_ids']
+# are replaced by the recalculated rows, and the rows put in the order of the field data.
+# Returns True if every file was patched. Nothing is changed, and False is returned, if any
+# file is missing, has different headers or has rows for culverts not in the field data.
+def patch_outputs(patches, changes):
+    replaced_ids = changes['replaced_ids']
+    position = changes['position']
+
+    patched = []
+    for filename, save_changed in patches:
+        if not os.path.isfile(filename):
+            return False
+        handle, changed_filename = tempfile.mkstemp('.csv', 'changed_', os.path.dirname(os.path.abspath(filename)))
+        os.close(handle)
+        try:
+            save_changed(changed_filename)
+            changed_headers, changed_rows = read_rows(changed_filename)
+        finally:
+            os.remove(changed_filename)
+
+        headers, rows = read_rows(filename)
+        if headers != changed_headers:
+            return False
+        rows = [row for row in rows if row[0] not in replaced_ids] + changed_rows
+        for row in rows:
+            if row[0] not in position:
+                return False
+        rows.sort(key = lambda row: position[row[0]])
+        patched.append((filename, headers, rows))
+
+    # Only write once every file is ready.
+    for filename, headers, rows in patched:
+        with open(filename, 'wb') as output_file:
+            csv_writer = csv.writer(output_file)
+            csv_writer.writerow(headers)
+            csv_writer.writerows(rows)
+    return True
+
+# Read the header and rows of a csv file, as they are (strings).
+def read_rows(filename):
+    with open(filename, 'rb') as input_file:
+        rows = list(csv.reader(input_file))
+    if len(rows) == 0:
+        return None, []
+    return rows[0], rows[1:]
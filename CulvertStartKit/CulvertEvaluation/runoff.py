@@ -15,50 +15,96 @@
 # Inputs:   culvert_Q_input.csv: culvertID, watershed area (sq km), average curve number, time of concentration (hr)
 #           ws_precip: csv file exported from the Cornell NRCC of 24 hour storms with return periods 1 to 500 years
 #           rainfall_adjustment: scalar, with 1 as current rainfall.
+#               Or a list of scalars (e.g. [1.0, 1.05, 1.10, 1.15, 1.20]) to calculate several
+#               rainfall scenarios in one pass.
 #           output_filename: where to save the results of the runoff calculation.
+#               When rainfall_adjustment is a list, a list of filenames, one per scenario.
 #
 # Outputs:  table of runoff (q_peak) in cubic meters per second for each return periods under current precipitation conditions
 #           table of runoff (q_peak) in cubic meters per second for each return periods under future precipitation conditions
 
-import numpy, os, re, csv, sys, loader
+import numpy, os, re, csv, sys, loader, idf
 #Imports required packages and modules and the function 'loader' which was written
 # in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
 
-def calculate(sorted_filename, watershed_precip_input_filename, rainfall_adjustment, output_filename):
-    # Precipitation values (cm) are average for the overall watershed, for 24 hour storm, from NRCC
-    # 1yr,2yr,5yr,10yr,25 yr,50 yr,100yr,200 yr,500 yr storm
-    # Rainfall values are read directly from the standard NRCC output format and converted into cm.
-
-    # Define signature for sorted watershed data input file.
-    # This creates a list of dictionaries that stores the relevant headers of
-    # the input file and the type of data in the column under that header
-    watershed_data_signature = [
-        {'name': 'BarrierID', 'type': str},
-        #eg: The first element of the list 'watershed_data_signature' is a dictionary for barrier id.
-        #'BarrierID' is the header of a column of data we want to extract from the input file,containing
-        #data of type strings
-        {'name': 'Area_sqkm', 'type': float},
-        {'name': 'Tc_hr', 'type': float},
-        {'name': 'CN', 'type': float}
-        # Future: latitude and longitude and flags (aka number_of_culverts).
-    ];
-
-    # Define signature for watershed precipitation input file.
-    precip_data_signature = [
-        # Technically would be wise to also load the Freq (
-        {'name': '24-hr', 'type': float}
-    ];
+# Define signature for sorted watershed data input file.
+# This creates a list of dictionaries that stores the relevant headers of
+# the input file and the type of data in the column under that header
+watershed_data_signature = [
+    {'name': 'BarrierID', 'type': str},
+    #eg: The first element of the list 'watershed_data_signature' is a dictionary for barrier id.
+    #'BarrierID' is the header of a column of data we want to extract from the input file,containing
+    #data of type strings
+    {'name': 'Area_sqkm', 'type': float},
+    {'name': 'Tc_hr', 'type': float},
+    {'name': 'CN', 'type': float}
+    # Future: latitude and longitude and flags (aka number_of_culverts).
+];
+
+# Define signature for watershed precipitation input file.
+precip_data_signature = [
+    # Technically would be wise to also load the Freq (
+    {'name': '24-hr', 'type': float}
+];
+
+# The return periods of the NRCC storms, and the runoff output header for each.
+return_period_headers = ['Y1','Y2','Y5','Y10','Y25','Y50','Y100','Y200','Y500']
+
+# How to calculate the peak discharge of small watersheds (smaller than small_watershed_max_area_sqkm):
+#   None: as for the others (TR-55, from the 24 hour storm).
+#   'rational': the rational method, Q = C i A, with the intensity i of the storm lasting the
+#       time of concentration (see idf.py) and C the share of that storm that runs off
+#       (by the curve number).
+small_watershed_method = None
+small_watershed_max_area_sqkm = 0.8
 
+def calculate(sorted_filename, watershed_precip_input_filename, rainfall_adjustment, output_filename):
     # Load and validate watershed data.
-    # watershed_data will now store the relevant data from the culvert geometry input file
-    # in the format described in loader.py using the signature defined above.
-    # valid_rows will store all value for the key 'valid_rows' in the dictionary watershed_data
-    watershed_data = loader.load(sorted_filename, watershed_data_signature, 1, -1)
-    #Header in row 1, and we want to read all rows (max rows= -1)
-    valid_watersheds = watershed_data['valid_rows']
+    # watersheds will now store the relevant data from the sorted watershed input file
+    # in the columnar format described in loader.py using the signature defined above,
+    # i.e. one array per header, so the whole county can be calculated at once.
+    watersheds = load_watersheds(sorted_filename)
 
     # Load precipitation data.
+    precips = load_precipitation(watershed_precip_input_filename)
+    idf_depths = None
+    if small_watershed_method != None:
+        idf_depths = idf.load_table(watershed_precip_input_filename)['depths']
+
+    # A single adjustment and filename is just a list of one scenario.
+    adjustments = numpy.atleast_1d(numpy.asarray(rainfall_adjustment, dtype = numpy.float64))
+    output_filenames = output_filename
+    if numpy.ndim(rainfall_adjustment) == 0:
+        output_filenames = [output_filename]
+    if len(output_filenames) != len(adjustments):
+        print "ERROR: got " \
+            + str(len(adjustments)) \
+            + " rainfall adjustments but " \
+            + str(len(output_filenames)) \
+            + " runoff output filenames. Bailing out."
+        sys.exit(0)
+
+    # Run the calculation for every watershed, every scenario and every precipitation at once.
+    runoffs = scenario_runoff(watersheds, precips, adjustments, idf_depths)
+
+    # Save each scenario to its own file.
+    for scenario in range(len(adjustments)):
+        save(output_filenames[scenario], runoffs, scenario)
+
+# Load the sorted watershed data written by sorter.py.
+# Returns a dictionary of columns (see loader.load_columns) holding the valid rows.
+def load_watersheds(sorted_filename):
+    watershed_data = loader.load_columns(sorted_filename, watershed_data_signature, 1, -1)
+    #Header in row 1, and we want to read all rows (max rows= -1)
+    return loader.valid_columns(watershed_data)
+
+# Load the precipitation values from an NRCC export.
+# Precipitation values (cm) are average for the overall watershed, for 24 hour storm, from NRCC
+# 1yr,2yr,5yr,10yr,25 yr,50 yr,100yr,200 yr,500 yr storm
+# Rainfall values are read directly from the standard NRCC output format and converted into cm.
+# Returns an array of the 9 precipitation values, in cm and not yet adjusted.
+def load_precipitation(watershed_precip_input_filename):
     precip_data = loader.load(watershed_precip_input_filename, precip_data_signature, 10, 9)
      #Header in row 10, and there are 9 rows to read (max rows= 9)
     precip_rows = precip_data['valid_rows']
@@ -70,98 +116,177 @@ def calculate(sorted_filename, watershed_precip_input_filename, rainfall_adjustm
             + "'. Bailing out."
         sys.exit(0)
 
-    # Create list of preciptations, converted to metric and adjusted.
+    # Create list of preciptations, converted to metric.
     precips_list = []
     for row in precip_rows:
-        precips_list.append(row['24-hr'] * 2.54 * rainfall_adjustment)
+        precips_list.append(row['24-hr'] * 2.54)
         #coverts from inches (nrcc default) to cm 
 
     # Clever multi-math technique: convert precips list to a vector aka array:
-    P = numpy.array(precips_list)
-
-    # Run the calculation for each watershed and each precipitation:
-    results = []
-    skipped_watersheds = []
-    for watershed in valid_watersheds:
-
-        #Store our watershed values in handy variables for calculations (from watershed dictionary)
-        BarrierID = watershed['BarrierID']
-        ws_area = watershed['Area_sqkm'] #sq km, calculated with ArcGIS tools 
-        tc = watershed['Tc_hr'] #time of concentration in hours, calculated by ArcGIS script
-        CN = watershed['CN'] #area-weighted average curve number
-
-        # Skip over watersheds where curve number or time of concentration 
-        # are 0 or watershed area < 0.01, since this indicates invalid data.
-        # Note that this results in output files with potentially fewer 
-        # watersheds in them than in the input file.
-        if CN == 0:
-            skipped_watersheds.append({'watershed': watershed, 'reason': 'CN = 0'})
-            continue
-
-        if tc == 0:
-            skipped_watersheds.append({'watershed': watershed, 'reason': 'Tc_hr = 0'})
-            continue
-
-        if  ws_area < 0.01:
-            skipped_watersheds.append({'watershed': watershed, 'reason': 'Area_sqkm < 0.01'})
-            continue 
-            
-        # calculate storage, S  and Ia in cm
-        Storage = 0.1 * ((25400.0 / CN) - 254.0) #cm
-        Ia = 0.2 * Storage #inital abstraction, amount of precip that never has a chance to become runoff (cm)
-    
-        # calculate depth of runoff from each storm
-        # if P < Ia NO runoff is produced
-        # Note that P is a vector of the 9 values, so everything hereafter is too.
-        Pe = (P - Ia) #cm
-        Pe = numpy.array([0 if i < 0 else i for i in Pe]) # get rid of negative Pe's
-        Q = (Pe ** 2) / (P + (Storage - Ia)) #cm
-
-        
-        #calculate q_peak, cubic meters per second
-        # q_u is an adjustment because these watersheds are very small. It is a function of tc,
-        # and constants Const0, Const1, and Const2 which are in turn functions of Ia/P (rain_ratio) and rainfall type
-        # We are using rainfall Type II because that is applicable to most of New York State
-        # rain_ratio is a vector with one element per input return period
-        rain_ratio = Ia / P
-        rain_ratio = numpy.array([.1 if i < .1 else .5 if i > .5 else i for i in rain_ratio])
-        # keep rain ratio within limits set by TR55
-        #Calculated
-        Const0 = (rain_ratio ** 2) * -2.2349 + (rain_ratio * 0.4759) + 2.5273
-        Const1 = (rain_ratio ** 2) *  1.5555 - (rain_ratio * 0.7081) - 0.5584
-        Const2 = (rain_ratio ** 2) *  0.6041 + (rain_ratio * 0.0437) - 0.1761
-
-        qu = 10 ** (Const0 + Const1 * numpy.log10(tc) + Const2 * (numpy.log10(tc)) ** 2 - 2.366)
-        # qu would have to be m^3/s per km^2 per cm
-        q_peak = Q * qu * ws_area #m^3/s
-        #qu has weird units which take care of the difference between Q in cm and area in km2
-
-        # Convert our vector back to a list and add the other info to the front.
-        result = [BarrierID, ws_area, tc, CN] + q_peak.tolist()
-        
-        # Lastly, put our result for this watershed into the list of results.
-        results.append(result)
-
-    # Set up to save results to new file.
-    with open(output_filename, 'wb') as output_file:
-        csv_writer = csv.writer(output_file)
-
-        # Header
-        csv_writer.writerow(['BarrierID', 'Area_sqkm', 'Tc_hr', 'CN', 'Y1','Y2','Y5','Y10','Y25','Y50','Y100','Y200','Y500'])
-
-        # Each row.
-        # Later: when flags (aka number_of_culverts) is present, skip ahead that number
-        # instead of just 1 in the results list (ie, ignore the second, third, etc. culvert.)
-        for result in results:
-            csv_writer.writerow(result)
-
-    # output_file closed by with
+    return numpy.array(precips_list)
+
+# Calculate runoff for every watershed under every rainfall scenario.
+# Parameters:
+#   watersheds: dictionary of watershed columns (BarrierID, Area_sqkm, Tc_hr and CN).
+#   precips: array of the 9 precipitation values in cm, from load_precipitation.
+#       Or one row of them per watershed (see precip_surface.py).
+#   adjustments: array of rainfall adjustments, one per scenario, with 1 as current rainfall.
+#   idf_depths: the depth of every duration of the storms (cm, return periods x durations; see
+#       idf.py), or one row of them per watershed. Needed for small_watershed_method.
+# Returns a dictionary of columns for the watersheds that were calculated, plus 'q_peak',
+# an array of peak discharges (m^3/s) that is watersheds x scenarios x return periods.
+def scenario_runoff(watersheds, precips, adjustments, idf_depths = None):
+    # Adjust the precipitation: one row per rainfall scenario and one column per return period
+    # (after one per watershed, if each watershed has its own).
+    precips = numpy.asarray(precips, dtype = numpy.float64)
+    P = precips[..., numpy.newaxis, :] * numpy.asarray(adjustments, dtype = numpy.float64)[:, numpy.newaxis]
+
+    q_peak, keep, skip_reasons = peak_discharge(watersheds['Area_sqkm'], watersheds['Tc_hr'], watersheds['CN'], P, precips.ndim == 2)
+
+    # Small watersheds by another method, if one is chosen.
+    if small_watershed_method != None:
+        if small_watershed_method != 'rational':
+            print "ERROR: unknown small_watershed_method '" + str(small_watershed_method) + "'. Bailing out."
+            sys.exit(0)
+        if idf_depths is None:
+            print "ERROR: the rational method needs the precipitation of every duration (an NRCC export). Bailing out."
+            sys.exit(0)
+        kept = numpy.flatnonzero(keep)
+        small = watersheds['Area_sqkm'][kept] < small_watershed_max_area_sqkm
+        small_watersheds = kept[small]
+        idf_depths = numpy.asarray(idf_depths, dtype = numpy.float64)
+        if idf_depths.ndim == 3:
+            idf_depths = idf_depths[small_watersheds]
+        tc = watersheds['Tc_hr'][small_watersheds]
+        P_tc = idf.depths_at(idf.durations_hr, idf_depths, tc)
+        P_tc = P_tc[:, numpy.newaxis, :] * numpy.asarray(adjustments, dtype = numpy.float64)[:, numpy.newaxis]
+        q_peak[small] = rational_discharge(watersheds['Area_sqkm'][small_watersheds], tc, watersheds['CN'][small_watersheds], P_tc)
 
     # Also save thrown-out watersheds into another file, if there were any.
-    if len(skipped_watersheds) > 0:
+    if len(skip_reasons) > 0:
         # TODO
         #Notifies user of skipped watersheds
         print "NOTE: skipped " \
-            + str(len(skipped_watersheds)) \
+            + str(len(skip_reasons)) \
             + " watersheds."
 
+    return {
+        'BarrierID': watersheds['BarrierID'][keep],
+        'Area_sqkm': watersheds['Area_sqkm'][keep],
+        'Tc_hr': watersheds['Tc_hr'][keep],
+        'CN': watersheds['CN'][keep],
+        'q_peak': q_peak
+    }
+
+# Save one scenario's runoff results to a new file.
+# Parameters:
+#   output_filename: where to save the results.
+#   runoffs: the results of scenario_runoff.
+#   scenario: index of the scenario to save.
+def save(output_filename, runoffs, scenario):
+    # The watershed info followed by its q_peak for each return period.
+    # Later: when flags (aka number_of_culverts) is present, skip ahead that number
+    # instead of just 1 in the results list (ie, ignore the second, third, etc. culvert.)
+    columns = {}
+    for header in ['BarrierID', 'Area_sqkm', 'Tc_hr', 'CN']:
+        columns[header] = runoffs[header]
+    for i in range(len(return_period_headers)):
+        columns[return_period_headers[i]] = runoffs['q_peak'][:, scenario, i]
+    loader.save_columns(output_filename, ['BarrierID', 'Area_sqkm', 'Tc_hr', 'CN'] + return_period_headers, columns)
+
+# Peak discharge for many watersheds and storms at once.
+# Parameters:
+#   ws_area: array of watershed areas (sq km), calculated with ArcGIS tools
+#   tc: array of times of concentration (hr), calculated by ArcGIS script
+#   CN: array of area-weighted average curve numbers
+#   P: array of the storm precipitations (cm), one per return period.
+#      May also be 2-D (rainfall scenarios x return periods).
+#   P_per_watershed: if True, P has one more axis in front, one row per watershed. Optional.
+# Returns:
+#   q_peak: array of peak discharges (m^3/s), one row per kept watershed and one column per storm
+#           (or, for 2-D P, watersheds x scenarios x storms).
+#   keep: boolean array, True for each watershed that was calculated.
+#   skip_reasons: dictionary mapping the index of each skipped watershed to why it was skipped.
+def peak_discharge(ws_area, tc, CN, P, P_per_watershed = False):
+    ws_area = numpy.asarray(ws_area, dtype = numpy.float64)
+    tc = numpy.asarray(tc, dtype = numpy.float64)
+    CN = numpy.asarray(CN, dtype = numpy.float64)
+    P = numpy.asarray(P, dtype = numpy.float64)
+
+    # Skip over watersheds where curve number or time of concentration 
+    # are 0 or watershed area < 0.01, since this indicates invalid data.
+    # Note that this results in output files with potentially fewer 
+    # watersheds in them than in the input file.
+    # Each watershed is reported under the first rule it breaks.
+    skip_reasons = {}
+    for index in numpy.flatnonzero(ws_area < 0.01):
+        skip_reasons[index] = 'Area_sqkm < 0.01'
+    for index in numpy.flatnonzero(tc == 0):
+        skip_reasons[index] = 'Tc_hr = 0'
+    for index in numpy.flatnonzero(CN == 0):
+        skip_reasons[index] = 'CN = 0'
+    keep = (CN != 0) & (tc != 0) & ~(ws_area < 0.01)
+
+    # From here on, each watershed is a row and each storm is a column (with scenarios
+    # in between, if P has them), so every calculation is done for all watersheds,
+    # scenarios and storms in one go.
+    if P_per_watershed:
+        P = P[keep]
+    ws_shape = (-1,) + (1,) * (P.ndim - 1 if P_per_watershed else P.ndim)
+    ws_area = ws_area[keep].reshape(ws_shape)
+    tc = tc[keep].reshape(ws_shape)
+    CN = CN[keep].reshape(ws_shape)
+
+    # calculate storage, S  and Ia in cm
+    Storage = 0.1 * ((25400.0 / CN) - 254.0) #cm
+    Ia = 0.2 * Storage #inital abstraction, amount of precip that never has a chance to become runoff (cm)
+
+    # calculate depth of runoff from each storm
+    # if P < Ia NO runoff is produced
+    Pe = (P - Ia) #cm
+    Pe = numpy.maximum(Pe, 0) # get rid of negative Pe's
+    Q = (Pe ** 2) / (P + (Storage - Ia)) #cm
+
+    #calculate q_peak, cubic meters per second
+    # q_u is an adjustment because these watersheds are very small. It is a function of tc,
+    # and constants Const0, Const1, and Const2 which are in turn functions of Ia/P (rain_ratio) and rainfall type
+    # We are using rainfall Type II because that is applicable to most of New York State
+    # rain_ratio has one element per watershed, scenario and return period
+    rain_ratio = Ia / P
+    rain_ratio = numpy.clip(rain_ratio, .1, .5)
+    # keep rain ratio within limits set by TR55
+    #Calculated
+    Const0 = (rain_ratio ** 2) * -2.2349 + (rain_ratio * 0.4759) + 2.5273
+    Const1 = (rain_ratio ** 2) *  1.5555 - (rain_ratio * 0.7081) - 0.5584
+    Const2 = (rain_ratio ** 2) *  0.6041 + (rain_ratio * 0.0437) - 0.1761
+
+    qu = 10 ** (Const0 + Const1 * numpy.log10(tc) + Const2 * (numpy.log10(tc)) ** 2 - 2.366)
+    # qu would have to be m^3/s per km^2 per cm
+    q_peak = Q * qu * ws_area #m^3/s
+    #qu has weird units which take care of the difference between Q in cm and area in km2
+
+    return q_peak, keep, skip_reasons
+
+# Peak discharge by the rational method, Q = C i A, for many watersheds and storms at once.
+# Parameters:
+#   ws_area: array of watershed areas (sq km).
+#   tc: array of times of concentration (hr), which is also how long the storms last.
+#   CN: array of area-weighted average curve numbers.
+#   P_tc: array of the depth (cm) of each storm lasting tc: one row per watershed, then
+#       (rainfall scenarios and) return periods.
+# Returns an array of peak discharges (m^3/s), the shape of P_tc.
+def rational_discharge(ws_area, tc, CN, P_tc):
+    ws_shape = (-1,) + (1,) * (P_tc.ndim - 1)
+    ws_area = numpy.asarray(ws_area, dtype = numpy.float64).reshape(ws_shape)
+    tc = numpy.asarray(tc, dtype = numpy.float64).reshape(ws_shape)
+    CN = numpy.asarray(CN, dtype = numpy.float64).reshape(ws_shape)
+
+    # C: the share of the storm that runs off, by the curve number (as in peak_discharge).
+    Storage = 0.1 * ((25400.0 / CN) - 254.0) #cm
+    Ia = 0.2 * Storage #cm
+    Pe = numpy.maximum(P_tc - Ia, 0) #cm
+    C = (Pe ** 2) / (P_tc + (Storage - Ia)) / P_tc
+
+    # i in cm/hr; 1 cm/hr over 1 km^2 is 10000/3600 m^3/s.
+    i = P_tc / tc
+    return C * i * ws_area * (10000.0 / 3600)
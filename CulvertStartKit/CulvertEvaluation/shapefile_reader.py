@@ -0,0 +1,301 @@
+# Shapefile reader
+# October 2026
+#
+# Reads ESRI shapefiles (e.g. All_Culverts_shapefile, or a layer of watershed polygons) straight
+# into the model, so layers don't have to be exported to csv from ArcGIS first. Plain python and
+# numpy: the .shp, .shx and .dbf files are memory-mapped, so only the parts that are used are read.
+#
+# Every record's place in the .shp file comes from the .shx index, so the location of any
+# record (a point, or the bounding box of a line or polygon) can be read without going through
+# the ones before it, and a layer can be filtered to a bounding box without reading the rest
+# of the geometry. The attributes come from the .dbf table, read all at once as fixed-width
+# records. Geometry is given as two extra columns, X and Y: the point of a point layer, or the
+# center of the bounding box of anything else (in the layer's own coordinates; see its .prj).
+#
+# loader.load_columns (and so every step of the model) reads a filename ending in .shp or .dbf
+# with this module, so e.g. the watershed data in county_list.csv can be a shapefile whose
+# table has the BarrierID, Area_sqkm, Tc_hr and CN columns. Records deleted in the .dbf are
+# left out.
+#
+# Usage:
+#   layer = shapefile_reader.Shapefile('All_Culverts_shapefile/All_Culverts.shp')
+#   records = layer.select((-74.3, 42.3, -73.8, 42.6))  # xmin, ymin, xmax, ymax
+#   x, y = layer.locations(records)
+#   barrier_ids = layer.attribute('BarrierID', records)
+# or
+#   column_data = shapefile_reader.load_columns('All_Culverts_shapefile/All_Culverts.shp',
+#       [{'name': 'BarrierID', 'type': str}, {'name': 'X', 'type': float}, {'name': 'Y', 'type': float}], 1, -1)
+
+import mmap, os, struct, sys
+import numpy
+
+# Shape types whose records are single points (Point, PointZ and PointM).
+point_types = [1, 11, 21]
+shapefile_code = 9994
+
+# Whether a filename is a shapefile (rather than a csv file).
+def is_shapefile(filename):
+    return os.path.splitext(filename)[1].lower() in ['.shp', '.dbf']
+
+# The files of a shapefile that exist (the .shp, .shx and .dbf), whichever of them is named.
+def component_filenames(filename):
+    base = os.path.splitext(filename)[0]
+    filenames = []
+    for extension in ['.shp', '.shx', '.dbf']:
+        for name in [base + extension, base + extension.upper()]:
+            if os.path.isfile(name):
+                filenames.append(name)
+                break
+    return filenames
+
+# Memory-map a file (read only) as an array of bytes, or None if there is no such file.
+def map_file(filename):
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, 'rb') as input_file:
+        if os.path.getsize(filename) == 0:
+            return numpy.zeros(0, dtype = numpy.uint8)
+        mapped = mmap.mmap(input_file.fileno(), 0, access = mmap.ACCESS_READ)
+    return numpy.frombuffer(mapped, dtype = numpy.uint8)
+
+# Read count values of a type, starting at each of the given byte offsets of data.
+# Returns an array with one row per offset.
+def gather(data, offsets, dtype, count):
+    dtype = numpy.dtype(dtype)
+    offsets = numpy.asarray(offsets, dtype = numpy.int64)
+    byte_index = offsets[:, numpy.newaxis] + numpy.arange(dtype.itemsize * count)
+    return numpy.ascontiguousarray(data[byte_index]).view(dtype).reshape(len(offsets), count)
+
+class Shapefile(object):
+
+    # Parameters:
+    #   filename: the .shp (or .dbf) file of the shapefile. The .shx and .dbf (or .shp) files
+    #       next to it are found by name. A .dbf without a .shp is read as a table without geometry.
+    def __init__(self, filename):
+        self.filename = filename
+        base = os.path.splitext(filename)[0]
+        self.shp = self.shx = self.dbf = None
+        for name in component_filenames(filename):
+            setattr(self, os.path.splitext(name)[1].lower()[1:], map_file(name))
+        if self.shp is None and self.dbf is None:
+            print "ERROR: Could not find shapefile '" + filename + "'. Bailing out."
+            sys.exit(0)
+
+        self.shape_type = None
+        self.bounding_box = None
+        self.offsets = numpy.zeros(0, dtype = numpy.int64)
+        if self.shp is not None:
+            self.read_shp_header(base)
+        self.fields = []
+        self.table = None
+        if self.dbf is not None:
+            self.read_dbf()
+
+    # Read the header of the .shp file and the record offsets.
+    def read_shp_header(self, base):
+        header = self.shp[:100].tostring()
+        if len(header) < 100 or struct.unpack('>i', header[0:4])[0] != shapefile_code:
+            print "ERROR: '" + base + ".shp' is not a shapefile. Bailing out."
+            sys.exit(0)
+        self.shape_type = struct.unpack('<i', header[32:36])[0]
+        self.bounding_box = struct.unpack('<4d', header[36:68])
+
+        if self.shx is not None and len(self.shx) >= 100:
+            # Offset and length (in 16-bit words) of every record, big-endian.
+            index = numpy.frombuffer(self.shx[100:].tostring(), dtype = '>i4').reshape(-1, 2)
+            self.offsets = index[:, 0].astype(numpy.int64) * 2
+        else:
+            # No index: walk the record headers instead.
+            offsets = []
+            file_length = min(struct.unpack('>i', header[24:28])[0] * 2, len(self.shp))
+            offset = 100
+            while offset + 8 <= file_length:
+                offsets.append(offset)
+                content_length = struct.unpack('>i', self.shp[offset + 4:offset + 8].tostring())[0]
+                offset += 8 + content_length * 2
+            self.offsets = numpy.array(offsets, dtype = numpy.int64)
+
+    # Read the header and field descriptions of the .dbf file, and map its records.
+    def read_dbf(self):
+        header = self.dbf[:32].tostring()
+        num_records, header_length, record_length = struct.unpack('<IHH', header[4:12])
+
+        names = ['deleted']
+        formats = ['S1']
+        field_offsets = [0]
+        field_offset = 1
+        position = 32
+        while position + 32 <= header_length and self.dbf[position] != 0x0D:
+            descriptor = self.dbf[position:position + 32].tostring()
+            field_length = ord(descriptor[16])
+            self.fields.append({
+                'name': descriptor[:11].split('\0')[0],
+                'type': descriptor[11],
+                'length': field_length,
+                'decimals': ord(descriptor[17])
+            })
+            names.append(self.fields[-1]['name'])
+            formats.append('S' + str(field_length))
+            field_offsets.append(field_offset)
+            field_offset += field_length
+            position += 32
+
+        available = (len(self.dbf) - header_length) // max(record_length, 1)
+        num_records = min(num_records, available)
+        table_type = numpy.dtype({'names': names, 'formats': formats, 'offsets': field_offsets, 'itemsize': record_length})
+        self.table = numpy.frombuffer(self.dbf, dtype = table_type, count = num_records, offset = header_length)
+
+    # The number of records.
+    def num_records(self):
+        if self.shp is not None:
+            return len(self.offsets)
+        return len(self.table)
+
+    # The names of the attributes (fields of the .dbf table).
+    def field_names(self):
+        return [field['name'] for field in self.fields]
+
+    # The shape type of each of the given records (0 for a null shape).
+    def record_types(self, records):
+        return gather(self.shp, self.offsets[records] + 8, '<i4', 1)[:, 0]
+
+    # The bounding box (xmin, ymin, xmax, ymax) of each of the given records (all four
+    # the point itself for a point; nan for a null shape), as an array with one row per record.
+    def bounding_boxes(self, records):
+        records = numpy.asarray(records, dtype = numpy.int64)
+        boxes = numpy.full((len(records), 4), numpy.nan)
+        if self.shp is None or len(records) == 0:
+            return boxes
+        types = self.record_types(records)
+        points = numpy.in1d(types, point_types)
+        if numpy.any(points):
+            xy = gather(self.shp, self.offsets[records[points]] + 12, '<f8', 2)
+            boxes[points] = numpy.hstack([xy, xy])
+        shapes = (types != 0) & ~points
+        if numpy.any(shapes):
+            boxes[shapes] = gather(self.shp, self.offsets[records[shapes]] + 12, '<f8', 4)
+        return boxes
+
+    # The location of each of the given records: the point, or the center of the bounding box.
+    # Returns the arrays x and y.
+    def locations(self, records):
+        boxes = self.bounding_boxes(records)
+        return (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+
+    # The indices of the records that aren't deleted and (if a bounding box is given) are in it:
+    # points inside it, or shapes whose bounding box overlaps it.
+    # Parameters:
+    #   bounding_box: (xmin, ymin, xmax, ymax), or None for every record.
+    def select(self, bounding_box = None):
+        records = numpy.arange(self.num_records())
+        if self.table is not None:
+            deleted = self.table['deleted'][:min(len(self.table), len(records))] == '*'
+            records = records[:len(deleted)][~deleted]
+        if bounding_box is not None and self.shp is not None:
+            xmin, ymin, xmax, ymax = bounding_box
+            boxes = self.bounding_boxes(records)
+            with numpy.errstate(invalid = 'ignore'):
+                inside = (boxes[:, 2] >= xmin) & (boxes[:, 0] <= xmax) & (boxes[:, 3] >= ymin) & (boxes[:, 1] <= ymax)
+            records = records[inside]
+        return records
+
+    # The values of an attribute for the given records, as the text in the table (stripped).
+    def attribute(self, name, records):
+        values = self.table[name][records]
+        return numpy.array([value.strip() for value in values.tolist()], dtype = object)
+
+    # Go through the given records one at a time (e.g. select()), yielding each one's index,
+    # location (x, y) and attributes (a dictionary of text).
+    def records(self, records, block_size = 10000):
+        names = self.field_names()
+        for start in range(0, len(records), block_size):
+            block = records[start:start + block_size]
+            x, y = self.locations(block)
+            values = [self.attribute(name, block) for name in names] if self.table is not None else []
+            for i in range(len(block)):
+                yield block[i], (x[i], y[i]), dict(zip(names, [column[i] for column in values]))
+
+# Load a shapefile as loader.load_columns does a csv file.
+# Parameters:
+#   filename: the .shp (or .dbf) file.
+#   required_headers: the signature of the attributes and their types, as for loader.load.
+#       X and Y are the location of each record (unless the table has attributes of those names).
+#   start_row: ignored (there is no header row).
+#   max_rows: how many records to read, or -1 for all of them.
+#   bounding_box: (xmin, ymin, xmax, ymax) to only read the records in it. Optional.
+# Returns the same dictionary as loader.load_columns, with the record numbers (from 1) as row numbers.
+def load_columns(filename, required_headers, start_row, max_rows, bounding_box = None):
+    import loader
+    layer = Shapefile(filename)
+    records = layer.select(bounding_box)
+    if max_rows != -1:
+        records = records[:max_rows]
+    num_records = len(records)
+    field_names = layer.field_names()
+
+    missing_headers = []
+    for header in required_headers:
+        if header['name'] not in field_names and header['name'] not in ['X', 'Y'] and not header.get('optional', False):
+            missing_headers.append(header['name'])
+    if len(missing_headers) > 0:
+        print "ERROR: shapefile '" + filename + "' was missing the following required attributes: " \
+            + ", ".join(missing_headers) + ". Bailing out."
+        sys.exit(0)
+
+    x = y = None
+    columns = {}
+    valid_mask = numpy.ones(num_records, dtype = bool)
+    invalid_rows = []
+    for header in required_headers:
+        name = header['name']
+        header_type = header['type']
+        if name in field_names:
+            text = layer.attribute(name, records)
+        elif name in ['X', 'Y']:
+            if x is None:
+                x, y = layer.locations(records)
+            columns[name] = x if name == 'X' else y
+            continue
+        else:
+            columns[name] = numpy.full(num_records, loader.column_fill_value(header_type), dtype = loader.column_dtype(header_type))
+            continue
+
+        if header_type not in [float, int]:
+            columns[name] = text
+            continue
+        try:
+            columns[name] = text.astype(loader.column_dtype(header_type))
+            continue
+        except ValueError:
+            pass
+        # Some values don't parse: go through them one by one, as the loader does.
+        values = numpy.full(num_records, loader.column_fill_value(header_type), dtype = loader.column_dtype(header_type))
+        for i in range(num_records):
+            try:
+                values[i] = header_type(text[i])
+            except ValueError:
+                if valid_mask[i]:
+                    valid_mask[i] = False
+                    invalid_rows.append({
+                        "row_number": int(records[i]) + 1,
+                        "row": [text[i]],
+                        "reason_invalid": "in record " + str(int(records[i]) + 1) + ", attribute " + name \
+                            + " of shapefile '" + filename + "', the value '" + text[i] \
+                            + "' could not be parsed to " + str(header_type) + "."
+                    })
+        columns[name] = values
+
+    # Invalid rows hold the filler value in every column, as in loader.load_columns.
+    if not numpy.all(valid_mask):
+        for header in required_headers:
+            column = columns[header['name']]
+            if header['type'] in [float, int] or column.dtype == object:
+                column[~valid_mask] = loader.column_fill_value(header['type'])
+
+    invalid_rows.sort(key = lambda invalid_row: invalid_row['row_number'])
+    return {
+        "columns": columns,
+        "valid_mask": valid_mask,
+        "row_numbers": records.astype(numpy.int64) + 1,
+        "invalid_rows": invalid_rows
+    }
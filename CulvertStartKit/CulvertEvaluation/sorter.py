@@ -6,32 +6,35 @@
 # Some comments added by Tanvi Naidu 6/13/2017
 # This script will sort the ws data exported from GIS by ID number
 
-import csv, sys, operator, numpy, loader
+import csv, sys, operator, numpy, loader, join_index
 #Imports required packages and modules (numpy, os, re, csv) and the function loader
 # which was written in 2016 and saved as loader.py
 #(loader organizes the data from input file based on headers defined in a signature)
 
-def sort(watershed_data_input_filename, county_abbreviation, output_filename):
-
-    # Define signature for input file.
-    # This creates a list of dictionaries that stores the relevant headers of
-    # the input file and the type of data in the column under that header
+# Define signature for input file.
+# This creates a list of dictionaries that stores the relevant headers of
+# the input file and the type of data in the column under that header
+watershed_data_signature = [
+    {'name': 'BarrierID', 'type': str},
+    {'name': 'Area_sqkm', 'type': float},
+    {'name': 'Tc_hr', 'type': float},
+    {'name': 'CN', 'type': float}
+    # Future: latitude and longitude.
+];
 
-    watershed_data_signature = [
-        {'name': 'BarrierID', 'type': str},
-        {'name': 'Area_sqkm', 'type': float},
-        {'name': 'Tc_hr', 'type': float},
-        {'name': 'CN', 'type': float}
-        # Future: latitude and longitude.
-    ];
+def sort(watershed_data_input_filename, county_abbreviation, output_filename):
+    watersheds = load(watershed_data_input_filename)
+    sorted_watersheds = sort_watersheds(watersheds, county_abbreviation)
+    save(output_filename, sorted_watersheds)
 
+# Load the watershed data exported from GIS.
+# Returns a dictionary of columns (see loader.load_columns) holding the valid rows.
+def load(watershed_data_input_filename):
     # Load data.
     # watershed_data will now store the relevant data from the watershed data input file
-    # in the format described in loader.py using the signature defined above.
-    # valid_watersheds will store all value for the key 'valid_rows' in the dictionary watershed_data
-    
-    watershed_data = loader.load(watershed_data_input_filename, watershed_data_signature, 1, -1)
-    valid_watersheds = watershed_data['valid_rows']
+    # in the columnar format described in loader.py using the signature defined above.
+    watershed_data = loader.load_columns(watershed_data_input_filename, watershed_data_signature, 1, -1)
+    valid_watersheds = loader.valid_columns(watershed_data)
 
     # If there were invalid watershed rows, make a note but continue on.
     num_invalid_rows = len(watershed_data['invalid_rows']) 
@@ -39,37 +42,45 @@ def sort(watershed_data_input_filename, county_abbreviation, output_filename):
         print "* Note: there were " \
             + str(num_invalid_rows) \
             + " invalid rows in the watershed data. Continuing with the " \
-            + str(len(valid_watersheds)) \
+            + str(len(valid_watersheds['BarrierID'])) \
             + " valid rows."
 
+    return valid_watersheds
+
+# Sort watersheds so they match original numbering (GIS changes numbering).
+# Parameters:
+#   watersheds: dictionary of watershed columns, as returned by load.
+#   county_abbreviation: *our* county abbreviation, added back onto each BarrierID number.
+# Returns a new dictionary of columns, sorted by BarrierID number.
+def sort_watersheds(watersheds, county_abbreviation):
     # Strip 'their' county abbreviation off the BarrierID string and cast to int, e.g., '10cmbws' -> 10
-    id_suffix_len = 5 #Abbreviations are usually 3-letter acronyms plus 'ws'.
-    #suffis length changed from 5 to 3 by Tanvi, 6/16
-    #changed back to 5 by Allison 8/10/17, due to 3 throwing an error (the acronyms still appear to be a three letter abbreviation plus ws, so 5 char total)
-    for watershed in valid_watersheds:
-        barrier_id = watershed['BarrierID']
-        watershed['BarrierID'] = int(barrier_id[:len(barrier_id) - id_suffix_len])
-    
-    # Sort the valid watersheds by this BarrierID number.
-    def get_id(row):
-        return row['BarrierID']
-    valid_watersheds = sorted(valid_watersheds, key = get_id, reverse = False)
+    # (whatever the length of the abbreviation; see join_index.py).
+    barrier_ids = join_index.parse_barrier_ids(watersheds['BarrierID'])
+    if numpy.any(barrier_ids['too_large']):
+        print "ERROR: the following watershed BarrierIDs have a number too large to sort (over " \
+            + str(join_index.max_number) + "): " \
+            + ", ".join(watersheds['BarrierID'][barrier_ids['too_large']].tolist()) \
+            + ". Bailing out."
+        sys.exit(0)
+    if not numpy.all(barrier_ids['valid']):
+        print "ERROR: the following watershed BarrierIDs don't start with a number: " \
+            + ", ".join(watersheds['BarrierID'][~barrier_ids['valid']].tolist()) \
+            + ". Bailing out."
+        sys.exit(0)
+    id_numbers = barrier_ids['numbers']
 
-    # Write the sorted data to a new csv file.
-    with open(output_filename, 'wb') as output_file:
-        output_writer = csv.writer(output_file)
+    # Sort the valid watersheds by this BarrierID number.
+    # (mergesort is stable, so watersheds with the same number keep their order.)
+    order = numpy.argsort(id_numbers, kind = 'mergesort')
 
-        # Header.
-        output_writer.writerow(['BarrierID','Area_sqkm','Tc_hr','CN'])
-    
-        # Row for each watershed.
-        # Note we are adding *our* county abbreviation back onto the BarrierID number.
-        for watershed in valid_watersheds:
-            output_writer.writerow([ \
-                str(watershed['BarrierID']) + county_abbreviation, \
-                watershed['Area_sqkm'], \
-                watershed['Tc_hr'], \
-                watershed['CN'] \
-            ])
+    # Note we are adding *our* county abbreviation back onto the BarrierID number.
+    return {
+        'BarrierID': numpy.array([str(id_number) + county_abbreviation for id_number in id_numbers[order].tolist()], dtype = object),
+        'Area_sqkm': watersheds['Area_sqkm'][order],
+        'Tc_hr': watersheds['Tc_hr'][order],
+        'CN': watersheds['CN'][order]
+    }
 
-    # File automatically closed by 'with'.
+# Write the sorted data to a new csv file.
+def save(output_filename, sorted_watersheds):
+    loader.save_columns(output_filename, ['BarrierID','Area_sqkm','Tc_hr','CN'], sorted_watersheds)
@@ -0,0 +1,107 @@
+# Spatial index of culverts
+# October 2026
+#
+# Groups culverts into crossings by where they are: culverts within a given distance of each
+# other (directly, or through a chain of culverts each within the distance of the next) are
+# one crossing. This is for culvert data without a Survey_ID, where the old way of finding
+# crossings (the Flags count, with the culverts of a crossing in adjacent rows) depends on the
+# order the data was entered in; see capacity.crossing_groups.
+#
+# The culverts are put in a grid hash: the Lat/Long of each is projected to meters
+# (equirectangular, which is plenty accurate over a few meters) and binned into square cells
+# the size of the distance. Culverts within the distance of each other are then always in
+# the same or neighboring cells, so only those pairs are compared. Sorting the culverts by
+# cell is the slowest part, so the whole thing takes O(n log n).
+#
+# Usage:
+#   crossing_data = spatial_index.crossings(culvert_geometry['Lat'], culvert_geometry['Long'], 5.0)
+#   crossing_data['crossing']  # e.g. [0, 0, 2, 3, 3, 3]: the first culvert of each one's crossing
+#   crossing_data['barrels']   # e.g. [2, 2, 1, 3, 3, 3]: how many culverts each one's crossing has
+
+import numpy
+
+# Mean radius of the earth, in meters.
+earth_radius_m = 6371000.0
+
+# Cells around (and including) a cell that hold every culvert within the distance of one in it.
+# Only half of them are needed, since each pair of neighboring cells is compared from one side.
+neighbor_cells = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+
+# Group culverts into crossings by location.
+# Parameters:
+#   lat, long: arrays of the latitude and longitude of each culvert, in degrees.
+#   distance_m: culverts this close (in meters) are at the same crossing.
+# Returns a dictionary with:
+#   crossing: array holding, for each culvert, the index of the first culvert (in the order
+#       given) of its crossing, which serves as the crossing's ID.
+#   barrels: array holding, for each culvert, the number of culverts at its crossing.
+# A culvert without a location (nan) is a crossing by itself.
+def crossings(lat, long, distance_m):
+    crossing = cluster(lat, long, distance_m)
+    barrels = numpy.bincount(crossing, minlength = len(crossing))[crossing]
+    return {'crossing': crossing, 'barrels': barrels}
+
+# The work of crossings: the crossing ID of each culvert.
+def cluster(lat, long, distance_m):
+    lat = numpy.asarray(lat, dtype = numpy.float64)
+    long = numpy.asarray(long, dtype = numpy.float64)
+    num_culverts = len(lat)
+    labels = numpy.arange(num_culverts)
+    located = numpy.flatnonzero(numpy.isfinite(lat) & numpy.isfinite(long))
+    if len(located) < 2 or not distance_m > 0:
+        return labels
+
+    # Project to meters, and find each culvert's cell.
+    y = earth_radius_m * numpy.radians(lat[located])
+    x = earth_radius_m * numpy.radians(long[located]) * numpy.cos(numpy.radians(lat[located]))
+    cell_x = numpy.floor(x / distance_m).astype(numpy.int64)
+    cell_y = numpy.floor(y / distance_m).astype(numpy.int64)
+    cell_x -= cell_x.min() - 1 # Keep a spare cell on each side, for the neighbors.
+    cell_y -= cell_y.min() - 1
+    num_cells_y = cell_y.max() + 2
+
+    # Sort the culverts by cell, so the culverts of any cell are found with a binary search.
+    cell = cell_x * num_cells_y + cell_y
+    order = numpy.argsort(cell, kind = 'mergesort')
+    sorted_cells = cell[order]
+
+    # Every pair of culverts in neighboring cells, within the distance of each other.
+    first = []
+    second = []
+    for offset_x, offset_y in neighbor_cells:
+        neighbor = cell + offset_x * num_cells_y + offset_y
+        start = numpy.searchsorted(sorted_cells, neighbor, side = 'left')
+        end = numpy.searchsorted(sorted_cells, neighbor, side = 'right')
+        count = end - start
+        total = count.sum()
+        if total == 0:
+            continue
+        pair_first = numpy.repeat(numpy.arange(len(located)), count)
+        run_start = numpy.cumsum(count) - count
+        pair_second = order[numpy.repeat(start, count) + (numpy.arange(total) - numpy.repeat(run_start, count))]
+        if (offset_x, offset_y) == (0, 0):
+            keep = pair_first < pair_second # Each pair once, and not a culvert with itself.
+        else:
+            keep = numpy.ones(total, dtype = bool)
+        pair_first = pair_first[keep]
+        pair_second = pair_second[keep]
+        close = numpy.hypot(x[pair_first] - x[pair_second], y[pair_first] - y[pair_second]) <= distance_m
+        first.append(located[pair_first[close]])
+        second.append(located[pair_second[close]])
+    if len(first) == 0:
+        return labels
+    first = numpy.concatenate(first)
+    second = numpy.concatenate(second)
+
+    # Join up the pairs: each culvert takes the smallest label of the culverts it is
+    # paired with, until nothing changes. (Following labels to their own labels each
+    # time makes long chains join up quickly.)
+    while True:
+        smallest = numpy.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        numpy.minimum.at(new_labels, first, smallest)
+        numpy.minimum.at(new_labels, second, smallest)
+        new_labels = new_labels[new_labels]
+        if numpy.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
@@ -0,0 +1,229 @@
+# Time of concentration
+# October 2026
+#
+# Works out the time of concentration (Tc_hr) of every culvert's watershed from its longest
+# flow path, for the Tc_hr column of the watershed table (see delineation.py). The peak flows
+# runoff.py calculates depend strongly on Tc, so the method can be chosen:
+#   kirpich: Kirpich's formula, from the length and average slope of the longest flow path.
+#   tr55: TR-55's segmental method: sheet flow for the first 100 ft of the path, then shallow
+#       concentrated flow (unpaved), then channel flow (Manning's equation) from where the
+#       path drains at least channel_area_sqkm. Needs the 2-year 24-hour rainfall.
+#   velocity: the velocity method (NEH 630 chapter 15): the travel time of each cell of the
+#       path at a velocity of k * sqrt(slope), with k for overland, shallow or channel flow.
+#
+# Getting the flow paths (routing) is the slow part, and doesn't depend on the method: the
+# length of the longest flow path to every cell (and where it starts) is worked out a level
+# at a time over delineation's flow order, and then every culvert's path is followed at once,
+# adding up the length, drop and travel time factor of each kind of flow. These flow paths
+# can be saved (with the rasters they came from) and loaded again, so Tc can be worked out
+# with another method or other parameters without routing again.
+#
+# Usage:
+#   watersheds = delineation.delineate(dem, barrier_ids, x, y, 30.0)
+#   paths = time_of_concentration.flow_paths(watersheds, dem)
+#   tc_hr = time_of_concentration.concentration_times(paths, 'kirpich')
+#   time_of_concentration.save_flow_paths('ALB/ALB_flow_paths.npz', paths)
+# or through delineation.py (see there): --tc-method kirpich --flow-paths ALB/ALB_flow_paths.npz
+# and then, for another method, without routing again:
+#   python time_of_concentration.py ALB/ALB_flow_paths.npz ALB/All_culverts.csv tr55 --precip ALB/ALB_precip.csv
+
+import argparse, csv, math, sys
+import numpy
+import loader
+
+methods = ['kirpich', 'tr55', 'velocity']
+
+# The kinds of flow along a path.
+flow_kinds = ['sheet', 'shallow', 'channel']
+
+# The first part of each path (in meters) is sheet flow: TR-55's limit of 100 ft.
+sheet_flow_length_m = 30.48
+# A path is channel flow where it drains at least this area.
+channel_area_sqkm = 0.1
+# Slopes are at least this (m/m), so flat paths don't take forever.
+minimum_slope = 0.0005
+
+# TR-55 parameters: Manning's n of sheet flow (dense grasses) and channels, and the hydraulic
+# radius of channels (m).
+sheet_flow_n = 0.24
+channel_n = 0.05
+channel_hydraulic_radius_m = 0.3
+# TR-55 shallow concentrated flow (unpaved): V = 16.1345 * sqrt(slope) ft/s, in m/s.
+shallow_flow_coefficient = 4.9178
+
+# Velocity method: V = k * sqrt(slope) in m/s, for each kind of flow (NEH 630 chapter 15:
+# short grass pasture, grassed waterway and paved area).
+velocity_coefficients = {'sheet': 2.1336, 'shallow': 4.572, 'channel': 6.1874}
+
+# The longest flow path to every cell.
+# Returns the arrays (of flat padded cells, as in watersheds) flow_length (meters from the
+# start of the longest path to the cell) and source (the cell the longest path starts at).
+def longest_paths(watersheds, dem):
+    downstream = watersheds['downstream']
+    width = watersheds['width']
+    flow_length = numpy.zeros(len(downstream), dtype = numpy.float32)
+    source = numpy.arange(len(downstream), dtype = downstream.dtype)
+    for level in watersheds['levels']:
+        targets = downstream[level]
+        drains = targets >= 0
+        level = level[drains]
+        targets = targets[drains]
+        lengths = (flow_length[level] + step_lengths(level, targets, width, dem['cellsize'])).astype(numpy.float32)
+        numpy.maximum.at(flow_length, targets, lengths)
+        longest = lengths == flow_length[targets]
+        source[targets[longest]] = source[level[longest]]
+    return flow_length, source
+
+# The length of the step from each cell to the next (diagonal or not).
+def step_lengths(cells, targets, width, cellsize):
+    difference = numpy.abs(targets - cells)
+    diagonal = (difference == width - 1) | (difference == width + 1)
+    return numpy.where(diagonal, cellsize * math.sqrt(2), cellsize)
+
+# Follow the longest flow path of every culvert's watershed.
+# Parameters:
+#   watersheds: from delineation.delineate.
+#   dem: the DEM they were delineated from.
+# Returns a dictionary with, for each outlet (see delineation.delineate), the length (m),
+# drop (m) and travel time factor (the sum of step length / sqrt(slope)) of each kind of flow
+# (e.g. sheet_length_m, channel_drop_m, shallow_time_factor), and the total length_m and
+# drop_m; plus BarrierID and outlet of each culvert and the rasters flow_length and source.
+def flow_paths(watersheds, dem):
+    downstream = watersheds['downstream']
+    width = watersheds['width']
+    cellsize = dem['cellsize']
+    filled = watersheds['filled']
+    channel = watersheds['accumulation'] * (cellsize ** 2 / 1e6) >= channel_area_sqkm
+    flow_length, source = longest_paths(watersheds, dem)
+
+    outlets = watersheds['outlets']
+    paths = {}
+    for kind in flow_kinds:
+        for quantity in ['length_m', 'drop_m', 'time_factor']:
+            paths[kind + '_' + quantity] = numpy.zeros(len(outlets))
+
+    # Every path at once, a cell at a time, until each reaches its outlet.
+    current = source[outlets]
+    travelled = numpy.zeros(len(outlets))
+    active = numpy.flatnonzero(current != outlets)
+    while len(active) > 0:
+        cells = current[active]
+        targets = downstream[cells]
+        lengths = step_lengths(cells, targets, width, cellsize)
+        drops = filled[cells] - filled[targets]
+        slopes = numpy.maximum(drops / lengths, minimum_slope)
+        kind_index = numpy.where(channel[cells], 2, numpy.where(travelled[active] < sheet_flow_length_m, 0, 1))
+        for index, kind in enumerate(flow_kinds):
+            steps = kind_index == index
+            numpy.add.at(paths[kind + '_length_m'], active[steps], lengths[steps])
+            numpy.add.at(paths[kind + '_drop_m'], active[steps], drops[steps])
+            numpy.add.at(paths[kind + '_time_factor'], active[steps], lengths[steps] / numpy.sqrt(slopes[steps]))
+        travelled[active] += lengths
+        current[active] = targets
+        active = active[targets != outlets[active]]
+
+    paths['length_m'] = sum([paths[kind + '_length_m'] for kind in flow_kinds])
+    paths['drop_m'] = sum([paths[kind + '_drop_m'] for kind in flow_kinds])
+    paths['BarrierID'] = watersheds['BarrierID']
+    paths['outlet'] = watersheds['outlet']
+    paths['flow_length'] = flow_length
+    paths['source'] = source
+    return paths
+
+# Save flow paths (from flow_paths), so Tc can be worked out again without routing.
+def save_flow_paths(filename, paths):
+    with open(filename, 'wb') as output_file:
+        numpy.savez_compressed(output_file, **paths)
+
+# Load flow paths saved by save_flow_paths.
+def load_flow_paths(filename):
+    with open(filename, 'rb') as input_file:
+        saved = numpy.load(input_file, allow_pickle = True)
+        return dict([(name, saved[name]) for name in saved.files])
+
+# Slope of a length and drop, at least minimum_slope (and minimum_slope where there is no length).
+def average_slopes(lengths, drops):
+    slopes = numpy.full(len(lengths), minimum_slope)
+    some = lengths > 0
+    slopes[some] = numpy.maximum(drops[some] / lengths[some], minimum_slope)
+    return slopes
+
+# The time of concentration of every culvert's watershed.
+# Parameters:
+#   paths: from flow_paths or load_flow_paths.
+#   method: 'kirpich', 'tr55' or 'velocity'.
+#   p2_in: the 2-year 24-hour rainfall (inches), for tr55.
+# Returns an array with the Tc (hours) of each culvert, nan for culverts outside the DEM.
+def concentration_times(paths, method = 'kirpich', p2_in = None):
+    if method == 'kirpich':
+        # Tc (min) = 0.0195 L^0.77 S^-0.385, with L in meters.
+        slopes = average_slopes(paths['length_m'], paths['drop_m'])
+        outlet_tc = 0.0195 * paths['length_m'] ** 0.77 * slopes ** -0.385 / 60
+    elif method == 'tr55':
+        if p2_in == None:
+            print "ERROR: the TR-55 time of concentration needs the 2-year 24-hour rainfall. Bailing out."
+            sys.exit(0)
+        # Sheet flow: Tt (hr) = 0.007 (n L)^0.8 / (P2^0.5 s^0.4), with L in feet and P2 in inches.
+        sheet_length_ft = paths['sheet_length_m'] / 0.3048
+        sheet_slopes = average_slopes(paths['sheet_length_m'], paths['sheet_drop_m'])
+        outlet_tc = 0.007 * (sheet_flow_n * sheet_length_ft) ** 0.8 / (math.sqrt(p2_in) * sheet_slopes ** 0.4)
+        # Shallow concentrated and channel flow: Tt = L / V.
+        shallow_velocity = shallow_flow_coefficient * numpy.sqrt(average_slopes(paths['shallow_length_m'], paths['shallow_drop_m']))
+        channel_velocity = channel_hydraulic_radius_m ** (2.0 / 3) / channel_n \
+            * numpy.sqrt(average_slopes(paths['channel_length_m'], paths['channel_drop_m']))
+        outlet_tc = outlet_tc + (paths['shallow_length_m'] / shallow_velocity + paths['channel_length_m'] / channel_velocity) / 3600
+    elif method == 'velocity':
+        outlet_tc = sum([paths[kind + '_time_factor'] / velocity_coefficients[kind] for kind in flow_kinds]) / 3600
+    else:
+        print "ERROR: unknown time of concentration method '" + str(method) + "' (use one of " + ", ".join(methods) + "). Bailing out."
+        sys.exit(0)
+
+    tc_hr = numpy.full(len(paths['outlet']), numpy.nan)
+    inside = paths['outlet'] >= 0
+    tc_hr[inside] = outlet_tc[paths['outlet'][inside]]
+    return tc_hr
+
+# The 2-year 24-hour rainfall (inches) of an NRCC export.
+def nrcc_p2_in(precip_filename):
+    import runoff
+    return runoff.load_precipitation(precip_filename)[1] / 2.54
+
+# Work out Tc_hr again for a watershed table from saved flow paths (see the top of this file).
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Work out Tc_hr of a watershed table from saved flow paths.')
+    parser.add_argument('flow_paths', help = 'flow paths saved by delineation.py --flow-paths')
+    parser.add_argument('watershed_table', help = 'the watershed table whose Tc_hr to replace')
+    parser.add_argument('method', choices = methods)
+    parser.add_argument('--precip', help = 'an NRCC export, for the 2-year 24-hour rainfall (tr55)')
+    arguments = parser.parse_args(argv)
+
+    paths = load_flow_paths(arguments.flow_paths)
+    p2_in = nrcc_p2_in(arguments.precip) if arguments.precip != None else None
+    tc_hr = concentration_times(paths, arguments.method, p2_in)
+    by_barrier_id = dict(zip(paths['BarrierID'].tolist(), tc_hr.tolist()))
+
+    # Every column of the table as it is (e.g. all the columns of an ArcGIS export), in order,
+    # with only Tc_hr replaced.
+    with open(arguments.watershed_table, 'rb') as table_file:
+        header_row = next(csv.reader(table_file), [])
+    signature = []
+    for name in header_row:
+        if name not in [header['name'] for header in signature]:
+            signature.append({'name': name, 'type': str})
+    for name in ['BarrierID', 'Tc_hr']:
+        if name not in header_row:
+            print "ERROR: watershed table '" + arguments.watershed_table + "' has no " + name + " column. Bailing out."
+            sys.exit(0)
+    table = loader.valid_columns(loader.load_columns(arguments.watershed_table, signature, 1, -1))
+    tc_column = table['Tc_hr'].copy()
+    replaced = 0
+    for i, barrier_id in enumerate(table['BarrierID'].tolist()):
+        if barrier_id in by_barrier_id and not math.isnan(by_barrier_id[barrier_id]):
+            tc_column[i] = by_barrier_id[barrier_id]
+            replaced += 1
+    table['Tc_hr'] = tc_column
+    loader.save_columns(arguments.watershed_table, [header['name'] for header in signature], table)
+    print "Replaced Tc_hr of " + str(replaced) + " of " + str(len(tc_column)) + " watersheds in " + arguments.watershed_table
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# Zonal statistics of watersheds
+# October 2026
+#
+# Works out the area-weighted curve number (CN) of every culvert's watershed from a land cover
+# grid (e.g. NLCD) and a hydrologic soil group grid (e.g. from gSSURGO), for the CN column of
+# the watershed table (see delineation.py), instead of one polygon at a time in ArcGIS.
+#
+# The CN of each cell is looked up in curve_numbers.csv (next to this script), by its land
+# cover class and soil group; the file can be edited or extended, or another one given. Cells
+# whose land cover or soil group isn't in the table (or have no data) don't count towards the
+# average. The soil group grid holds 1 to 4 for groups A to D; the dual groups A/D, B/D and
+# C/D (5 to 7) are taken as D, as if undrained.
+#
+# Both grids are ESRI .flt/.hdr grids with the same cell size as the DEM, lined up with it and
+# covering it (they may be bigger). They are memory-mapped and read a chunk of rows at a time,
+# and the sums for each watershed are added up with numpy.bincount, so memory stays bounded
+# however big the grids are. Each culvert's CN is over its whole watershed: its own cells
+# plus those of the culverts upstream of it.
+#
+# Usage:
+#   watersheds = delineation.delineate(dem, barrier_ids, x, y, 30.0)
+#   cn = zonal_stats.watershed_curve_numbers(watersheds, dem, 'nlcd.flt', 'soil_groups.flt')
+# or through delineation.py (see there): --land-cover nlcd.flt --soil-groups soil_groups.flt
+
+import os, sys
+import numpy
+import loader, delineation
+
+# Signature of the curve number table.
+curve_numbers_signature = [
+    {'name': 'Land_Cover', 'type': int},
+    {'name': 'A', 'type': float},
+    {'name': 'B', 'type': float},
+    {'name': 'C', 'type': float},
+    {'name': 'D', 'type': float}
+];
+
+# The curve number table used unless another is given, kept next to this script.
+default_curve_numbers_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'curve_numbers.csv')
+
+# The column of the table (0 to 3 for A to D) for each soil group code.
+soil_group_columns = [-1, 0, 1, 2, 3, 3, 3, 3]
+
+# About how many cells to read at a time.
+chunk_cells = 4 * 1024 * 1024
+
+# Load a curve number table (see curve_numbers.csv for the default one).
+# Returns a 2-D array of the CN of each land cover class (row) and soil group code (column),
+# nan for the combinations not in the table.
+def load_curve_numbers(filename = None):
+    if filename == None:
+        filename = default_curve_numbers_filename
+    table = loader.valid_columns(loader.load_columns(filename, curve_numbers_signature, 1, -1))
+    land_covers = table['Land_Cover']
+    if len(land_covers) > 0 and land_covers.min() < 0:
+        print "ERROR: curve number table '" + filename + "' has a negative land cover class. Bailing out."
+        sys.exit(0)
+    lookup = numpy.full((land_covers.max() + 1 if len(land_covers) > 0 else 0, len(soil_group_columns)), numpy.nan)
+    for code in range(1, len(soil_group_columns)):
+        lookup[land_covers, code] = table['ABCD'[soil_group_columns[code]]]
+    return lookup
+
+# Look up the CN of cells from their land cover class and soil group code (arrays of the same
+# shape, which may hold nan or codes not in the table). Returns an array of CNs, nan where unknown.
+def curve_numbers(lookup, land_cover, soil_groups):
+    with numpy.errstate(invalid = 'ignore'):
+        known = (land_cover >= 0) & (land_cover < lookup.shape[0]) & (soil_groups >= 0) & (soil_groups < lookup.shape[1])
+    cn = numpy.full(numpy.shape(land_cover), numpy.nan)
+    cn[known] = lookup[land_cover[known].astype(numpy.int64), soil_groups[known].astype(numpy.int64)]
+    return cn
+
+# Memory-map a grid that covers the DEM, lined up with it.
+# Returns the cells of the grid over the DEM (an array of the DEM's shape, not read yet)
+# and the grid's no data value (or None).
+def map_over_dem(filename, dem):
+    header = delineation.read_header(os.path.splitext(filename)[0] + '.hdr')
+    cellsize = dem['cellsize']
+    nrows, ncols = dem['elevation'].shape
+    column = (dem['xllcorner'] - header['xllcorner']) / cellsize
+    row = (header['yllcorner'] + header['nrows'] * header['cellsize'] - (dem['yllcorner'] + nrows * cellsize)) / cellsize
+    if abs(header['cellsize'] - cellsize) > cellsize * 1e-6 or abs(column - round(column)) > 1e-3 or abs(row - round(row)) > 1e-3:
+        print "ERROR: grid '" + filename + "' doesn't line up with the DEM (it needs the same cell size and cell edges). Bailing out."
+        sys.exit(0)
+    column = int(round(column))
+    row = int(round(row))
+    if column < 0 or row < 0 or column + ncols > header['ncols'] or row + nrows > header['nrows']:
+        print "ERROR: grid '" + filename + "' doesn't cover the whole DEM. Bailing out."
+        sys.exit(0)
+    cells = delineation.map_grid(filename, header)
+    return cells[row:row + nrows, column:column + ncols], header['nodata_value']
+
+# The sum of the CNs and the number of cells with a CN for each label, a chunk of rows at a time.
+# Parameters:
+#   labels: grid of the label of each cell (-1 for none), e.g. delineation.label_grid(watersheds).
+#   num_labels: the number of labels.
+#   land_cover, soil_groups: grids of the same shape (e.g. from map_over_dem).
+#   lookup: the curve number table, from load_curve_numbers.
+#   land_cover_nodata, soil_groups_nodata: the no data values of the grids. Optional.
+# Returns the arrays sums and counts.
+def curve_number_sums(labels, num_labels, land_cover, soil_groups, lookup, land_cover_nodata = None, soil_groups_nodata = None):
+    sums = numpy.zeros(num_labels)
+    counts = numpy.zeros(num_labels)
+    chunk = max(1, chunk_cells // max(1, labels.shape[1]))
+    for start in range(0, labels.shape[0], chunk):
+        chunk_labels = numpy.asarray(labels[start:start + chunk])
+        chunk_land_cover = numpy.asarray(land_cover[start:start + chunk], dtype = numpy.float64)
+        chunk_soil_groups = numpy.asarray(soil_groups[start:start + chunk], dtype = numpy.float64)
+        if land_cover_nodata != None:
+            chunk_land_cover[chunk_land_cover == land_cover_nodata] = numpy.nan
+        if soil_groups_nodata != None:
+            chunk_soil_groups[chunk_soil_groups == soil_groups_nodata] = numpy.nan
+        cn = curve_numbers(lookup, chunk_land_cover, chunk_soil_groups)
+        used = (chunk_labels >= 0) & ~numpy.isnan(cn)
+        sums += numpy.bincount(chunk_labels[used], weights = cn[used], minlength = num_labels)
+        counts += numpy.bincount(chunk_labels[used], minlength = num_labels)
+    return sums, counts
+
+# The area-weighted CN of the watershed of each culvert.
+# Parameters:
+#   watersheds: from delineation.delineate.
+#   dem: the DEM they were delineated from.
+#   land_cover_filename, soil_groups_filename: the .flt grids of land cover class and soil group.
+#   curve_numbers_filename: the curve number table. Optional; curve_numbers.csv by default.
+# Returns an array with the CN of each culvert, nan for culverts outside the DEM or whose
+# watershed has no cells with a known CN.
+def watershed_curve_numbers(watersheds, dem, land_cover_filename, soil_groups_filename, curve_numbers_filename = None):
+    lookup = load_curve_numbers(curve_numbers_filename)
+    land_cover, land_cover_nodata = map_over_dem(land_cover_filename, dem)
+    soil_groups, soil_groups_nodata = map_over_dem(soil_groups_filename, dem)
+    num_outlets = len(watersheds['outlets'])
+    sums, counts = curve_number_sums(delineation.label_grid(watersheds), num_outlets, land_cover, soil_groups,
+        lookup, land_cover_nodata, soil_groups_nodata)
+
+    # Add in the watersheds upstream.
+    sums = delineation.upstream_totals(sums, watersheds['downstream_outlet'])
+    counts = delineation.upstream_totals(counts, watersheds['downstream_outlet'])
+    outlet_cn = numpy.full(num_outlets, numpy.nan)
+    outlet_cn[counts > 0] = sums[counts > 0] / counts[counts > 0]
+
+    cn = numpy.full(len(watersheds['outlet']), numpy.nan)
+    inside = watersheds['outlet'] >= 0
+    cn[inside] = outlet_cn[watersheds['outlet'][inside]]
+    return cn